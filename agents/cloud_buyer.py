@@ -25,6 +25,11 @@ logger = logging.getLogger("cloud_buyer")
 # Add parent dir to path for lib import
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from lib.client import MarketClient
+from lib.llm_cache import LLMCache, is_json_response
+from lib.llm_gateway import LLMGateway
+from lib.policy import DecisionPolicy, buyer_thresholds
+from lib.scheduler import KeyedScheduler
+from lib.state_store import TerminalSet
 
 # Configuration
 PROJECT_ID = os.getenv("AGENT_MKT_PROJECT_ID")
@@ -55,6 +60,11 @@ CONSIDER_THRESHOLD = float(os.getenv("AGENT_MKT_BUYER_CONSIDER_THRESHOLD") or 14
 # Initialize Vertex AI
 vertexai.init(project=PROJECT_ID, location=REGION)
 model = GenerativeModel(MODEL_NAME)
+# Deadlines, bounded concurrency, retries and a circuit breaker; identical prompts
+# (same item, price and thresholds) reuse the earlier decision from the cache
+llm = LLMGateway(model, MODEL_NAME, cache=LLMCache())
+# Clear-cut prices are settled locally; only the middle band goes to the LLM
+fast_path = DecisionPolicy([buyer_thresholds(ACCEPT_THRESHOLD, BUDGET_CAP)])
 
 class InternalBuyer:
     def __init__(self):
@@ -66,7 +76,9 @@ class InternalBuyer:
         self.client.update_status("IDLE", "Apex Procurement ready")
         self.target_items = TARGET_ITEMS
         self.executor = ThreadPoolExecutor(max_workers=int(os.getenv("AGENT_MKT_MAX_WORKERS", "3")))
-        self.negotiation_state = {} # Maps negotiation_id -> status (ACTIVE, COMPLETED, FAILED)
+        # One evaluation per negotiation at a time; a newer proposal replaces a queued one
+        self.scheduler = KeyedScheduler(self.executor)
+        self.finished_negotiations = TerminalSet() # Concluded or terminated ids, kept for a day to drop stragglers
 
     def run(self):
         # Skip registration if using static keys for speed, or ensure it exists
@@ -85,7 +97,7 @@ class InternalBuyer:
                 # --- NEW: Negotiation Termination Handling ---
                 if event_type == "negotiation_concluded":
                    logger.info(f"🎉 Negotiation CONCLUDED! Product: {event.get('product')}, Price: ${event.get('price')}")
-                   self.negotiation_state[event.get("negotiation_id")] = "COMPLETED"
+                   self._finish(event.get("negotiation_id"))
                    self.client.update_status("IDLE", "Deal successful")
                    
                    if os.getenv("AGENT_MKT_CONTINUOUS", "true").lower() == "false":
@@ -95,7 +107,7 @@ class InternalBuyer:
 
                 if event_type == "negotiation_terminated":
                    logger.info(f"🛑 Negotiation TERMINATED. Reason: {event.get('reason')}")
-                   self.negotiation_state[event.get("negotiation_id")] = "FAILED"
+                   self._finish(event.get("negotiation_id"))
                    self.client.update_status("IDLE", "Negotiation failed")
                    
                    if os.getenv("AGENT_MKT_CONTINUOUS", "true").lower() == "false":
@@ -122,12 +134,11 @@ class InternalBuyer:
                     elif data.get("type") == "Proposal" and data.get("receiver_id") == self.client.agent_id:
                         neg_id = data.get("negotiation_id")
                         # STALE CHECK: If this negotiation is already dead locally, ignore it.
-                        if self.negotiation_state.get(neg_id) in ["COMPLETED", "FAILED"]:
+                        if neg_id in self.finished_negotiations:
                             logger.info(f"🗑️ [Loop Guard] Dropping stale proposal for terminated negotiation {neg_id}")
                             continue
 
                         logger.info(f"🎯 [Buyer] Proposal found! Evaluating counters.")
-                        self.negotiation_state[neg_id] = "ACTIVE"
                         self.evaluate_proposal(data)
 
             # 2. Periodically post new purchase requests (Configurable Interval)
@@ -149,11 +160,16 @@ class InternalBuyer:
                     # We continue the loop to handle events, but we reset last_request_time to infinity
                     last_request_time = float('inf') 
 
+    def _finish(self, neg_id):
+        if neg_id:
+            self.finished_negotiations.add(neg_id)
+
     def evaluate_offer(self, offer: dict):
         """Evaluates an offer using the Chris Voss AI strategy."""
         logger.info(f"🧠 Buyer evaluating offer {offer.get('offer_id')} at ${offer.get('price')}")
         self.client.update_status("EVALUATING", f"Analyzing offer for {offer.get('product')}")
-        self.executor.submit(self._consult_strategy_model, offer, False)
+        neg_id = offer.get("negotiation_id") or "neg-" + offer.get("offer_id", "x")[-8:]
+        self.scheduler.submit(neg_id, self._consult_strategy_model, offer, False)
 
     def evaluate_proposal(self, proposal: dict):
         """Evaluates a counter-proposal using the Chris Voss AI strategy."""
@@ -166,7 +182,7 @@ class InternalBuyer:
         
         # Check if we are stuck in a loop (basic check based on random probability for now, or just trust the LLM)
         # Ideally we track history. For now, let's rely on the LLM but give it a hint about "impatience"
-        self.executor.submit(self._consult_strategy_model, proposal, True)
+        self.scheduler.submit(proposal.get("negotiation_id"), self._consult_strategy_model, proposal, True)
 
     def _consult_strategy_model(self, data: dict, is_counter: bool):
         """Consults the LLM for the next move."""
@@ -211,19 +227,21 @@ class InternalBuyer:
         """
         
         try:
-            response = model.generate_content(system_prompt)
-            logger.debug(f"🤖 RAW AI RESP: {response.text}")
-            
-            # Clean generic markdown code blocks if present
-            clean_text = response.text.replace("```json", "").replace("```", "").strip()
-            decision = json.loads(clean_text)
+            decision = fast_path.decide(price=price)
+            if decision is None:
+                response_text = llm.generate(system_prompt, validate=is_json_response)
+                logger.debug(f"🤖 RAW AI RESP: {response_text}")
+                
+                # Clean generic markdown code blocks if present
+                clean_text = response_text.replace("```json", "").replace("```", "").strip()
+                decision = json.loads(clean_text)
             
             # Execute the decision
             neg_id = data.get("negotiation_id") or "neg-" + data.get("offer_id", "x")[-8:]
             offer_id = data.get("offer_id", "unknown_offer")
             
             # LATE ARRIVAL GUARD: Check if the deal was terminated while we were thinking
-            if self.negotiation_state.get(neg_id) in ["COMPLETED", "FAILED"]:
+            if neg_id in self.finished_negotiations:
                 logger.info(f"🗑️ [Loop Guard] Negotiation {neg_id} terminated while thinking. Dropping decision.")
                 return
 
@@ -29,6 +29,11 @@ logger = logging.getLogger("cloud_seller")
 # Add parent dir to path for lib import
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from lib.client import MarketClient
+from lib.llm_cache import LLMCache, is_json_response
+from lib.llm_gateway import LLMGateway
+from lib.policy import DecisionPolicy, seller_floor
+from lib.scheduler import KeyedScheduler
+from lib.state_store import BoundedStateStore, TerminalSet
 
 # Configuration
 PROJECT_ID = os.getenv("AGENT_MKT_PROJECT_ID")
@@ -59,6 +64,11 @@ DEFAULT_FLOOR_PRICE = float(os.getenv("AGENT_MKT_SELLER_FLOOR_PRICE", "100.0"))
 # Initialize Vertex AI
 vertexai.init(project=PROJECT_ID, location=REGION)
 model = GenerativeModel(MODEL_NAME)
+# Deadlines, bounded concurrency, retries and a circuit breaker; identical prompts
+# (same item, price and thresholds) reuse the earlier decision from the cache
+llm = LLMGateway(model, MODEL_NAME, cache=LLMCache())
+# Counters at/above the floor (or far below it) are settled locally; the LLM handles the rest
+fast_path = DecisionPolicy([seller_floor()])
 
 class InternalSeller:
     def __init__(self):
@@ -76,8 +86,11 @@ class InternalSeller:
         # Identify for WebSockets
         self.client.update_status("IDLE", "Nova Systems ready")
         self.inventory = INVENTORY
-        self.active_negotiations = {} # Maps negotiation_id -> inventory_key
+        self.active_negotiations = BoundedStateStore() # Maps negotiation_id -> inventory_key, expires when idle
+        self.terminated_negotiations = TerminalSet() # Concluded or terminated ids, kept for a day to drop stragglers
         self.executor = ThreadPoolExecutor(max_workers=int(os.getenv("AGENT_MKT_MAX_WORKERS", "3")))
+        # One evaluation per negotiation at a time; a newer proposal replaces a queued one
+        self.scheduler = KeyedScheduler(self.executor)
 
     def run(self):
         # Skip registration if using static keys for speed, or ensure it exists
@@ -106,16 +119,8 @@ class InternalSeller:
                 # --- NEW: Negotiation Termination Handling ---
                 if event_type == "negotiation_concluded":
                     logger.info(f"🎉 Negotiation CONCLUDED! Sold {event.get('product')} for ${event.get('price')}")
-                    # Mark as dead but keep in cache briefly to reject stragglers? 
-                    # Actually better to just remove from active_negotiations which implies "no inventory lock", 
-                    # but we need a "Dead" set to know to ignore it.
-                    neg_id = event.get("negotiation_id")
-                    if neg_id:
-                        # Use a sentinel value in active_negotiations to mean "DEAD" instead of deleting?
-                        # Or just delete. If deleted, evaluate_proposal falls back to heuristic.
-                        # We need explicit ignore. active_negotiations was mapping to inventory key.
-                        # Let's use a separate set for TERMINATED IDs.
-                        self.active_negotiations[neg_id] = "TERMINATED" 
+                    # Release the inventory mapping and remember the id to reject stragglers
+                    self._terminate(event.get("negotiation_id"))
                         
                     self.client.update_status("IDLE", "Deal successful")
                     
@@ -126,9 +131,7 @@ class InternalSeller:
 
                 if event_type == "negotiation_terminated":
                     logger.info(f"🛑 Negotiation TERMINATED. Reason: {event.get('reason')}")
-                    neg_id = event.get("negotiation_id")
-                    if neg_id:
-                        self.active_negotiations[neg_id] = "TERMINATED"
+                    self._terminate(event.get("negotiation_id"))
                         
                     self.client.update_status("IDLE", "Negotiation failed")
                     
@@ -155,12 +158,31 @@ class InternalSeller:
                     # 2. Look for Proposals targeting me
                     elif data.get("type") == "Proposal" and data.get("receiver_id") == self.client.agent_id:
                         neg_id = data.get("negotiation_id")
-                        if self.active_negotiations.get(neg_id) == "TERMINATED":
+                        if neg_id in self.terminated_negotiations:
                              logger.info(f"🗑️ [Loop Guard] Dropping stale proposal for terminated negotiation {neg_id}")
                              continue
                              
                         self.evaluate_proposal(data)
 
+    def _terminate(self, neg_id):
+        if neg_id:
+            self.active_negotiations.pop(neg_id)
+            self.terminated_negotiations.add(neg_id)
+
+    @staticmethod
+    def _negotiation_id(data: dict) -> str:
+        """Negotiation a proposal belongs to, or the one a buyer request opens.
+
+        Requests carry their market_items doc id; older payloads without one
+        fall back to buyer, item and timestamp so distinct requests never
+        share a scheduler key.
+        """
+        if data.get("negotiation_id"):
+            return data["negotiation_id"]
+        if data.get("id"):
+            return "neg-" + data["id"][-8:]
+        return f"neg-{data.get('buyer_id') or data.get('sender_id')}:{data.get('item')}:{data.get('timestamp')}"
+
     def process_request(self, request: dict):
         """Initial reaction to a buyer request using Challenger strategy."""
         item = request.get("item", "").lower()
@@ -174,7 +196,7 @@ class InternalSeller:
             
         if match:
             # Consult AI for the first offer too, to set a high anchor with Challenger reasoning
-            self.executor.submit(self._consult_strategy_model, request, match, True)
+            self.scheduler.submit(self._negotiation_id(request), self._consult_strategy_model, request, match, True)
 
     def evaluate_proposal(self, proposal: dict):
         """Evaluates a counter-proposal from the buyer."""
@@ -203,7 +225,7 @@ class InternalSeller:
         
         logger.info(f"🤔 Buyer countered with {price}. Consulting Challenger strategy...")
         self.client.update_status("NEGOTIATING", f"Evaluating counter for {proposal.get('product')}")
-        self.executor.submit(self._consult_strategy_model, proposal, match, False)
+        self.scheduler.submit(neg_id, self._consult_strategy_model, proposal, match, False)
 
     def _consult_strategy_model(self, data: dict, inventory_match: dict, is_initial: bool):
         """Consults the LLM for the Challenger move."""
@@ -242,14 +264,16 @@ class InternalSeller:
         """
         
         try:
-            response = model.generate_content(system_prompt)
-            # Clean generic markdown code blocks
-            clean_text = response.text.replace("```json", "").replace("```", "").strip()
-            decision = json.loads(clean_text)
+            decision = fast_path.decide(price=data.get("price"), floor=floor_price, is_initial=is_initial)
+            if decision is None:
+                response_text = llm.generate(system_prompt, validate=is_json_response)
+                # Clean generic markdown code blocks
+                clean_text = response_text.replace("```json", "").replace("```", "").strip()
+                decision = json.loads(clean_text)
             
             logger.info(f"💡 [Challenger Thought] {decision['internal_thought']}")
             
-            neg_id = data.get("negotiation_id") or "neg-" + data.get("id", "x")[-8:]
+            neg_id = self._negotiation_id(data)
             offer_id = data.get("offer_id") or data.get("id")
             
             # Determine the counterpart ID strictly based on sender_id
@@ -259,6 +283,11 @@ class InternalSeller:
                 logger.warning(f"⚠️ Warning: Could not determine buyer ID from data: {data}")
                 return # Cannot proceed safely
 
+            # LATE ARRIVAL GUARD: Check if the deal was terminated while we were thinking
+            if neg_id in self.terminated_negotiations:
+                 logger.info(f"🗑️ [Loop Guard] Negotiation {neg_id} terminated while thinking. Dropping decision.")
+                 return
+
             # Ensure this negotiation is cached if we have an inventory match
             if inventory_match:
                 for k, v in self.inventory.items():
@@ -266,11 +295,6 @@ class InternalSeller:
                         self.active_negotiations[neg_id] = k
                         break
 
-            # LATE ARRIVAL GUARD: Check if the deal was terminated while we were thinking
-            if self.active_negotiations.get(neg_id) == "TERMINATED":
-                 logger.info(f"🗑️ [Loop Guard] Negotiation {neg_id} terminated while thinking. Dropping decision.")
-                 return
-
             if decision["action"] == "ACCEPT":
                 logger.info(f"✅ AI Decided to ACCEPT at ${data.get('price')} (x{quantity})")
                 self.client.negotiate(neg_id, offer_id, "ACCEPT", buyer_id, data.get('price'), quantity=quantity, reasoning=decision["reasoning"])
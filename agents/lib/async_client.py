@@ -0,0 +1,427 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Optional
+from urllib.parse import urlparse
+
+import aiohttp
+
+from .client import (DEFAULT_CATEGORY, HTTP_POOL_SIZE, HTTP_TIMEOUT, HTTP_RETRIES, HTTP_RETRY_BASE,
+                     RETRYABLE_STATUS, WS_RESUME, WS_PING_INTERVAL, HEARTBEAT_INTERVAL)
+from .llm_gateway import Histogram, LATENCY_BUCKETS
+
+logger = logging.getLogger("AsyncMarketClient")
+
+
+class AsyncMarketClient:
+    """asyncio counterpart of MarketClient for hosting many agents on one event loop.
+
+    Same surface (`register`, `post_offer`, `post_request`, `negotiate`,
+    `update_status`, `subscribe`, `get_event`) as coroutines, plus `events()`
+    as an async iterator. The heartbeat and WebSocket listener are tasks on
+    the running loop instead of threads, and HTTP goes through one
+    aiohttp session per client. Call `close()` when the agent stops.
+    """
+
+    def __init__(self, agent_type, name, category, api_url=None, subscribe=None):
+        self.agent_type = agent_type
+        self.name = name
+        self.category = category
+        self.api_url = api_url or os.getenv("AGENT_MKT_API_URL", "http://localhost:8005")
+        self.agent_id = None
+        self.api_key = None
+        self.event_queue: asyncio.Queue = asyncio.Queue()
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.current_status = "ACTIVE"
+        self.current_activity = "Monitoring Market"
+        self._sent_status = None  # Last (status, activity) the server acknowledged
+        self.ws_identified = False
+        if subscribe is None:
+            subscribe = os.getenv("AGENT_MKT_WS_SUBSCRIBE", "true").lower() == "true"
+        self.use_subscriptions = subscribe
+        self.subscriptions = {}
+        # Position in the server's event stream, for delta resync after a reconnect
+        self.stream_epoch = None
+        self.last_seq = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.http_latency = {}  # endpoint -> Histogram
+        self.http_errors = {}  # endpoint -> count
+        self._tasks = []
+        self._side_tasks = set()  # Status restates and state syncs spawned by the listener (strong refs until done)
+        self._load_identity()
+
+    def _identity_file(self):
+        return f"identity_{self.name.replace(' ', '_')}.json"
+
+    def _load_identity(self):
+        try:
+            if os.path.exists(self._identity_file()):
+                with open(self._identity_file(), 'r') as f:
+                    data = json.load(f)
+                    self.agent_id = data.get("agent_id")
+                    self.api_key = data.get("api_key")
+                    logger.info(f"💾 Loaded identity for {self.name}: {self.agent_id}")
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to load identity: {e}")
+
+    def _save_identity(self):
+        try:
+            with open(self._identity_file(), 'w') as f:
+                json.dump({"agent_id": self.agent_id, "api_key": self.api_key}, f)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to save identity: {e}")
+
+    def _session(self) -> aiohttp.ClientSession:
+        # Created lazily so the session binds to the loop the agent actually runs on
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE),
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+            )
+        return self.session
+
+    async def _request(self, method, endpoint, idempotent=False, **kwargs):
+        """Sends a request over the pooled session; same retry rules as MarketClient._request.
+
+        Returns (status, parsed JSON body or None).
+        """
+        attempts = 1 + (HTTP_RETRIES if idempotent else 0)
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            try:
+                async with self._session().request(method, f"{self.api_url}{endpoint}", **kwargs) as res:
+                    status = res.status
+                    try:
+                        body = await res.json(content_type=None)
+                    except ValueError:
+                        body = None
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                self._record_http(endpoint, started, failed=True)
+                if attempt == attempts - 1:
+                    raise
+            else:
+                failed = status in RETRYABLE_STATUS
+                self._record_http(endpoint, started, failed=failed)
+                if not failed or attempt == attempts - 1:
+                    return status, body
+            await asyncio.sleep(HTTP_RETRY_BASE * (2 ** attempt))
+
+    def _record_http(self, endpoint, started, failed):
+        histogram = self.http_latency.get(endpoint)
+        if histogram is None:
+            histogram = self.http_latency[endpoint] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(time.perf_counter() - started)
+        if failed:
+            self.http_errors[endpoint] = self.http_errors.get(endpoint, 0) + 1
+
+    def http_stats(self):
+        """Per-endpoint request latency (seconds) and error counts."""
+        return {
+            endpoint: {**histogram.snapshot(), "errors": self.http_errors.get(endpoint, 0)}
+            for endpoint, histogram in self.http_latency.items()
+        }
+
+    async def _heartbeat(self):
+        logger.info(f"💓 Starting heartbeat for {self.name}")
+        consecutive_failures = 0
+        max_failures = int(os.getenv("AGENT_MKT_MAX_HEARTBEAT_FAILURES", "5"))
+        while True:
+            if self.ws_identified:
+                # Presence comes from the identified socket (kept alive by ping/pong)
+                consecutive_failures = 0
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                continue
+            try:
+                # No live socket: fall back to an HTTP keep-alive so we still show as online
+                status, _ = await self._request(
+                    "POST", "/agents/status", idempotent=True,
+                    json={"status": self.current_status, "activity": self.current_activity},
+                    headers={"x-api-key": self.api_key}
+                )
+                if status == 200:
+                    consecutive_failures = 0
+                    self._sent_status = (self.current_status, self.current_activity)
+                else:
+                    consecutive_failures += 1
+                    logger.warning(f"⚠️ Heartbeat failed ({status}). Failure {consecutive_failures}/{max_failures}")
+            except Exception as e:
+                consecutive_failures += 1
+                logger.warning(f"⚠️ Heartbeat connection error: {e}. Failure {consecutive_failures}/{max_failures}")
+
+            if consecutive_failures >= max_failures:
+                # Other agents share this process, so stop this one instead of exiting
+                logger.error(f"❌ CRTICAL: {self.name} disconnected from API. Stopping agent.")
+                await self.close()
+                return
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._side_tasks.add(task)
+        task.add_done_callback(self._side_task_done)
+
+    def _side_task_done(self, task):
+        self._side_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"⚠️ {self.name} background task failed: {task.exception()!r}")
+
+    def _start_background(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._heartbeat(), name=f"heartbeat-{self.name}"),
+                asyncio.create_task(self._listen(), name=f"listener-{self.name}"),
+            ]
+
+    async def register(self, registration_token=None):
+        """Registers the agent and gets an API key (with persistence)."""
+        if self.agent_id and self.api_key:
+            self._start_background()
+            return {"agent_id": self.agent_id, "api_key": self.api_key}
+
+        logger.info(f"📝 Registering internal agent: {self.name} ({self.agent_type})...")
+        max_retries = int(os.getenv("AGENT_MKT_MAX_RETRIES", "30"))
+        payload = {
+            "type": self.agent_type,
+            "name": self.name,
+            "category": self.category,
+            "registration_token": registration_token
+        }
+        for _ in range(max_retries):
+            try:
+                status, data = await self._request("POST", "/agents/register", json=payload)
+                if status == 200:
+                    self.agent_id = data["agent_id"]
+                    self.api_key = data["api_key"]
+                    self._save_identity()
+                    self._start_background()
+                    logger.info(f"✅ Registered {self.name} as {self.agent_id}")
+                    return data
+                logger.warning(f"⚠️ Registration failed ({status}): {data}")
+            except Exception as e:
+                logger.warning(f"⚠️ Registration connection failed: {e}")
+            await asyncio.sleep(int(os.getenv("AGENT_MKT_RETRY_SLEEP", "2")))
+
+        raise RuntimeError(f"Max retries reached for registration of {self.name}")
+
+    def _ws_url(self):
+        parsed_url = urlparse(self.api_url)
+        ws_scheme = "wss" if parsed_url.scheme == "https" else "ws"
+        path = parsed_url.path.rstrip("/")
+        return parsed_url._replace(scheme=ws_scheme, path=f"{path}/ws/market").geturl()
+
+    def _handle_message(self, data):
+        """Same filtering as MarketClient's on_message; returns the event to queue or None."""
+        if data.get("seq") is not None:
+            self.last_seq = data["seq"] if self.last_seq is None else max(self.last_seq, data["seq"])
+
+        if data.get("type") == "subscribed":
+            logger.debug(f"📮 {self.name} subscriptions active: {data.get('topics')}")
+            return None
+
+        if data.get("type") == "identified":
+            self.ws_identified = True
+            # Restate our status for the server's presence entry
+            self._sent_status = None
+            self._spawn(self.update_status(self.current_status, self.current_activity))
+            if data.get("epoch") != self.stream_epoch:
+                self.stream_epoch = data.get("epoch")
+                self.last_seq = data.get("seq")
+            return None
+
+        if data.get("type") == "resumed":
+            logger.info(f"⏩ {self.name} resumed stream, {data.get('replayed')} missed events replayed")
+            return None
+
+        if data.get("type") == "resync_required":
+            logger.info(f"🔄 {self.name} missed too much to replay, resyncing from snapshot")
+            self.stream_epoch = data.get("epoch")
+            self.last_seq = max(self.last_seq or 0, data.get("seq") or 0)
+            self._spawn(self._fetch_active_state())
+            return None
+
+        if data.get("type") == "feedback_report":
+            if self.agent_id in data.get("involved_agents", []):
+                feedback = data.get("feedback", {})
+                role = "buyer" if self.agent_type == "buyer" else "seller"
+                logger.info(f"\n📬 [COACH] Strategy Score: {feedback.get('strategy_score', '?')}/10")
+                logger.info(f"📬 [COACH] Critique: {feedback.get(f'{role}_feedback', 'No specific feedback.')}\n")
+
+        if data.get("type") == "market_event":
+            item_data = data.get("data", {})
+            # Platform-Level Loop Prevention: ACCEPT/REJECT proposals end a negotiation
+            if item_data.get("type") == "Proposal" and item_data.get("action") in ["ACCEPT", "REJECT"]:
+                return None
+        return data
+
+    async def _fetch_active_state(self):
+        try:
+            logger.info("🔄 (Re)Fetching active market requests...")
+            for category in dict.fromkeys([self.category, DEFAULT_CATEGORY]):
+                status, body = await self._request("GET", "/market/active", idempotent=True, params={"category": category})
+                if status == 200:
+                    items = (body or {}).get("items", [])
+                    logger.info(f"📥 Found {len(items)} active market items in '{category}'.")
+                    for item in items:
+                        self.event_queue.put_nowait({"type": "market_event", "data": item})
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to sync active market items: {e}")
+
+    async def _listen(self):
+        ws_url = self._ws_url()
+        while True:
+            try:
+                async with self._session().ws_connect(ws_url, timeout=HTTP_TIMEOUT, heartbeat=WS_PING_INTERVAL) as ws:
+                    self.ws = ws
+                    logger.info(f"🔌 {self.name} WebSocket connection OPEN")
+                    if self.agent_id:
+                        await ws.send_str(json.dumps({"type": "identify", "agent_id": self.agent_id, "api_key": self.api_key}))
+                    subscription = self._subscription_message()
+                    if subscription:
+                        await ws.send_str(subscription)
+                    if WS_RESUME and self.stream_epoch and self.last_seq is not None:
+                        # Reconnect: replay only what we missed (or get resync_required)
+                        await ws.send_str(json.dumps({"type": "resume", "epoch": self.stream_epoch, "last_seq": self.last_seq}))
+                    else:
+                        # Sync on first connect without holding up the receive loop
+                        self._spawn(self._fetch_active_state())
+
+                    async for message in ws:
+                        if message.type != aiohttp.WSMsgType.TEXT:
+                            break
+                        try:
+                            event = self._handle_message(json.loads(message.data))
+                            if event is not None:
+                                self.event_queue.put_nowait(event)
+                        except Exception as e:
+                            logger.error(f"❌ Error processing WS message: {e}")
+                logger.info(f"🔌 {self.name} WebSocket CLOSED")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"⚠️ {self.name} WebSocket Exception: {e}")
+            finally:
+                self.ws = None
+                self.ws_identified = False
+
+            logger.info(f"🔄 {self.name} WebSocket Retrying in 5s...")
+            await asyncio.sleep(int(os.getenv("AGENT_MKT_RETRY_SLEEP", "5")))
+
+    def _subscription_message(self):
+        """Builds the subscribe frame sent on every (re)connect, or None for the full firehose."""
+        if not self.use_subscriptions:
+            return None
+        topics = dict(self.subscriptions)
+        if not topics:
+            topics = {"categories": list(dict.fromkeys([self.category, DEFAULT_CATEGORY]))}
+        if self.agent_id:
+            topics["agents"] = sorted(set(topics.get("agents", [])) | {self.agent_id})
+        return json.dumps({"type": "subscribe", **topics})
+
+    async def subscribe(self, categories=None, products=None, event_types=None, negotiation_ids=None, agents=None):
+        """Replaces the default subscription with explicit topics (kept across reconnects)."""
+        requested = {
+            "categories": categories,
+            "products": products,
+            "event_types": event_types,
+            "negotiation_ids": negotiation_ids,
+            "agents": agents
+        }
+        for field, values in requested.items():
+            if values:
+                self.subscriptions[field] = sorted(set(self.subscriptions.get(field, [])) | set(values))
+        self.use_subscriptions = True
+        try:
+            if self.ws is not None and not self.ws.closed:
+                await self.ws.send_str(self._subscription_message())
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to send subscription: {e}")
+
+    async def get_event(self, timeout=float(os.getenv("AGENT_MKT_POLL_TIMEOUT", "1.0"))):
+        try:
+            return await asyncio.wait_for(self.event_queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def events(self):
+        """Yields market events as they arrive."""
+        while True:
+            yield await self.event_queue.get()
+
+    async def post_offer(self, product, price, quantity=1, buyer_id="market"):
+        try:
+            payload = {
+                "buyer_id": buyer_id,
+                "product": product,
+                "price": price,
+                "quantity": quantity,
+                "category": self.category,
+                "currency": os.getenv("AGENT_MKT_CURRENCY", "USDC")
+            }
+            _, body = await self._request("POST", "/market/offers", json=payload, headers={"x-api-key": self.api_key})
+            return body
+        except Exception as e:
+            logger.error(f"❌ Failed to post offer: {e}")
+            return None
+
+    async def post_request(self, item, max_budget, quantity=1):
+        try:
+            payload = {
+                "item": item,
+                "max_budget": max_budget,
+                "quantity": quantity,
+                "category": self.category
+            }
+            _, body = await self._request("POST", "/market/requests", json=payload, headers={"x-api-key": self.api_key})
+            return body
+        except Exception as e:
+            logger.error(f"❌ Failed to post request: {e}")
+            return None
+
+    async def update_status(self, status, activity):
+        """Updates the agent's status and activity; unchanged values aren't resent."""
+        self.current_status = status
+        self.current_activity = activity
+        if self._sent_status == (status, activity):
+            return
+        try:
+            code, _ = await self._request(
+                "POST", "/agents/status", idempotent=True,
+                json={"status": status, "activity": activity},
+                headers={"x-api-key": self.api_key}
+            )
+            if code == 200:
+                self._sent_status = (status, activity)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to update status: {e}")
+
+    async def negotiate(self, negotiation_id, action, offer_id, receiver_id, price=None, quantity=1, reasoning=""):
+        try:
+            payload = {
+                "negotiation_id": negotiation_id,
+                "action": action,
+                "offer_id": offer_id,
+                "receiver_id": receiver_id,
+                "sender_id": self.agent_id,
+                "price": price,
+                "quantity": quantity,
+                "reasoning": reasoning
+            }
+            _, body = await self._request("POST", "/market/negotiate", json=payload, headers={"x-api-key": self.api_key})
+            return body
+        except Exception as e:
+            logger.error(f"❌ Failed to negotiate: {e}")
+            return None
+
+    async def close(self):
+        current = asyncio.current_task()
+        stopping = [task for task in self._tasks + list(self._side_tasks) if task is not current]
+        for task in stopping:
+            task.cancel()
+        await asyncio.gather(*stopping, return_exceptions=True)
+        self._tasks = []
+        if self.ws is not None:
+            await self.ws.close()
+        if self.session is not None:
+            await self.session.close()
@@ -6,9 +6,13 @@ import requests
 import logging
 import threading
 import queue
+import uuid
 import websocket
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse
 
+from .llm_gateway import Histogram, LATENCY_BUCKETS
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -17,9 +21,19 @@ logging.basicConfig(
 logger = logging.getLogger("MarketClient")
 
 DEFAULT_CATEGORY = os.getenv("AGENT_MKT_DEFAULT_CATEGORY", "general")
+HTTP_POOL_SIZE = int(os.getenv("AGENT_MKT_HTTP_POOL_SIZE", "10"))
+HTTP_TIMEOUT = float(os.getenv("AGENT_MKT_HTTP_TIMEOUT", "5"))
+HTTP_RETRIES = int(os.getenv("AGENT_MKT_HTTP_RETRIES", "2"))
+HTTP_RETRY_BASE = float(os.getenv("AGENT_MKT_HTTP_RETRY_BASE", "0.2"))
+RETRYABLE_STATUS = {502, 503, 504}
+WS_COMMAND_TIMEOUT = float(os.getenv("AGENT_MKT_WS_COMMAND_TIMEOUT", "10"))
+WS_RESUME = os.getenv("AGENT_MKT_WS_RESUME", "true").lower() == "true"
+WS_PING_INTERVAL = float(os.getenv("AGENT_MKT_WS_PING_INTERVAL", "20"))
+WS_PING_TIMEOUT = float(os.getenv("AGENT_MKT_WS_PING_TIMEOUT", "10"))
+HEARTBEAT_INTERVAL = float(os.getenv("AGENT_MKT_HEARTBEAT_INTERVAL", "30"))
 
 class MarketClient:
-    def __init__(self, agent_type, name, category, api_url=None):
+    def __init__(self, agent_type, name, category, api_url=None, subscribe=None, ws_commands=None):
         self.agent_type = agent_type
         self.name = name
         self.category = category
@@ -31,6 +45,27 @@ class MarketClient:
         self.listener_thread = None
         self.current_status = "ACTIVE"
         self.current_activity = "Monitoring Market"
+        self._sent_status = None  # Last (status, activity) the server acknowledged
+        # Server-side topic filtering: only receive our categories and events addressed to us
+        if subscribe is None:
+            subscribe = os.getenv("AGENT_MKT_WS_SUBSCRIBE", "true").lower() == "true"
+        self.use_subscriptions = subscribe
+        self.subscriptions = {}
+        # Send actions as commands over the identified WebSocket instead of HTTP POSTs
+        if ws_commands is None:
+            ws_commands = os.getenv("AGENT_MKT_WS_COMMANDS", "false").lower() == "true"
+        self.use_ws_commands = ws_commands
+        self.ws_identified = False
+        # Position in the server's event stream, for delta resync after a reconnect
+        self.stream_epoch = None
+        self.last_seq = None
+        self._pending_commands = {}  # correlation id -> [threading.Event, reply]
+        self._pending_lock = threading.Lock()
+        # One keep-alive connection pool shared by the heartbeat, listener and decision threads
+        self.session = self._build_session()
+        self.http_latency = {}  # endpoint -> Histogram
+        self.http_errors = {}  # endpoint -> count
+        self._http_lock = threading.Lock()
         
         # Load identity if exists
 
@@ -56,6 +91,100 @@ class MarketClient:
         except Exception as e:
             logger.warning(f"⚠️ Failed to save identity: {e}")
 
+    @staticmethod
+    def _build_session():
+        session = requests.Session()
+        # Retries are handled in _request so only idempotent calls are repeated
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({"Connection": "keep-alive"})
+        return session
+
+    def _request(self, method, endpoint, idempotent=False, timeout=HTTP_TIMEOUT, **kwargs):
+        """Sends a request over the pooled session, recording latency per endpoint.
+
+        Idempotent calls are retried with backoff on connection errors, timeouts
+        and 502/503/504; everything else is sent once so a slow POST can't
+        create a duplicate offer or negotiation step.
+        """
+        attempts = 1 + (HTTP_RETRIES if idempotent else 0)
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            try:
+                res = self.session.request(method, f"{self.api_url}{endpoint}", timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record_http(endpoint, started, failed=True)
+                if attempt == attempts - 1:
+                    raise
+            else:
+                failed = res.status_code in RETRYABLE_STATUS
+                self._record_http(endpoint, started, failed=failed)
+                if not failed or attempt == attempts - 1:
+                    return res
+            time.sleep(HTTP_RETRY_BASE * (2 ** attempt))
+
+    def _record_http(self, endpoint, started, failed):
+        with self._http_lock:
+            histogram = self.http_latency.get(endpoint)
+            if histogram is None:
+                histogram = self.http_latency[endpoint] = Histogram(LATENCY_BUCKETS)
+            if failed:
+                self.http_errors[endpoint] = self.http_errors.get(endpoint, 0) + 1
+        histogram.observe(time.perf_counter() - started)
+
+    def http_stats(self):
+        """Per-endpoint request latency (seconds) and error counts."""
+        with self._http_lock:
+            endpoints = dict(self.http_latency)
+            errors = dict(self.http_errors)
+        return {
+            endpoint: {**histogram.snapshot(), "errors": errors.get(endpoint, 0)}
+            for endpoint, histogram in endpoints.items()
+        }
+
+    def _command(self, command, payload, timeout=WS_COMMAND_TIMEOUT):
+        """Sends a command over the WebSocket and waits for its command_result.
+
+        Returns (True, body) with the body the REST route would have returned,
+        or (False, None) if the socket isn't identified so the caller can fall
+        back to HTTP. A command that was sent but not answered in time is not
+        resent, since the server may already have applied it.
+        """
+        if not (self.use_ws_commands and self.ws_identified and self.ws and self.ws.sock and self.ws.sock.connected):
+            return False, None
+        command_id = uuid.uuid4().hex
+        slot = [threading.Event(), None]
+        with self._pending_lock:
+            self._pending_commands[command_id] = slot
+        started = time.perf_counter()
+        try:
+            try:
+                self.ws.send(json.dumps({"type": "command", "id": command_id, "command": command, "payload": payload}))
+            except Exception as e:
+                logger.warning(f"⚠️ WebSocket command send failed, using HTTP: {e}")
+                return False, None
+            if not slot[0].wait(timeout):
+                self._record_http(f"ws:{command}", started, failed=True)
+                logger.error(f"❌ No reply to {command} within {timeout:g}s")
+                return True, None
+        finally:
+            with self._pending_lock:
+                self._pending_commands.pop(command_id, None)
+        reply = slot[1]
+        self._record_http(f"ws:{command}", started, failed=not reply.get("ok"))
+        if reply.get("ok"):
+            return True, reply.get("result")
+        logger.warning(f"⚠️ {command} rejected ({reply.get('status')}): {reply.get('detail')}")
+        return True, {"detail": reply.get("detail")}
+
+    def _resolve_command(self, reply):
+        with self._pending_lock:
+            slot = self._pending_commands.get(reply.get("id"))
+        if slot is not None:
+            slot[1] = reply
+            slot[0].set()
+
     def _start_heartbeat(self):
         def heartbeat():
             logger.info(f"💓 Starting heartbeat for {self.name}")
@@ -63,16 +192,22 @@ class MarketClient:
             max_failures = int(os.getenv("AGENT_MKT_MAX_HEARTBEAT_FAILURES", "5"))
             
             while True:
+                if self.ws_identified:
+                    # Presence comes from the identified socket (kept alive by ping/pong)
+                    consecutive_failures = 0
+                    time.sleep(HEARTBEAT_INTERVAL)
+                    continue
                 try:
-                    res = requests.post(
-                        f"{self.api_url}/agents/status",
+                    # No live socket: fall back to an HTTP keep-alive so we still show as online
+                    res = self._request(
+                        "POST", "/agents/status", idempotent=True,
                         json={"status": self.current_status, "activity": self.current_activity},
-                        headers={"x-api-key": self.api_key},
-                        timeout=5
+                        headers={"x-api-key": self.api_key}
                     )
 
                     if res.status_code == 200:
                         consecutive_failures = 0
+                        self._sent_status = (self.current_status, self.current_activity)
                     else:
                         consecutive_failures += 1
                         logger.warning(f"⚠️ Heartbeat failed ({res.status_code}). Failure {consecutive_failures}/{max_failures}")
@@ -84,7 +219,7 @@ class MarketClient:
                     logger.error("❌ CRTICAL: Agent disconnected from API. Exiting to allow restart.")
                     os._exit(1) # Force exit to trigger container/process manager restart
 
-                time.sleep(30)
+                time.sleep(HEARTBEAT_INTERVAL)
         t = threading.Thread(target=heartbeat, daemon=True)
         t.start()
 
@@ -107,7 +242,7 @@ class MarketClient:
 
         for i in range(max_retries):
             try:
-                res = requests.post(f"{self.api_url}/agents/register", json=payload, timeout=5)
+                res = self._request("POST", "/agents/register", json=payload)
                 if res.status_code == 200:
                     data = res.json()
                     self.agent_id = data["agent_id"]
@@ -141,7 +276,40 @@ class MarketClient:
             # logger.debug(f"📥 {self.name} received WebSocket message: {message[:100]}...")
             try:
                 data = json.loads(message)
+                if data.get("seq") is not None:
+                    self.last_seq = data["seq"] if self.last_seq is None else max(self.last_seq, data["seq"])
                 
+                if data.get("type") == "subscribed":
+                    logger.debug(f"📮 {self.name} subscriptions active: {data.get('topics')}")
+                    return
+
+                if data.get("type") == "identified":
+                    self.ws_identified = True
+                    # Restate our status for the server's presence entry (off this thread:
+                    # a WebSocket command would wait on the reply this thread delivers)
+                    self._sent_status = None
+                    threading.Thread(target=self.update_status, args=(self.current_status, self.current_activity), daemon=True).start()
+                    if data.get("epoch") != self.stream_epoch:
+                        # New server process (or first connect): track its stream from the current head
+                        self.stream_epoch = data.get("epoch")
+                        self.last_seq = data.get("seq")
+                    return
+
+                if data.get("type") == "resumed":
+                    logger.info(f"⏩ {self.name} resumed stream, {data.get('replayed')} missed events replayed")
+                    return
+
+                if data.get("type") == "resync_required":
+                    logger.info(f"🔄 {self.name} missed too much to replay, resyncing from snapshot")
+                    self.stream_epoch = data.get("epoch")
+                    self.last_seq = max(self.last_seq or 0, data.get("seq") or 0)
+                    threading.Thread(target=self._fetch_active_state, daemon=True).start()
+                    return
+
+                if data.get("type") == "command_result":
+                    self._resolve_command(data)
+                    return
+
                 if data.get("type") == "feedback_report":
                     involved = data.get("involved_agents", [])
                     if self.agent_id in involved:
@@ -161,11 +329,8 @@ class MarketClient:
                         # logger.info(f"🛑 [Client] Ignoring concluded negotiation event: {item_data.get('negotiation_id')}")
                         return
 
-                    item_cat = item_data.get("category", DEFAULT_CATEGORY)
-                    # Filter logic if needed, but for now allow all for broad market awareness
-                    # if item_cat != self.category and item_cat != DEFAULT_CATEGORY:
-                    #     pass 
-    
+                    # Category filtering happens server-side through our subscription (see _subscription_message)
+
                 self.event_queue.put(data)
             except Exception as e:
                 logger.error(f"❌ Error processing WS message: {e}")
@@ -174,7 +339,7 @@ class MarketClient:
             logger.info(f"⏳ {self.name} waiting for API server at {self.api_url}...")
             while True:
                 try:
-                    requests.get(self.api_url, timeout=int(os.getenv("AGENT_MKT_SOCKET_TIMEOUT", "2")))
+                    self._request("GET", "", timeout=int(os.getenv("AGENT_MKT_SOCKET_TIMEOUT", "2")))
                     logger.info(f"✅ {self.name} API server is UP")
                     break
                 except Exception:
@@ -182,18 +347,6 @@ class MarketClient:
 
         def run():
             wait_for_server()
-            
-            def fetch_active_state():
-                try:
-                    logger.info("🔄 (Re)Fetching active market requests...")
-                    res = requests.get(f"{self.api_url}/market/active", timeout=5)
-                    if res.status_code == 200:
-                        items = res.json().get("items", [])
-                        logger.info(f"📥 Found {len(items)} active market items.")
-                        for item in items:
-                            self.event_queue.put({"type": "market_event", "data": item})
-                except Exception as e:
-                    logger.warning(f"⚠️ Failed to sync active market items: {e}")
 
             def on_open(ws):
                 logger.info(f"🔌 {self.name} WebSocket connection OPEN")
@@ -204,15 +357,25 @@ class MarketClient:
                         "api_key": self.api_key
                     })
                     ws.send(id_msg)
+
+                subscription = self._subscription_message()
+                if subscription:
+                    ws.send(subscription)
                 
-                # Sync state on connection/reconnection
-                # Run in a separate thread to not block the WebSocket app
-                threading.Thread(target=fetch_active_state, daemon=True).start()
+                if WS_RESUME and self.stream_epoch and self.last_seq is not None:
+                    # Reconnect: ask for just the events we missed; the server answers
+                    # resync_required if it can't, and we fall back to the snapshot then
+                    ws.send(json.dumps({"type": "resume", "epoch": self.stream_epoch, "last_seq": self.last_seq}))
+                else:
+                    # Sync state on first connection
+                    # Run in a separate thread to not block the WebSocket app
+                    threading.Thread(target=self._fetch_active_state, daemon=True).start()
                 
             def on_error(ws, error):
                 logger.error(f"❌ {self.name} WebSocket ERROR: {error}")
                 
             def on_close(ws, close_status_code, close_msg):
+                self.ws_identified = False
                 logger.info(f"🔌 {self.name} WebSocket CLOSED: {close_status_code} - {close_msg}")
 
             while True:
@@ -224,7 +387,8 @@ class MarketClient:
                         on_error=on_error,
                         on_close=on_close
                     )
-                    self.ws.run_forever()
+                    # Client-side pings catch a dead connection; the server tracks presence from it
+                    self.ws.run_forever(ping_interval=WS_PING_INTERVAL, ping_timeout=WS_PING_TIMEOUT)
                 except Exception as e:
                     logger.error(f"⚠️ {self.name} WebSocket Thread Exception: {e}")
                 
@@ -235,6 +399,51 @@ class MarketClient:
         self.listener_thread.start()
         logger.info(f"📡 WebSocket Listener started for {self.name}")
 
+    def _fetch_active_state(self):
+        try:
+            logger.info("🔄 (Re)Fetching active market requests...")
+            # Only pull our slice of the order book (own category plus the shared default)
+            for category in dict.fromkeys([self.category, DEFAULT_CATEGORY]):
+                res = self._request("GET", "/market/active", idempotent=True, params={"category": category})
+                if res.status_code == 200:
+                    items = res.json().get("items", [])
+                    logger.info(f"📥 Found {len(items)} active market items in '{category}'.")
+                    for item in items:
+                        self.event_queue.put({"type": "market_event", "data": item})
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to sync active market items: {e}")
+
+    def _subscription_message(self):
+        """Builds the subscribe frame sent on every (re)connect, or None for the full firehose."""
+        if not self.use_subscriptions:
+            return None
+        topics = dict(self.subscriptions)
+        if not topics:
+            topics = {"categories": list(dict.fromkeys([self.category, DEFAULT_CATEGORY]))}
+        if self.agent_id:
+            # Offers, proposals and coach reports addressed to us always get through
+            topics["agents"] = sorted(set(topics.get("agents", [])) | {self.agent_id})
+        return json.dumps({"type": "subscribe", **topics})
+
+    def subscribe(self, categories=None, products=None, event_types=None, negotiation_ids=None, agents=None):
+        """Replaces the default subscription with explicit topics (kept across reconnects)."""
+        requested = {
+            "categories": categories,
+            "products": products,
+            "event_types": event_types,
+            "negotiation_ids": negotiation_ids,
+            "agents": agents
+        }
+        for field, values in requested.items():
+            if values:
+                self.subscriptions[field] = sorted(set(self.subscriptions.get(field, [])) | set(values))
+        self.use_subscriptions = True
+        try:
+            if self.ws and self.ws.sock and self.ws.sock.connected:
+                self.ws.send(self._subscription_message())
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to send subscription: {e}")
+
     def get_event(self, timeout=float(os.getenv("AGENT_MKT_POLL_TIMEOUT", "1.0"))):
         try:
             return self.event_queue.get(timeout=timeout)
@@ -251,7 +460,10 @@ class MarketClient:
                 "category": self.category,
                 "currency": os.getenv("AGENT_MKT_CURRENCY", "USDC")
             }
-            res = requests.post(f"{self.api_url}/market/offers", json=payload, headers={"x-api-key": self.api_key})
+            sent, body = self._command("post_offer", payload)
+            if sent:
+                return body
+            res = self._request("POST", "/market/offers", json=payload, headers={"x-api-key": self.api_key})
             return res.json()
         except Exception as e:
             logger.error(f"❌ Failed to post offer: {e}")
@@ -265,7 +477,10 @@ class MarketClient:
                 "quantity": quantity,
                 "category": self.category
             }
-            res = requests.post(f"{self.api_url}/market/requests", json=payload, headers={"x-api-key": self.api_key})
+            sent, body = self._command("post_request", payload)
+            if sent:
+                return body
+            res = self._request("POST", "/market/requests", json=payload, headers={"x-api-key": self.api_key})
             return res.json()
         except Exception as e:
             logger.error(f"❌ Failed to post request: {e}")
@@ -273,16 +488,22 @@ class MarketClient:
     
     
     def update_status(self, status, activity):
-        """Updates the agent's status and activity immediately and for future heartbeats."""
+        """Updates the agent's status and activity; unchanged values aren't resent."""
         self.current_status = status
         self.current_activity = activity
+        if self._sent_status == (status, activity):
+            return
         try:
-             requests.post(
-                f"{self.api_url}/agents/status",
-                json={"status": status, "activity": activity},
-                headers={"x-api-key": self.api_key},
-                timeout=5
-            )
+             sent, body = self._command("update_status", {"status": status, "activity": activity})
+             if not sent:
+                 res = self._request(
+                    "POST", "/agents/status", idempotent=True,
+                    json={"status": status, "activity": activity},
+                    headers={"x-api-key": self.api_key}
+                )
+                 body = res.json() if res.status_code == 200 else None
+             if body and body.get("status") == "updated":
+                 self._sent_status = (status, activity)
         except Exception as e:
             logger.warning(f"⚠️ Failed to update status: {e}")
 
@@ -299,7 +520,10 @@ class MarketClient:
                 "quantity": quantity,
                 "reasoning": reasoning
             }
-            res = requests.post(f"{self.api_url}/market/negotiate", json=payload, headers={"x-api-key": self.api_key})
+            sent, body = self._command("negotiate", payload)
+            if sent:
+                return body
+            res = self._request("POST", "/market/negotiate", json=payload, headers={"x-api-key": self.api_key})
             return res.json()
         except Exception as e:
             logger.error(f"❌ Failed to negotiate: {e}")
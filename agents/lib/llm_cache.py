@@ -0,0 +1,137 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+logger = logging.getLogger("LLMCache")
+
+LLM_CACHE_ENABLED = os.getenv("AGENT_MKT_LLM_CACHE", "true").lower() == "true"
+LLM_CACHE_SIZE = int(os.getenv("AGENT_MKT_LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("AGENT_MKT_LLM_CACHE_TTL", "3600"))
+LLM_CACHE_PATH = os.getenv("AGENT_MKT_LLM_CACHE_PATH")  # SQLite file; unset = memory only
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapses whitespace so indentation and line wrapping don't defeat the cache."""
+    return _WHITESPACE.sub(" ", prompt).strip()
+
+
+def cache_key(model_name: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+def is_json_response(text: str) -> bool:
+    """Validator for strict-JSON prompts: accepts the text once markdown fences are stripped."""
+    try:
+        json.loads(text.replace("```json", "").replace("```", "").strip())
+        return True
+    except (ValueError, AttributeError):
+        return False
+
+
+class LLMCache:
+    """Content-addressed cache of LLM responses, keyed by model name + normalized prompt.
+
+    An in-memory LRU with a TTL sits in front of an optional SQLite file, so a
+    restarted agent keeps its warm entries. Safe to share across the worker
+    threads that call the model.
+    """
+
+    def __init__(self, max_entries: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL,
+                 path: Optional[str] = LLM_CACHE_PATH, enabled: bool = LLM_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (stored_at, text)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if path and enabled:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, stored_at REAL, response TEXT)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ LLM cache store unavailable at {path}, using memory only: {e}")
+                self._db = None
+
+    def _fresh(self, stored_at: float) -> bool:
+        return time.time() - stored_at < self.ttl
+
+    def get(self, model_name: str, prompt: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = cache_key(model_name, prompt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._fresh(entry[0]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT stored_at, response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row and self._fresh(row[0]):
+                    self._remember(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[1]
+            self.misses += 1
+        return None
+
+    def put(self, model_name: str, prompt: str, response: str):
+        if not self.enabled:
+            return
+        key = cache_key(model_name, prompt)
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, response)
+            if self._db is not None:
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)", (key, stored_at, response))
+                    self._db.execute("DELETE FROM llm_cache WHERE stored_at < ?", (stored_at - self.ttl,))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ LLM cache write failed: {e}")
+
+    def _remember(self, key: str, stored_at: float, response: str):
+        self._entries[key] = (stored_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_generate(self, model_name: str, prompt: str, generate: Callable[[str], str],
+                        validate: Optional[Callable[[str], bool]] = None) -> str:
+        """Returns the cached response or calls `generate(prompt)`.
+
+        Fresh responses are stored only if `validate` accepts them, so a
+        malformed answer is retried next time instead of being replayed.
+        """
+        cached = self.get(model_name, prompt)
+        if cached is not None:
+            return cached
+        response = generate(prompt)
+        if validate is None or validate(response):
+            self.put(model_name, prompt, response)
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else None,
+            }
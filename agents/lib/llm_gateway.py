@@ -0,0 +1,242 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, List, Optional
+
+from .llm_cache import LLMCache
+
+logger = logging.getLogger("LLMGateway")
+
+LLM_DEADLINE = float(os.getenv("AGENT_MKT_LLM_DEADLINE", "20"))
+LLM_CONCURRENCY = int(os.getenv("AGENT_MKT_LLM_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("AGENT_MKT_LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE = float(os.getenv("AGENT_MKT_LLM_RETRY_BASE", "0.5"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("AGENT_MKT_LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("AGENT_MKT_LLM_BREAKER_RESET", "30"))
+
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32]  # seconds
+TOKEN_BUCKETS = [100, 250, 500, 1000, 2000, 4000, 8000]
+
+
+class LLMUnavailable(Exception):
+    """The gateway could not produce a response in time; callers should take their heuristic path."""
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are reported as bucket upper bounds."""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self.count:
+                return None
+            rank, seen = q * self.count, 0
+            for i, n in enumerate(self.counts):
+                seen += n
+                if seen >= rank:
+                    return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return None
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; lets one probe through after `reset_timeout`."""
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, reset_timeout: float = LLM_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class LLMGateway:
+    """Shared entry point for agent LLM calls.
+
+    Every call gets an overall deadline that covers queueing, the call
+    itself and any retries; at most `max_concurrency` calls run at once on
+    the gateway's own executor, so a stalled Vertex response can no longer
+    pin an agent's decision workers. Failures are retried with jittered
+    exponential backoff while the deadline allows, and a circuit breaker
+    stops calling a failing backend altogether. Whenever no answer can be
+    produced, `LLMUnavailable` is raised and the agent falls back to its
+    heuristic path. Optionally fronted by an `LLMCache`.
+    """
+
+    def __init__(self, model, model_name: str, deadline: float = LLM_DEADLINE,
+                 max_concurrency: int = LLM_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES,
+                 retry_base: float = LLM_RETRY_BASE, breaker: Optional[CircuitBreaker] = None,
+                 cache: Optional[LLMCache] = None):
+        self.model = model
+        self.model_name = model_name
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="llm")
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.tokens = Histogram(TOKEN_BUCKETS)
+        self.counts = {"calls": 0, "cache_hits": 0, "retries": 0, "timeouts": 0, "errors": 0,
+                       "invalid": 0, "short_circuited": 0, "fallbacks": 0}
+
+    def _call_model(self, prompt: str) -> str:
+        start = time.monotonic()
+        response = self.model.generate_content(prompt)
+        self.latency.observe(time.monotonic() - start)
+        usage = getattr(response, "usage_metadata", None)
+        total_tokens = getattr(usage, "total_token_count", None)
+        if isinstance(total_tokens, (int, float)):
+            self.tokens.observe(total_tokens)
+        return response.text
+
+    def _backoff(self, attempt: int) -> float:
+        return self.retry_base * (2 ** attempt) * (0.5 + random.random())
+
+    def _unavailable(self, reason: str) -> LLMUnavailable:
+        self.counts["fallbacks"] += 1
+        logger.warning(f"⚠️ [LLM] {reason}; falling back to heuristics")
+        return LLMUnavailable(reason)
+
+    def _before_call(self, prompt: str) -> Optional[str]:
+        """Cache lookup and breaker check shared by the sync and async paths."""
+        self.counts["calls"] += 1
+        if self.cache is not None:
+            cached = self.cache.get(self.model_name, prompt)
+            if cached is not None:
+                self.counts["cache_hits"] += 1
+                return cached
+        if not self.breaker.allow():
+            self.counts["short_circuited"] += 1
+            raise self._unavailable("Circuit open")
+        return None
+
+    def _after_attempt(self, prompt: str, text: str, validate: Optional[Callable[[str], bool]]) -> bool:
+        if validate is not None and not validate(text):
+            self.counts["invalid"] += 1
+            self.breaker.record_failure()
+            return False
+        self.breaker.record_success()
+        if self.cache is not None:
+            self.cache.put(self.model_name, prompt, text)
+        return True
+
+    def _record_error(self, error: Exception):
+        if isinstance(error, (FutureTimeout, asyncio.TimeoutError)):
+            self.counts["timeouts"] += 1
+        else:
+            self.counts["errors"] += 1
+        self.breaker.record_failure()
+
+    def generate(self, prompt: str, validate: Optional[Callable[[str], bool]] = None) -> str:
+        """Blocking call for thread-based agents. Raises LLMUnavailable instead of hanging."""
+        cached = self._before_call(prompt)
+        if cached is not None:
+            return cached
+        deadline = time.monotonic() + self.deadline
+        for attempt in range(self.max_retries + 1):
+            future = self.executor.submit(self._call_model, prompt)
+            try:
+                text = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                if self._after_attempt(prompt, text, validate):
+                    return text
+            except Exception as e:
+                future.cancel()  # Frees the slot if the call never started
+                self._record_error(e)
+                logger.debug(f"🤖 [LLM] Attempt {attempt + 1} failed: {e!r}")
+            delay = self._backoff(attempt)
+            if attempt == self.max_retries or not self.breaker.allow() or time.monotonic() + delay >= deadline:
+                break
+            self.counts["retries"] += 1
+            time.sleep(delay)
+        raise self._unavailable(f"No usable response within {self.deadline:g}s")
+
+    async def agenerate(self, prompt: str, validate: Optional[Callable[[str], bool]] = None) -> str:
+        """Async variant sharing the same executor, breaker, cache and metrics."""
+        cached = self._before_call(prompt)
+        if cached is not None:
+            return cached
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        for attempt in range(self.max_retries + 1):
+            future = self.executor.submit(self._call_model, prompt)
+            try:
+                text = await asyncio.wait_for(asyncio.wrap_future(future), max(0.0, deadline - loop.time()))
+                if self._after_attempt(prompt, text, validate):
+                    return text
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                future.cancel()
+                self._record_error(e)
+                logger.debug(f"🤖 [LLM] Attempt {attempt + 1} failed: {e!r}")
+            delay = self._backoff(attempt)
+            if attempt == self.max_retries or not self.breaker.allow() or loop.time() + delay >= deadline:
+                break
+            self.counts["retries"] += 1
+            await asyncio.sleep(delay)
+        raise self._unavailable(f"No usable response within {self.deadline:g}s")
+
+    def stats(self) -> dict:
+        return {
+            **self.counts,
+            "breaker": self.breaker.state,
+            "latency_s": self.latency.snapshot(),
+            "tokens": self.tokens.snapshot(),
+        }
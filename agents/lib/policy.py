@@ -0,0 +1,103 @@
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger("Policy")
+
+# A buyer treats offers above BUDGET_CAP * this factor as clearly out of range
+BUYER_FAR_OVER_FACTOR = float(os.getenv("AGENT_MKT_POLICY_BUYER_FAR_OVER", "1.25"))
+# A seller treats counters below floor * this factor as clearly too low
+SELLER_FAR_UNDER_FACTOR = float(os.getenv("AGENT_MKT_POLICY_SELLER_FAR_UNDER", "0.6"))
+
+# Decisions use the same shape as the strategy model's JSON so callers can't tell them apart
+Decision = Dict[str, object]
+Rule = Callable[[dict], Optional[Decision]]
+
+
+def decision(action: str, price, reasoning: str, thought: str) -> Decision:
+    return {"action": action, "price": price, "reasoning": reasoning, "internal_thought": thought}
+
+
+def buyer_thresholds(accept_below: float, budget_cap: float, far_over_factor: float = BUYER_FAR_OVER_FACTOR) -> Rule:
+    """Accepts clear bargains outright and answers prices far over budget without the LLM."""
+    def rule(ctx: dict) -> Optional[Decision]:
+        price = ctx.get("price")
+        if not isinstance(price, (int, float)):
+            return None
+        if price < accept_below:
+            return decision("ACCEPT", price,
+                            "It seems like we've found a number that works for both of us. Let's move forward.",
+                            f"Fast path: ${price} is under the accept threshold ${accept_below:.2f}")
+        if price > budget_cap * far_over_factor:
+            return decision("COUNTER", accept_below,
+                            f"How am I supposed to justify ${price} to my team? ${accept_below:.2f} is what I can defend.",
+                            f"Fast path: ${price} is far over the budget cap ${budget_cap:.2f}")
+        return None
+    return rule
+
+
+def seller_floor(far_under_factor: float = SELLER_FAR_UNDER_FACTOR, markup: float = 1.1) -> Rule:
+    """Accepts counters at or above the floor and re-anchors counters far below it.
+
+    Initial offers are never settled here: the opening anchor is where the
+    strategy model earns its keep. Expects `price`, `floor` and `is_initial`.
+    """
+    def rule(ctx: dict) -> Optional[Decision]:
+        price, floor = ctx.get("price"), ctx.get("floor")
+        if ctx.get("is_initial") or not isinstance(price, (int, float)) or not floor:
+            return None
+        if price >= floor:
+            return decision("ACCEPT", price,
+                            "That reflects the value of what you're getting. We have a deal.",
+                            f"Fast path: ${price} meets the floor ${floor:.2f}")
+        if price < floor * far_under_factor:
+            return decision("COUNTER", round(floor * markup, 2),
+                            "Cheaper alternatives cost far more in downtime than they save. This is the price of reliability.",
+                            f"Fast path: ${price} is far below the floor ${floor:.2f}")
+        return None
+    return rule
+
+
+class DecisionPolicy:
+    """Pre-decision layer in front of the strategy model.
+
+    Rules run in order; the first one that returns a decision settles the
+    turn, and only turns no rule claims (the ambiguous middle band) are
+    sent to the LLM. Counts how many model calls were avoided.
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = list(rules)
+        self.avoided = 0
+        self.deferred = 0
+        self.decide_time = 0.0
+        self._lock = threading.Lock()
+
+    def decide(self, **ctx) -> Optional[Decision]:
+        start = time.perf_counter()
+        result = None
+        for rule in self.rules:
+            result = rule(ctx)
+            if result is not None:
+                break
+        with self._lock:
+            self.decide_time += time.perf_counter() - start
+            if result is None:
+                self.deferred += 1
+            else:
+                self.avoided += 1
+        if result is not None:
+            logger.info(f"⚡ [Policy] {result['action']} without the LLM ({self.avoided} calls avoided so far)")
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.avoided + self.deferred
+            return {
+                "avoided": self.avoided,
+                "deferred": self.deferred,
+                "avoided_ratio": round(self.avoided / total, 3) if total else None,
+                "avg_decide_us": round(self.decide_time / total * 1e6, 1) if total else None,
+            }
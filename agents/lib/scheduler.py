@@ -0,0 +1,81 @@
+import logging
+import threading
+from concurrent.futures import Executor
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger("Scheduler")
+
+Job = Tuple[Callable, tuple]
+
+
+class _Slot:
+    __slots__ = ("running", "pending")
+
+    def __init__(self):
+        self.running = False
+        self.pending: Optional[Job] = None
+
+
+class KeyedScheduler:
+    """Latest-wins, per-key serial scheduling on top of a shared executor.
+
+    Work submitted under one key (a negotiation_id) runs strictly in order,
+    never two at once, so a slow evaluation of an old proposal can't race a
+    newer one. Each key holds at most one pending job: when a new proposal
+    arrives while the previous one is still waiting, the waiting one is
+    dropped, since answering a superseded counter only burns LLM time.
+    Different keys run in parallel on the executor's workers.
+    """
+
+    def __init__(self, executor: Executor):
+        self.executor = executor
+        self._slots: Dict[Hashable, _Slot] = {}
+        self._lock = threading.Lock()
+        self.counts = {"submitted": 0, "superseded": 0, "executed": 0, "failed": 0}
+
+    def submit(self, key: Hashable, fn: Callable, *args) -> bool:
+        """Schedules `fn(*args)` for `key`. Returns True if it replaced a queued job."""
+        with self._lock:
+            self.counts["submitted"] += 1
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = _Slot()
+            replaced = slot.pending is not None
+            if replaced:
+                self.counts["superseded"] += 1
+            slot.pending = (fn, args)
+            start = not slot.running
+            slot.running = True
+        if replaced:
+            logger.info(f"⏭️ [Scheduler] Newer work for {key} replaced a queued item")
+        if start:
+            self.executor.submit(self._drain, key)
+        return replaced
+
+    def _drain(self, key: Hashable):
+        """Runs the key's pending jobs one after another until none is left."""
+        while True:
+            with self._lock:
+                slot = self._slots[key]
+                job = slot.pending
+                slot.pending = None
+                if job is None:
+                    del self._slots[key]
+                    return
+            fn, args = job
+            try:
+                fn(*args)
+                with self._lock:
+                    self.counts["executed"] += 1
+            except Exception as e:
+                with self._lock:
+                    self.counts["failed"] += 1
+                logger.error(f"⚠️ [Scheduler] Job for {key} failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active_keys": len(self._slots),
+                "pending": sum(1 for slot in self._slots.values() if slot.pending is not None),
+                **self.counts,
+            }
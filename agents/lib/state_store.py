@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Hashable
+
+STATE_MAX_ENTRIES = int(os.getenv("AGENT_MKT_STATE_MAX_ENTRIES", "1000"))
+STATE_TTL = float(os.getenv("AGENT_MKT_STATE_TTL", "3600"))
+TERMINAL_TTL = float(os.getenv("AGENT_MKT_TERMINAL_TTL", "86400"))
+TERMINAL_BUCKETS = int(os.getenv("AGENT_MKT_TERMINAL_BUCKETS", "24"))
+TERMINAL_MAX_ENTRIES = int(os.getenv("AGENT_MKT_TERMINAL_MAX_ENTRIES", "100000"))
+
+_MISSING = object()
+
+
+class BoundedStateStore:
+    """Per-negotiation state with TTL and LRU eviction.
+
+    Drop-in for the plain dicts the agents kept (`get`, item assignment,
+    `pop`, `in`), except entries expire `ttl` seconds after their last write
+    and the least recently used entry is evicted past `max_entries`. Shared
+    by the event loop and the decision workers, so every call takes a lock.
+    """
+
+    def __init__(self, max_entries: int = STATE_MAX_ENTRIES, ttl: float = STATE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (written_at, value)
+        self.expired = 0
+        self.evicted = 0
+
+    def _live(self, key: Hashable, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        if now - entry[0] >= self.ttl:
+            del self._entries[key]
+            self.expired += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._live(key, time.time())
+        return default if value is _MISSING else value
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            self._prune(now)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def _prune(self, now: float):
+        # Entries are in last-touched order, so expired ones collect at the front
+        while self._entries:
+            key, (written_at, _) = next(iter(self._entries.items()))
+            if now - written_at < self.ttl:
+                break
+            del self._entries[key]
+            self.expired += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._prune(time.time())
+            size = sys.getsizeof(self._entries) + sum(sys.getsizeof(k) for k in self._entries)
+            return {
+                "entries": len(self._entries),
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "approx_bytes": size,
+            }
+
+
+class TerminalSet:
+    """Remembers concluded/terminated negotiation ids for a bounded time.
+
+    Ids go into time buckets `ttl / buckets` seconds wide; whole buckets are
+    dropped as they age out, so a late straggler is still recognised for
+    about `ttl` seconds while a weeks-long agent holds at most one window of
+    ids. Past `max_entries` the oldest bucket is dropped early.
+    """
+
+    def __init__(self, ttl: float = TERMINAL_TTL, buckets: int = TERMINAL_BUCKETS,
+                 max_entries: int = TERMINAL_MAX_ENTRIES):
+        self.ttl = ttl
+        self.width = ttl / max(buckets, 1)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._buckets: deque = deque()  # (bucket_start, set of ids), oldest first
+        self._size = 0
+        self.rotated = 0
+
+    def _rotate(self, now: float):
+        while self._buckets and (self._buckets[0][0] + self.width <= now - self.ttl
+                                 or (self._size > self.max_entries and len(self._buckets) > 1)):
+            _, ids = self._buckets.popleft()
+            self._size -= len(ids)
+            self.rotated += 1
+
+    def add(self, key: Hashable):
+        now = time.time()
+        with self._lock:
+            if not self._buckets or now >= self._buckets[-1][0] + self.width:
+                self._buckets.append((now, set()))
+            newest = self._buckets[-1][1]
+            if key not in newest:
+                newest.add(key)
+                self._size += 1
+            self._rotate(now)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            self._rotate(time.time())
+            return any(key in ids for _, ids in self._buckets)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._size
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._rotate(time.time())
+            size = sys.getsizeof(self._buckets) + sum(
+                sys.getsizeof(ids) + sum(sys.getsizeof(k) for k in ids) for _, ids in self._buckets)
+            return {
+                "entries": self._size,
+                "buckets": len(self._buckets),
+                "rotated": self.rotated,
+                "approx_bytes": size,
+            }
@@ -1,6 +1,6 @@
 from fastapi import FastAPI, HTTPException, Body, WebSocket, WebSocketDisconnect, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import Optional, List, Dict, Any
 from google.cloud import firestore, pubsub_v1
 import os
@@ -9,11 +9,22 @@ import json
 import time
 import uuid
 import asyncio
+import functools
 from datetime import datetime, timedelta
 import sys
 import vertexai
 from vertexai.generative_models import GenerativeModel
 import logging
+from hub.orderbook import OrderBook
+from hub.negotiations import NegotiationStateTable
+from hub.connections import ConnectionManager, describe_topics, subscription_topics
+from hub.repository import MarketRepository
+from hub.candles import CandleStore, RESOLUTIONS
+from hub.workers import KeyedWorkerPool
+from hub.checkpoints import ListenerCheckpoint
+from hub.coach import CoachQueue
+from hub.presence import PresenceTracker
+from agents.lib.llm_cache import LLMCache, is_json_response
 
 # Configure Logging
 logging.basicConfig(
@@ -50,6 +61,9 @@ if not MAX_STEPS_ENV:
     logger.error("❌ AGENT_MKT_MAX_STEPS environment variable is not set.")
     sys.exit(1)
 MAX_NEGOTIATION_STEPS = int(MAX_STEPS_ENV)
+NEG_STATE_MAX_ENTRIES = int(os.getenv("AGENT_MKT_NEG_STATE_MAX_ENTRIES", "10000"))
+CANDLE_MAX_BUCKETS = int(os.getenv("AGENT_MKT_CANDLE_MAX_BUCKETS", "1440"))
+REPUTATION_COMPACT_INTERVAL = float(os.getenv("AGENT_MKT_REPUTATION_COMPACT_INTERVAL", "300"))
 
 def get_coach_model():
     """Lazy loads the Vertex AI model to prevent import crashes if creds are missing."""
@@ -68,107 +82,14 @@ def get_coach_model():
 auth_cache = {}
 AUTH_CACHE_TTL = 300 # 5 minutes
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.agent_map: Dict[str, WebSocket] = {}
-        self.viewers: List[WebSocket] = []
-        self.pending_timeouts: Dict[WebSocket, asyncio.Task] = {}
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        
-        # Identification Timeout: Use a task to kick unidentified clients
-        timeout_task = asyncio.create_task(self._ghost_cleanup_timeout(websocket))
-        self.pending_timeouts[websocket] = timeout_task
-        
-        client = f"{websocket.client.host}:{websocket.client.port}"
-        logger.info(f"🔌 [+] WS Connected: {client}. Total: {len(self.active_connections)}")
-
-    async def _ghost_cleanup_timeout(self, websocket: WebSocket):
-        """Closes connection if not identified within timeout (30s)."""
-        await asyncio.sleep(30)
-        # Check if it's an agent OR a viewer
-        is_identified = websocket in self.agent_map.values() or websocket in self.viewers
-        if not is_identified:
-             logger.warning(f"👻 [WS] Kicking unidentified client {websocket.client.host}")
-             try:
-                 await websocket.close(code=1008) # Policy Violation
-             except Exception as e:
-                 logger.warning(f"⚠️ [WS] Error closing connection for unidentified client: {e}")
-             self.disconnect(websocket)
-
-    def identify(self, agent_id: str, websocket: WebSocket):
-        self.agent_map[agent_id] = websocket
-        # Cancel timeout if identified
-        if websocket in self.pending_timeouts:
-            self.pending_timeouts[websocket].cancel()
-            del self.pending_timeouts[websocket]
-            
-        client = f"{websocket.client.host}:{websocket.client.port}"
-        logger.info(f"🆔 WS Identified: {agent_id} at {client}")
-
-    def identify_viewer(self, websocket: WebSocket):
-        """Registers a read-only viewer interface (like the frontend)."""
-        if websocket not in self.viewers:
-            self.viewers.append(websocket)
-        
-        # Cancel timeout
-        if websocket in self.pending_timeouts:
-            self.pending_timeouts[websocket].cancel()
-            del self.pending_timeouts[websocket]
-            
-        client = f"{websocket.client.host}:{websocket.client.port}"
-        logger.info(f"👀 WS Viewer Registered: {client}")
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        if websocket in self.viewers:
-            self.viewers.remove(websocket)
-            
-        if websocket in self.pending_timeouts:
-            self.pending_timeouts[websocket].cancel()
-            del self.pending_timeouts[websocket]
-            
-        client = f"{websocket.client.host}:{websocket.client.port}"
-        logger.info(f"🔌 [-] WS Disconnected: {client}. Remaining: {len(self.active_connections)}")
-        # Remove from map if exists
-        for agent_id, ws in list(self.agent_map.items()):
-            if ws == websocket:
-                del self.agent_map[agent_id]
-                break
-
-    async def broadcast(self, message: dict):
-        if not self.active_connections:
-            return
-
-        # Create tasks for all connections
-        tasks = [connection.send_json(message) for connection in self.active_connections]
-        
-        # Run all tasks concurrently, return exceptions instead of raising them immediately
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        total_sent = 0
-        for res in results:
-            if isinstance(res, Exception):
-                logger.warning(f"⚠️ Broadcast failure to a client: {res}")
-            else:
-                total_sent += 1
-
-        if total_sent > 0:
-            logger.info(f"📡 Broadcast of {message.get('type')} to {total_sent} listeners.")
-
-    async def send_to_agent(self, agent_id: str, message: dict):
-        if agent_id in self.agent_map:
-            try:
-                await self.agent_map[agent_id].send_json(message)
-                logger.info(f"📤 Targeted message sent to {agent_id}")
-            except Exception as e:
-                logger.warning(f"⚠️ Failed to send targeted message to {agent_id}: {e}")
-
 manager = ConnectionManager()
+order_book = OrderBook(default_category=DEFAULT_CATEGORY)
+negotiation_states = NegotiationStateTable(max_entries=NEG_STATE_MAX_ENTRIES)
+candles = CandleStore(max_buckets=CANDLE_MAX_BUCKETS)
+workers = KeyedWorkerPool()
+listener_checkpoints: Dict[str, ListenerCheckpoint] = {}
+ws_command_tasks = set()  # In-flight WebSocket commands (strong refs until done)
+presence = PresenceTracker()
 app = FastAPI(title="Isiziba Marketplace API", version="1.0.1")
 __version__ = "1.0.1"
 
@@ -197,14 +118,10 @@ async def verify_api_key(x_api_key: str = Header(...)):
             del auth_cache[x_api_key]
 
     try:
-        # Wrap sync Firestore call in a thread to keep the event loop responsive
-        query = await asyncio.to_thread(
-            lambda: app.state.db.collection("agents").where("api_key", "==", x_api_key).limit(1).get()
-        )
-        if not query:
+        agent_data = await get_repo().find_agent_by_key(x_api_key)
+        if not agent_data:
             raise HTTPException(status_code=403, detail="Invalid API Key")
         
-        agent_data = query[0].to_dict()
         # Update cache
         auth_cache[x_api_key] = (agent_data, now + timedelta(seconds=AUTH_CACHE_TTL))
         
@@ -219,6 +136,7 @@ async def verify_api_key(x_api_key: str = Header(...)):
 @app.websocket("/ws/market")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
+    ws_agent = None  # Agent record once `identify` succeeds; commands run as this agent
     try:
         while True:
             data = await websocket.receive_text()
@@ -227,7 +145,18 @@ async def websocket_endpoint(websocket: WebSocket):
                 
                 # Handle Viewer Identification
                 if msg.get("type") == "identify_view":
-                    manager.identify_viewer(websocket)
+                    # batch: conflated updates at AGENT_MKT_VIEWER_HZ instead of every event
+                    manager.identify_viewer(websocket, batched=bool(msg.get("batch")))
+                    continue
+
+                # Topic subscriptions (categories, products, event_types, negotiation_ids, agents)
+                if msg.get("type") in ("subscribe", "unsubscribe"):
+                    topics = subscription_topics(msg)
+                    if msg["type"] == "subscribe":
+                        active = manager.subscribe(websocket, topics)
+                    else:
+                        active = manager.unsubscribe(websocket, topics or None)
+                    await manager.send_to_socket(websocket, {"type": "subscribed", "topics": describe_topics(active)})
                     continue
 
                 if msg.get("type") == "identify":
@@ -237,26 +166,81 @@ async def websocket_endpoint(websocket: WebSocket):
                         continue
                     
                     # Verify API key asynchronously
-                    agent_query = await asyncio.to_thread(
-                        lambda: app.state.db.collection("agents").where("id", "==", agent_id).where("api_key", "==", api_key).limit(1).get()
-                    )
-                    if agent_query:
+                    agent_data = await get_repo().verify_agent(agent_id, api_key)
+                    if agent_data:
+                        ws_agent = agent_data
                         manager.identify(agent_id, websocket)
+                        came_online = presence.connected(agent_data)
+                        if came_online:
+                            await manager.broadcast(came_online)
+                        await manager.send_to_socket(websocket, {
+                            "type": "identified", "agent_id": agent_id,
+                            "epoch": manager.events.epoch, "seq": manager.events.seq
+                        })
                     else:
                         logger.warning(f"⚠️ [WS] Identity verification failed for {agent_id}")
+                    continue
+
+                # Delta resync: replay what the client missed since its last seq
+                if msg.get("type") == "resume":
+                    reply = manager.resume(websocket, ws_agent["id"] if ws_agent else None,
+                                           msg.get("epoch"), msg.get("last_seq"))
+                    await manager.send_to_socket(websocket, reply)
+                    continue
+
+                # Request/response commands (negotiate, post_offer, ...) on the authenticated socket.
+                # Run beside the receive loop so a slow negotiate doesn't hold up later frames.
+                if msg.get("type") == "command":
+                    task = asyncio.create_task(handle_ws_command(websocket, ws_agent, msg))
+                    ws_command_tasks.add(task)
+                    task.add_done_callback(ws_command_tasks.discard)
             except Exception as e:
                 logger.warning(f"⚠️ [WS] Message error: {e}")
     except WebSocketDisconnect:
+        pass
+    except RuntimeError as e:
+        # Socket was closed underneath us (e.g. evicted as a slow consumer)
+        logger.info(f"🔌 [WS] Receive loop ended: {e}")
+    finally:
         manager.disconnect(websocket)
+        # Offline is announced by the presence sweep, unless the agent reconnects first
+        if ws_agent and ws_agent["id"] not in manager.agent_map:
+            presence.disconnected(ws_agent["id"])
 
 def setup_listeners(loop):
     app.state.main_loop = loop
+
+    # Resume points saved by the previous process: the initial snapshots only warm caches,
+    # except for documents written after these read times (i.e. while we were down)
+    try:
+        saved = get_db().collection("system").document("listener_checkpoints").get()
+        saved = (saved.to_dict() or {}) if saved.exists else {}
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to load listener checkpoints, warming up silently: {e}")
+        saved = {}
+    for name in ("offers", "transactions"):
+        listener_checkpoints[name] = ListenerCheckpoint(name, since=saved.get(name))
+    tx_checkpoint = listener_checkpoints["transactions"]
+    offer_checkpoint = listener_checkpoints["offers"]
+
+    def save_checkpoint(checkpoint, read_time):
+        if checkpoint.advance(read_time):
+            workers.submit_threadsafe(
+                f"checkpoint:{checkpoint.name}",
+                functools.partial(get_repo().save_checkpoint, checkpoint.name, checkpoint.read_time),
+                name="checkpoint"
+            )
     
     # Combined Transaction & Reputation Listener
     def on_transaction_snap(doc_snapshot, changes, read_time):
         for change in changes:
             data = change.document.to_dict()
             if change.type.name in ['ADDED', 'MODIFIED']:
+                # 0. Fold into the price candles (deduplicated by transaction id)
+                candles.ingest(data)
+                if not tx_checkpoint.is_live(change.document):
+                    continue
+
                 # 1. Broadcast to WS for real-time UI updates
                 asyncio.run_coroutine_threadsafe(
                     manager.broadcast({"type": "market_event", "data": data}),
@@ -272,20 +256,45 @@ def setup_listeners(loop):
                     logger.info(f"💰 Transaction {data.get('id')} reached COMPLETED state.")
                     # Optimized: Only seller gets reputation for now, or handle both more efficiently if needed. 
                     # Actually, let's keep both but use a single log message to reduce noise.
-                    update_reputation(data["buyer_id"], 1.0, transaction_id=data.get("id"))
-                    update_reputation(data["seller_id"], 1.0, transaction_id=data.get("id"))
+                    # Only enqueue here: the worker pool applies them in per-agent order with retries
+                    for agent_id in (data["buyer_id"], data["seller_id"]):
+                        workers.submit_threadsafe(
+                            agent_id,
+                            functools.partial(update_reputation, agent_id, 1.0, transaction_id=data.get("id")),
+                            name="reputation"
+                        )
+        if not candles.ready:
+            candles.ready = True
+            logger.info(f"🕯️ Candles warmed for {len(candles.products())} products "
+                        f"(replayed {tx_checkpoint.replayed}, skipped {tx_checkpoint.skipped} stale transactions).")
+        save_checkpoint(tx_checkpoint, read_time)
 
     # Simplified Offer Listener
     def on_offer_snap(doc_snapshot, changes, read_time):
         for change in changes:
             if change.type.name == 'ADDED':
                 data = change.document.to_dict()
-                asyncio.run_coroutine_threadsafe(
-                    manager.broadcast({"type": "market_event", "data": data}),
-                    loop
-                )
+                order_book.upsert(change.document.id, data)
+                if offer_checkpoint.is_live(change.document):
+                    asyncio.run_coroutine_threadsafe(
+                        manager.broadcast({"type": "market_event", "data": data}),
+                        loop
+                    )
+        save_checkpoint(offer_checkpoint, read_time)
+
+    # Order Book Listener: the first snapshot warms the book, later ones keep it current
+    def on_market_item_snap(doc_snapshot, changes, read_time):
+        for change in changes:
+            if change.type.name == 'REMOVED':
+                order_book.remove(change.document.id)
+            else:
+                order_book.upsert(change.document.id, change.document.to_dict())
+        if not order_book.ready:
+            order_book.ready = True
+            logger.info(f"📚 Order book warmed with {len(order_book)} active items.")
 
     get_db().collection("offers").on_snapshot(on_offer_snap)
+    get_db().collection("market_items").where("valid_until", ">", time.time()).on_snapshot(on_market_item_snap)
     get_db().collection("transactions").on_snapshot(on_transaction_snap)
 
     # Pub/Sub Listener for Discovery (Requests) and Negotiation (Proposals)
@@ -294,7 +303,7 @@ def setup_listeners(loop):
     def callback_pubsub(message):
         try:
             data = json.loads(message.data.decode("utf-8"))
-            logger.info(f"📡 Pub/Sub Hub Broadcasting: {data.get('type')} to {len(manager.active_connections)} clients")
+            logger.debug(f"📡 Pub/Sub Hub Broadcasting: {data.get('type')} to {len(manager.active_connections)} clients")
             asyncio.run_coroutine_threadsafe(
                 manager.broadcast({"type": "market_event", "data": data}),
                 loop
@@ -327,74 +336,32 @@ def setup_listeners(loop):
     subscriber.subscribe(neg_sub_name, callback=callback_pubsub)
     logger.info(f"📡 API Hub Pub/Sub listeners standardized.")
 
-def update_reputation(agent_id, change, transaction_id=None):
-    """Updates agent reputation and logs history, ensuring one update per transaction."""
-    try:
-        agent_ref = get_db().collection("agents").document(agent_id)
-        
-        # Transactional update
-        @firestore.transactional
-        def update_in_transaction(transaction, ref):
-            # 1. Idempotency Check (P0 Fix)
-            if transaction_id:
-                # Use a deterministic ID for the history record to prevent double-counting
-                history_id = f"{agent_id}_{transaction_id}"
-                hist_ref = get_db().collection("reputation_history").document(history_id)
-                hist_snap = next(transaction.get(hist_ref))
-                
-                if hist_snap.exists:
-                    logger.info(f"ℹ️ Reputation already processed for {agent_id} (TX: {transaction_id})")
-                    return
-
-            # 2. Get current agent state
-            snapshot = next(transaction.get(ref))
-            if not snapshot.exists:
-                return
-            
-            new_score = snapshot.get("global_reputation") + change
-            current_tx = snapshot.to_dict().get("total_transactions", 0)
-            
-            # 3. Update Agent
-            transaction.update(ref, {
-                "global_reputation": new_score, 
-                "total_transactions": current_tx + 1
-            })
-            
-            # 4. Create History Record (act as the idempotency key)
-            if transaction_id:
-                transaction.set(hist_ref, {
-                    "agent_id": agent_id,
-                    "transaction_id": transaction_id,
-                    "reputation": new_score,
-                    "change": change,
-                    "timestamp": time.time()
-                })
-            else:
-                # Fallback for non-transaction updates (rare)
-                get_db().collection("reputation_history").document().set({
-                    "agent_id": agent_id,
-                    "reputation": new_score,
-                    "change": change,
-                    "timestamp": time.time()
-                })
-            
-        transaction = get_db().transaction()
-        update_in_transaction(transaction, agent_ref)
+async def update_reputation(agent_id, change, transaction_id=None):
+    """Updates agent reputation and logs history, ensuring one update per transaction.
+
+    Errors propagate so the worker pool can retry; the history record keeps retries idempotent.
+    """
+    applied = await get_repo().apply_reputation(agent_id, change, transaction_id=transaction_id)
+    if applied:
         logger.info(f"📈 Updated reputation for {agent_id}: +{change}")
-    except Exception as e:
-        logger.error(f"⚠️ Failed to update reputation: {e}")
+    else:
+        logger.info(f"ℹ️ Reputation already processed for {agent_id} (TX: {transaction_id})")
+
+async def compact_reputation_periodically():
+    """Folds sharded reputation counters back into the agent documents."""
+    while True:
+        await asyncio.sleep(REPUTATION_COMPACT_INTERVAL)
+        try:
+            compacted = await get_repo().compact_reputation()
+            if compacted:
+                logger.info(f"🧮 Compacted reputation shards for {compacted} agents")
+        except Exception as e:
+            logger.warning(f"⚠️ Reputation compaction failed: {e}")
 
 @app.get("/agents/{agent_id}/reputation/history")
-def get_reputation_history(agent_id: str):
+async def get_reputation_history(agent_id: str):
     try:
-        docs = get_db().collection("reputation_history")\
-                 .where("agent_id", "==", agent_id)\
-                 .stream()
-        
-        history = [doc.to_dict() for doc in docs]
-        history.sort(key=lambda x: x["timestamp"])
-        
-        return {"history": history}
+        return {"history": await get_repo().reputation_history(agent_id)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -403,27 +370,28 @@ class AgentStatus(BaseModel):
     activity: Optional[str] = None
 
 @app.post("/agents/status")
-def update_status(req: AgentStatus, agent: dict = Depends(verify_api_key)):
+async def update_status(req: AgentStatus, agent: dict = Depends(verify_api_key)):
     """Updates the real-time status of an agent."""
-    status_msg = {
-        "type": "agent_status",
-        "agent_id": agent["id"],
-        "name": agent["name"],
-        "status": req.status,
-        "activity": req.activity,
-        "timestamp": time.time()
-    }
-    
-    # Broadcast to all WebSocket clients
-    target_loop = app.state.main_loop if hasattr(app.state, 'main_loop') else None
-    if target_loop:
-        asyncio.run_coroutine_threadsafe(
-            manager.broadcast(status_msg),
-            target_loop
-        )
+    # Broadcast to all WebSocket clients only when something changed; a repeated
+    # status (e.g. a keep-alive from an HTTP-only agent) just refreshes presence
+    status_msg = presence.update(agent, req.status, req.activity)
+    if status_msg:
+        await manager.broadcast(status_msg)
     
     return {"status": "updated"}
 
+@app.get("/agents/presence")
+async def get_presence():
+    """Current status and online state of every agent seen since startup, from memory."""
+    return {"agents": presence.snapshot(), "ttl": presence.ttl}
+
+async def sweep_presence_periodically():
+    """Announces agents whose socket is gone and whose presence TTL has run out."""
+    while True:
+        await asyncio.sleep(max(presence.ttl / 4, 1))
+        for status_msg in presence.sweep():
+            await manager.broadcast(status_msg)
+
 # Pydantic Models
 class AgentRegisterRequest(BaseModel):
     type: str
@@ -455,11 +423,11 @@ class UserFeedbackRequest(BaseModel):
     user_id: Optional[str] = "browser-user"
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"status": "Marketplace API Online", "project": PROJECT_ID}
 
 @app.post("/agents/register")
-def register_agent(agent: AgentRegisterRequest):
+async def register_agent(agent: AgentRegisterRequest):
     # Registration Security Check
     if REGISTRATION_TOKEN and agent.registration_token != REGISTRATION_TOKEN:
         logger.warning(f"🚫 [Registration] Denied for {agent.name}. Invalid or missing token.")
@@ -467,15 +435,8 @@ def register_agent(agent: AgentRegisterRequest):
 
     # Deduplication: Check if agent with same name exists
     try:
-        # We use a synchronous query via asyncio.to_thread if we were async, but this is a sync route (def, not async def wrapper?)
-        # Wait, register_agent is defined as `def`, so it runs in a threadpool. We can use blocking calls directly.
-        existing_docs = get_db().collection("agents")\
-            .where("name", "==", agent.name)\
-            .where("type", "==", agent.type)\
-            .limit(1).stream()
-        
-        for doc in existing_docs:
-            existing = doc.to_dict()
+        existing = await get_repo().find_agent(agent.name, agent.type)
+        if existing:
             logger.info(f"♻️ [Registration] Found existing agent {existing['name']} ({existing['id']}). Returning existing keys.")
             return {
                 "agent_id": existing["id"], 
@@ -502,7 +463,7 @@ def register_agent(agent: AgentRegisterRequest):
     }
     
     try:
-        get_db().collection("agents").document(agent_id).set(agent_data)
+        await get_repo().create_agent(agent_id, agent_data)
         logger.info(f"🆕 [Registration] Created new agent {agent.name} ({agent_id})")
         return {"agent_id": agent_id, "api_key": api_key, "status": "Registered"}
     except Exception as e:
@@ -512,26 +473,23 @@ def register_agent(agent: AgentRegisterRequest):
 
 @app.get("/agents")
 @app.get("/market/agents")
-def get_agents():
+async def get_agents():
     try:
-        docs = get_db().collection("agents").stream()
-        return [doc.to_dict() for doc in docs]
+        return await get_repo().list_agents()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/market/feed")
-def get_market_feed(limit: int = 20):
+async def get_market_feed(limit: int = 20):
     try:
-        docs = get_db().collection("offers").order_by("created_at", direction=firestore.Query.DESCENDING).limit(limit).stream()
-        return {"feed": [doc.to_dict() for doc in docs]}
+        return {"feed": await get_repo().recent_offers(limit)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/market/negotiations")
-def get_negotiations(limit: int = 20):
+async def get_negotiations(limit: int = 20):
     try:
-        docs = get_db().collection("negotiations").order_by("timestamp", direction=firestore.Query.DESCENDING).limit(limit).stream()
-        return {"negotiations": [doc.to_dict() for doc in docs]}
+        return {"negotiations": await get_repo().recent_negotiations(limit)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -557,7 +515,10 @@ async def post_request(req: MarketRequest, agent: dict = Depends(verify_api_key)
         }
         
         # Persist to market_items collection for late arrivals
-        get_db().collection("market_items").add(payload)
+        item_id = await get_repo().add_market_item(payload)
+        # Sellers key their negotiation (and dashboards their order book row) on this id
+        payload["id"] = item_id
+        order_book.upsert(item_id, payload)
 
         data = json.dumps(payload).encode("utf-8")
         app.state.publisher.publish(app.state.topic_path, data)
@@ -570,20 +531,28 @@ async def post_request(req: MarketRequest, agent: dict = Depends(verify_api_key)
         logger.exception("❌ Failed to publish market request")
         raise HTTPException(status_code=500, detail="Failed to publish market request")
 
+async def get_negotiation_state(negotiation_id: str):
+    """Returns the hot state of a negotiation, rebuilding it from Firestore on a cache miss."""
+    state = negotiation_states.get(negotiation_id)
+    if state is not None:
+        return state
+    history = await get_repo().negotiation_history(negotiation_id)
+    return negotiation_states.load(negotiation_id, history)
+
 @app.post("/market/negotiate")
 async def negotiate(action: NegotiationAction, agent: dict = Depends(verify_api_key)):
     # Generate ID if starting new negotiation
     if not action.negotiation_id:
         action.negotiation_id = f"neg-{uuid.uuid4().hex[:8]}"
+        negotiation_states.load(action.negotiation_id, [])
 
     # Fetch product name from offer to enrich the payload
     product_name = "Unknown Service"
+    offer_data = None
     try:
-        offer_snap = await asyncio.to_thread(
-            lambda: get_db().collection("offers").document(action.offer_id).get()
-        )
-        if offer_snap.exists:
-            product_name = offer_snap.to_dict().get("product", "Unknown Service")
+        offer_data = await get_repo().get_offer(action.offer_id)
+        if offer_data:
+            product_name = offer_data.get("product", "Unknown Service")
         else:
             logger.warning(f"⚠️ [Negotiation] Offer {action.offer_id} not found in DB!")
             # Fallback: Maybe it's in market_items?
@@ -596,6 +565,7 @@ async def negotiate(action: NegotiationAction, agent: dict = Depends(verify_api_
         "negotiation_id": action.negotiation_id,
         "offer_id": action.offer_id,
         "product": product_name,
+        "category": (offer_data or {}).get("category") or agent.get("category") or DEFAULT_CATEGORY,
         "sender_id": agent["id"],
         "receiver_id": action.receiver_id,
         "action": action.action,
@@ -606,13 +576,11 @@ async def negotiate(action: NegotiationAction, agent: dict = Depends(verify_api_
         "source": "external_api"
     }
     
-    # Enforce Max Steps to prevent infinite loops
+    # Enforce Max Steps to prevent infinite loops (O(1) lookup in the negotiation state table)
+    neg_state = None
     try:
-        # fast count query
-        # Use a lambda to wrap the count query execution
-        current_steps = await asyncio.to_thread(
-            lambda: get_db().collection("negotiations").where("negotiation_id", "==", action.negotiation_id).count().get()[0][0].value
-        )
+        neg_state = await get_negotiation_state(action.negotiation_id)
+        current_steps = neg_state.steps
         
         if current_steps >= MAX_NEGOTIATION_STEPS and action.action not in ["ACCEPT", "REJECT"]:
             logger.warning(f"🛑 [Negotiation] Max steps reached for {action.negotiation_id}. Rejecting further counters.")
@@ -641,55 +609,23 @@ async def negotiate(action: NegotiationAction, agent: dict = Depends(verify_api_
 
     
     try:
-        # Persist to Firestore for history
-        await asyncio.to_thread(
-            lambda: get_db().collection("negotiations").document().set(payload)
-        )
-        
         # If deal is accepted, verify price integrity and create a transaction record
         if action.action == "ACCEPT":
             # P0 Fix: Verify that the accepted price matches the last negotiation state
-            try:
-                # Fetch last 2 messages for this negotiation to find the counterpart's price
-                # Fetch all messages for this negotiation and sort in memory to avoid composite index requirement
-                # distinct on "negotiation_id" + Sort "timestamp" requires an index we want to avoid.
-                history_query = await asyncio.to_thread(
-                    lambda: get_db().collection("negotiations")\
-                                      .where("negotiation_id", "==", action.negotiation_id)\
-                                      .stream()
-                )
-                
-                # Convert to list and sort descending
-                history_docs = [doc for doc in history_query]
-                history_docs.sort(key=lambda x: x.to_dict().get("timestamp", 0), reverse=True)
-                history_query = history_docs[:2] # Keep api compatible with loop below
-                
-                valid_price = False
-                for doc in history_query:
-                    h = doc.to_dict()
-                    # It must be a price proposed by someone else (the receiver of the ACCEPT)
-                    if h.get("sender_id") == action.receiver_id and h.get("price") == action.price:
-                        valid_price = True
-                        break
-                
-                # Also check the initial offer if it's the first response
-                if not valid_price:
-                    offer_snap = await asyncio.to_thread(
-                        lambda: get_db().collection("offers").document(action.offer_id).get()
-                    )
-                    if offer_snap.exists and offer_snap.to_dict().get("price") == action.price:
-                        valid_price = True
-                
-                if not valid_price:
-                    logger.warning(f"⚠️ [Security] Price mismatch for {action.negotiation_id}! Accepted: {action.price}")
-                    raise HTTPException(status_code=400, detail="Price integrity check failed. Accepted price must match last proposal.")
-                    
-            except HTTPException:
-                raise
-            except Exception as e:
-                logger.exception(f"⚠️ [Security] Failed to verify price history")
+            if neg_state is None:
+                logger.error(f"⚠️ [Security] No negotiation state for {action.negotiation_id}; cannot verify price")
                 raise HTTPException(status_code=500, detail="Internal integrity check failure")
 
+            # It must be a price proposed by someone else (the receiver of the ACCEPT),
+            # or the initial offer price if this is the first response
+            valid_price = neg_state.last_proposals.get(action.receiver_id) == action.price
+            if not valid_price and offer_data is not None:
+                valid_price = offer_data.get("price") == action.price
+            
+            if not valid_price:
+                logger.warning(f"⚠️ [Security] Price mismatch for {action.negotiation_id}! Accepted: {action.price}")
+                raise HTTPException(status_code=400, detail="Price integrity check failed. Accepted price must match last proposal.")
+
             tx_id = f"tx-{uuid.uuid4().hex[:8]}"
             tx_data = {
                 "id": tx_id,
@@ -713,11 +649,14 @@ async def negotiate(action: NegotiationAction, agent: dict = Depends(verify_api_
                 tx_data["buyer_id"] = agent["id"]
                 tx_data["seller_id"] = action.receiver_id
 
-            await asyncio.to_thread(
-                lambda: get_db().collection("transactions").document(tx_id).set(tx_data)
-            )
+            # The closing step and its transaction land atomically in one batch
+            await get_repo().record_acceptance(payload, tx_id, tx_data)
             logger.info(f"💰 [Server] Transaction created: {tx_id} for {action.price} USDC")
             # Note: Broadast and Reputation are now handled by on_transaction_snap
+        else:
+            # Persist to Firestore for history (group-committed with concurrent steps)
+            await get_repo().add_negotiation_step(payload)
+        negotiation_states.record(payload)
 
         # Broadcast via Pub/Sub for real-time
         # Publisher calls are generally fast but we can thread them too if needed, usually not blocking IO in the same way
@@ -766,13 +705,8 @@ async def negotiate(action: NegotiationAction, agent: dict = Depends(verify_api_
         if action.action in ["ACCEPT", "REJECT"]:
             involved = [agent["id"], action.receiver_id]
             logger.info(f"🚀 [Server] Scheduling analysis for {action.negotiation_id}...")
-            
-            target_loop = app.state.main_loop if hasattr(app.state, 'main_loop') else None
-            # Use background tasks properly
-            if target_loop:
-                asyncio.run_coroutine_threadsafe(analyze_negotiation(action.negotiation_id, involved), target_loop)
-            else:
-                 asyncio.create_task(analyze_negotiation(action.negotiation_id, involved))
+            # Bounded, rate-limited and deduplicated by negotiation_id
+            coach.submit(action.negotiation_id, involved)
 
         return {"status": "Action Sent", "payload": payload}
     except HTTPException:
@@ -793,18 +727,11 @@ async def submit_feedback(req: UserFeedbackRequest):
     
     try:
         # Save to Firestore
-        await asyncio.to_thread(
-            lambda: get_db().collection("user_feedback").document().set(feedback_data)
-        )
+        await get_repo().add_user_feedback(feedback_data)
         logger.info(f"⭐ [Feedback] User rated negotiation {req.negotiation_id}: {req.rating}/5")
         
         # Broadcast feedback event to update UI in real-time if needed
-        target_loop = app.state.main_loop if hasattr(app.state, 'main_loop') else None
-        if target_loop:
-            asyncio.run_coroutine_threadsafe(
-                manager.broadcast({"type": "user_feedback_received", "data": feedback_data}),
-                target_loop
-            )
+        await manager.broadcast({"type": "user_feedback_received", "data": feedback_data})
             
         return {"status": "Feedback Received", "data": feedback_data}
     except Exception as e:
@@ -812,31 +739,25 @@ async def submit_feedback(req: UserFeedbackRequest):
         raise HTTPException(status_code=500, detail="Feedback submission failed")
 
 @app.get("/feedback/history")
-def get_feedback_history(limit: int = 20):
+async def get_feedback_history(limit: int = 20):
     """Fetches combined history of coach and user feedback (Fixed global sort)."""
     try:
         # Fetch larger buffer from both to ensure we get a neutral mix after merging
         # We fetch 'limit' from EACH to ensure we have enough even if one source is empty
         buffer_limit = limit 
         
-        # Fetch Coach feedback
-        coach_docs = get_db().collection("agent_feedback")\
-                            .order_by("timestamp", direction=firestore.Query.DESCENDING)\
-                            .limit(buffer_limit).stream()
-        
-        # Fetch User feedback
-        user_docs = get_db().collection("user_feedback")\
-                           .order_by("timestamp", direction=firestore.Query.DESCENDING)\
-                           .limit(buffer_limit).stream()
+        # Fetch Coach and User feedback concurrently
+        coach_docs, user_docs = await asyncio.gather(
+            get_repo().recent_feedback("agent_feedback", buffer_limit),
+            get_repo().recent_feedback("user_feedback", buffer_limit)
+        )
         
         feedback = []
-        for d in coach_docs:
-            data = d.to_dict()
+        for data in coach_docs:
             data["source"] = "Market Coach"
             feedback.append(data)
             
-        for d in user_docs:
-            data = d.to_dict()
+        for data in user_docs:
             data["source"] = "User"
             feedback.append(data)
             
@@ -848,19 +769,18 @@ def get_feedback_history(limit: int = 20):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/market/trends")
-def get_market_trends(limit: int = 500):
+async def get_market_trends(limit: int = 500):
     """Fetches historical price data optimized via denormalization (in-memory sort for reliability)."""
     try:
         logger.info(f"📊 [Trends] Fetching limit={limit}")
-        # Optimized query with server-side limit and sort
-        tx_docs = get_db().collection("transactions")\
-                         .order_by("timestamp", direction=firestore.Query.DESCENDING)\
-                         .limit(limit)\
-                         .stream()
+        # Served from the listener-fed trade buffer; query only on cold start or oversized limits
+        tx_docs = candles.latest_trades(limit) if candles.ready else None
+        if tx_docs is None:
+            # Optimized query with server-side limit and sort
+            tx_docs = await get_repo().recent_transactions(limit)
         
         trends = []
-        for doc in tx_docs:
-            tx = doc.to_dict()
+        for tx in tx_docs:
             # logger.info(f"Debug TX: {tx.get('id')} - {tx.get('amount')}")
             trends.append({
                 "timestamp": tx.get("timestamp"),
@@ -882,46 +802,148 @@ def get_market_trends(limit: int = 500):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/market/candles")
+async def get_market_candles(product: str, resolution: str = "1m", start: Optional[float] = None,
+                             end: Optional[float] = None, limit: int = 500):
+    """OHLCV + VWAP candles for one product, oldest first. `start`/`end` are unix timestamps."""
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of: {', '.join(RESOLUTIONS)}")
+    if not candles.ready:
+        raise HTTPException(status_code=503, detail="Candles are still warming up")
+    return {
+        "product": product,
+        "resolution": resolution,
+        "candles": candles.candles(product, resolution, start=start, end=end, limit=limit)
+    }
+
 def get_db():
+    """Sync client, used only by the snapshot listeners (the async client cannot watch)."""
     if not hasattr(app.state, 'db') or app.state.db is None:
         app.state.db = firestore.Client(project=PROJECT_ID)
     return app.state.db
 
+def get_repo():
+    """Async data layer used by every request handler and background task."""
+    if not hasattr(app.state, 'repo') or app.state.repo is None:
+        app.state.repo = MarketRepository(firestore.AsyncClient(project=PROJECT_ID))
+    return app.state.repo
+
+# Scripted agents produce many identical transcripts; their analyses are reused
+coach_cache = LLMCache()
+
 def get_coach_model():
     if not hasattr(app.state, 'coach_model') or app.state.coach_model is None:
         vertexai.init(project=PROJECT_ID, location=REGION)
         app.state.coach_model = GenerativeModel(MODEL_NAME)
     return app.state.coach_model
 
+COACH_GOALS = """
+        Goals:
+        - Identify if the Buyer overpaid or if the Seller left money on the table.
+        - Critique their negotiation tactics (e.g. anchoring, mirroring, concessions).
+        - Provide one specific improvement tip for EACH agent.
+"""
+
+COACH_FEEDBACK_SCHEMA = """{
+          "buyer_feedback": "Short critique for the buyer",
+          "seller_feedback": "Short critique for the seller",
+          "strategy_score": 1-10
+        }"""
+
+def coach_fallback_analysis():
+    return {
+        "buyer_feedback": "Could not parse feedback.",
+        "seller_feedback": "Could not parse feedback.",
+        "strategy_score": 5
+    }
+
+def format_transcript(history: List[dict]) -> str:
+    return "\n".join([
+        f"{'Buyer' if 'buyer' in h['sender_id'] else 'Seller'}: {h['action']} ${h.get('price')} - reasoning: {h.get('reasoning')}"
+        for h in history
+    ])
+
+def parse_coach_json(text: str) -> Optional[dict]:
+    clean_text = text.replace("```json", "").replace("```", "").strip()
+    try:
+        return json.loads(clean_text)
+    except json.JSONDecodeError:
+        logger.warning(f"⚠️ [Coach] JSON Parse Error. Raw: {clean_text}")
+        return None
+
+async def fetch_transcript(negotiation_id: str) -> Optional[str]:
+    logger.info(f"🔍 [Coach] Fetching history for {negotiation_id}...")
+    history = await get_repo().negotiation_history(negotiation_id)
+    if not history:
+        logger.warning(f"⚠️ [Coach] No history found for {negotiation_id}")
+        return None
+    return format_transcript(history)
+
+async def deliver_coach_report(negotiation_id: str, involved_agents: List[str], analysis: dict):
+    """Enriches an analysis with its transaction, persists it and delivers it to agents and dashboards."""
+    repo = get_repo()
+
+    # Fetch Transaction Details (Product, Price, ID)
+    tx_details = {}
+    try:
+        tx_data = await repo.transaction_for_negotiation(negotiation_id)
+        if tx_data:
+            tx_details = {
+                "product": tx_data.get("product"),
+                "price": tx_data.get("amount"),
+                "transaction_id": tx_data.get("id")
+            }
+        else:
+             logger.warning(f"⚠️ [Coach] No transaction found for {negotiation_id}")
+    except Exception as e:
+        logger.warning(f"⚠️ [Coach] Failed to fetch transaction details: {e}")
+
+    # Prepare Report
+    report = {
+        "type": "feedback_report",
+        "negotiation_id": negotiation_id,
+        "involved_agents": involved_agents,
+        "feedback": analysis,
+        "timestamp": time.time(),
+        **tx_details
+    }
+
+    # Save to Firestore (Coach Persistence)
+    await repo.add_coach_feedback(report)
+    logger.info(f"💾 [Coach] Feedback persisted to Firestore for {negotiation_id}")
+
+    # Hybrid Feedback Delivery
+    # A. Private Signal (Targeted to Agents)
+    for agent_id in involved_agents:
+        await manager.send_to_agent(agent_id, report)
+    
+    # B. Public Signal (Broadcast to Dashboard)
+    await manager.broadcast(report)
+    
+    logger.info(f"📡 [Coach] Feedback Sent: Private->{involved_agents}, Public->Dashboard for {negotiation_id}")
+
+async def report_analysis_error(negotiation_id: str):
+    # Broadcast failure to UI
+    await manager.broadcast({
+        "type": "analysis_error", 
+        "negotiation_id": negotiation_id,
+        "error": "Negotiation analysis encountered an internal error."
+    })
+
 async def analyze_negotiation(negotiation_id: str, involved_agents: List[str]):
     """Background task to analyze a finished negotiation and send feedback."""
     logger.info(f"🎬 [Coach] Starting analysis for negotiation: {negotiation_id}")
-    await asyncio.sleep(2) # Brief delay
     
     try:
-        current_db = get_db()
         current_model = get_coach_model()
         if not current_model:
             logger.warning(f"⚠️ [Coach] Skipping analysis for {negotiation_id} (Model not available)")
             return
 
         # 1. Fetch history
-        logger.info(f"🔍 [Coach] Fetching history for {negotiation_id}...")
-        docs = current_db.collection("negotiations")\
-                 .where("negotiation_id", "==", negotiation_id)\
-                 .stream()
-        
-        history = [doc.to_dict() for doc in docs]
-        history.sort(key=lambda x: x["timestamp"])
-        
-        if not history:
-            logger.warning(f"⚠️ [Coach] No history found for {negotiation_id}")
+        transcript = await fetch_transcript(negotiation_id)
+        if transcript is None:
             return
-            
-        transcript = "\n".join([
-            f"{'Buyer' if 'buyer' in h['sender_id'] else 'Seller'}: {h['action']} ${h.get('price')} - reasoning: {h.get('reasoning')}"
-            for h in history
-        ])
         
         # 2. Consult Gemini Coach
         prompt = f"""
@@ -930,104 +952,85 @@ async def analyze_negotiation(negotiation_id: str, involved_agents: List[str]):
         
         Transcript:
         {transcript}
-        
-        Goals:
-        - Identify if the Buyer overpaid or if the Seller left money on the table.
-        - Critique their negotiation tactics (e.g. anchoring, mirroring, concessions).
-        - Provide one specific improvement tip for EACH agent.
-        
+        {COACH_GOALS}
         Output strict JSON:
-        {{
-          "buyer_feedback": "Short critique for the buyer",
-          "seller_feedback": "Short critique for the seller",
-          "strategy_score": 1-10
-        }}
+        {COACH_FEEDBACK_SCHEMA}
         """
         
-        # FIX: Offload blocking synchronous call to a thread
-        response = await asyncio.to_thread(current_model.generate_content, prompt)
-        
-        clean_text = response.text.replace("```json", "").replace("```", "").strip()
-        try:
-            analysis = json.loads(clean_text)
-        except json.JSONDecodeError:
-            logger.warning(f"⚠️ [Coach] JSON Parse Error. Raw: {clean_text}")
-            analysis = {
-                "buyer_feedback": "Could not parse feedback.",
-                "seller_feedback": "Could not parse feedback.",
-                "strategy_score": 5
-            }
-        
-        # 2.5 Fetch Transaction Details (Product, Price, ID)
-        tx_details = {}
-        try:
-            # Run blocking Firestore query in thread
-            tx_docs = await asyncio.to_thread(
-                lambda: list(current_db.collection("transactions")
-                             .where("negotiation_id", "==", negotiation_id)
-                             .limit(1)
-                             .stream())
-            )
-            if tx_docs:
-                tx_data = tx_docs[0].to_dict()
-                tx_details = {
-                    "product": tx_data.get("product"),
-                    "price": tx_data.get("amount"),
-                    "transaction_id": tx_data.get("id")
-                }
-            else:
-                 logger.warning(f"⚠️ [Coach] No transaction found for {negotiation_id}")
-        except Exception as e:
-            logger.warning(f"⚠️ [Coach] Failed to fetch transaction details: {e}")
-
-        # 3. Prepare Report
-        report = {
-            "type": "feedback_report",
-            "negotiation_id": negotiation_id,
-            "involved_agents": involved_agents,
-            "feedback": analysis,
-            "timestamp": time.time(),
-            **tx_details
-        }
-
-        # 4. Save to Firestore (Coach Persistence)
-        await asyncio.to_thread(
-            lambda: get_db().collection("agent_feedback").document().set(report)
+        # Blocking SDK call runs on the coach's dedicated executor (cache hits skip it entirely)
+        response_text = await coach.run_blocking(
+            coach_cache.get_or_generate, MODEL_NAME, prompt,
+            lambda p: current_model.generate_content(p).text, is_json_response
         )
-        logger.info(f"💾 [Coach] Feedback persisted to Firestore for {negotiation_id}")
-
-        # 5. Hybrid Feedback Delivery
-        target_loop = app.state.main_loop if hasattr(app.state, 'main_loop') else None
-        if target_loop:
-            # A. Private Signal (Targeted to Agents)
-            for agent_id in involved_agents:
-                 asyncio.run_coroutine_threadsafe(
-                    manager.send_to_agent(agent_id, report),
-                    target_loop
-                )
-            
-            # B. Public Signal (Broadcast to Dashboard)
-            asyncio.run_coroutine_threadsafe(
-                manager.broadcast(report),
-                target_loop
-            )
-            
-            logger.info(f"📡 [Coach] Feedback Sent: Private->{involved_agents}, Public->Dashboard for {negotiation_id}")
+        analysis = parse_coach_json(response_text) or coach_fallback_analysis()
+
+        # 3. Persist and deliver
+        await deliver_coach_report(negotiation_id, involved_agents, analysis)
 
     except Exception as e:
         logger.exception(f"⚠️ [Coach] Analysis failed for {negotiation_id}")
+        await report_analysis_error(negotiation_id)
+
+async def analyze_negotiations(batch: List[tuple]):
+    """Batch mode: one LLM request covering several finished negotiations.
+
+    The fixed instruction block is sent once; the model answers with one JSON
+    object keyed by negotiation_id, which is split back into per-negotiation
+    feedback_report events.
+    """
+    ids = [negotiation_id for negotiation_id, _ in batch]
+    logger.info(f"🎬 [Coach] Starting batched analysis for {len(ids)} negotiations: {', '.join(ids)}")
+    try:
+        current_model = get_coach_model()
+        if not current_model:
+            logger.warning(f"⚠️ [Coach] Skipping analysis for {', '.join(ids)} (Model not available)")
+            return
+
+        transcripts = await asyncio.gather(*[fetch_transcript(negotiation_id) for negotiation_id in ids])
+        pending = [(negotiation_id, involved, transcript)
+                   for (negotiation_id, involved), transcript in zip(batch, transcripts) if transcript is not None]
+        if not pending:
+            return
+
+        sections = "\n\n".join(
+            f"        Negotiation {negotiation_id}:\n{transcript}" for negotiation_id, _, transcript in pending
+        )
+        prompt = f"""
+        You are a neutral 'Marketplace Coach'. 
+        Analyze each of the following negotiation transcripts between a Buyer and a Seller independently.
         
-        # Broadcast failure to UI
-        target_loop = app.state.main_loop if hasattr(app.state, 'main_loop') else None
-        if target_loop:
-            asyncio.run_coroutine_threadsafe(
-                manager.broadcast({
-                    "type": "analysis_error", 
-                    "negotiation_id": negotiation_id,
-                    "error": "Negotiation analysis encountered an internal error."
-                }),
-                target_loop
-            )
+{sections}
+        {COACH_GOALS}
+        Output strict JSON: one object whose keys are the negotiation ids above, each mapping to
+        {COACH_FEEDBACK_SCHEMA}
+        """
+
+        response_text = await coach.run_blocking(
+            coach_cache.get_or_generate, MODEL_NAME, prompt,
+            lambda p: current_model.generate_content(p).text, is_json_response
+        )
+        analyses = parse_coach_json(response_text)
+        if not isinstance(analyses, dict):
+            analyses = {}
+    except Exception as e:
+        logger.exception(f"⚠️ [Coach] Batched analysis failed for {', '.join(ids)}")
+        await asyncio.gather(*[report_analysis_error(negotiation_id) for negotiation_id in ids])
+        return
+
+    async def deliver(negotiation_id, involved):
+        analysis = analyses.get(negotiation_id)
+        if not isinstance(analysis, dict):
+            logger.warning(f"⚠️ [Coach] Batched response had no entry for {negotiation_id}")
+            analysis = coach_fallback_analysis()
+        try:
+            await deliver_coach_report(negotiation_id, involved, analysis)
+        except Exception:
+            logger.exception(f"⚠️ [Coach] Delivery failed for {negotiation_id}")
+            await report_analysis_error(negotiation_id)
+
+    await asyncio.gather(*[deliver(negotiation_id, involved) for negotiation_id, involved, _ in pending])
+
+coach = CoachQueue(analyze_negotiation, analyze_batch=analyze_negotiations)
 
 class MarketOffer(BaseModel):
     buyer_id: str
@@ -1063,9 +1066,8 @@ async def post_offer(req: MarketOffer, agent: dict = Depends(verify_api_key)):
         # Also persist to market_items for consistency (though offers are targeted)
         # We can query them later if needed.
         offer_data["type"] = "Offer" # Ensure type is set for consistency
-        get_db().collection("market_items").document(offer_id).set(offer_data)
-
-        get_db().collection("offers").document(offer_id).set(offer_data)
+        await get_repo().create_offer(offer_id, offer_data)
+        order_book.upsert(offer_id, offer_data)
         
         # Immediate local broadcast for speed
         await manager.broadcast({"type": "market_event", "data": offer_data})
@@ -1075,17 +1077,56 @@ async def post_offer(req: MarketOffer, agent: dict = Depends(verify_api_key)):
         logger.exception("❌ Failed to create offer")
         raise HTTPException(status_code=500, detail=str(e))
 
+# WebSocket command name -> (request model, REST handler it shares)
+WS_COMMANDS = {
+    "negotiate": (NegotiationAction, negotiate),
+    "post_offer": (MarketOffer, post_offer),
+    "post_request": (MarketRequest, post_request),
+    "update_status": (AgentStatus, update_status),
+}
+
+async def handle_ws_command(websocket: WebSocket, agent: Optional[dict], msg: dict):
+    """Runs a command frame through its REST handler and replies with the same correlation id.
+
+    The socket was authenticated once by `identify`, so the per-request API
+    key lookup is skipped. Errors come back as the status and detail the REST
+    route would have returned.
+    """
+    reply = {"type": "command_result", "id": msg.get("id"), "command": msg.get("command")}
+    try:
+        if agent is None:
+            raise HTTPException(status_code=401, detail="Identify before sending commands")
+        spec = WS_COMMANDS.get(msg.get("command"))
+        if spec is None:
+            raise HTTPException(status_code=400, detail=f"Unknown command '{msg.get('command')}'")
+        model, handler = spec
+        try:
+            body = model(**(msg.get("payload") or {}))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        reply.update(ok=True, status=200, result=await handler(body, agent=agent))
+    except HTTPException as e:
+        reply.update(ok=False, status=e.status_code, detail=e.detail)
+    except Exception as e:
+        logger.exception(f"❌ [WS] Command {msg.get('command')} failed")
+        reply.update(ok=False, status=500, detail=str(e))
+    await manager.send_to_socket(websocket, reply)
+
 @app.get("/market/active")
-async def get_active_market_items():
-    """Returns currently active requests and offers."""
+async def get_active_market_items(category: Optional[str] = None, product: Optional[str] = None):
+    """Returns currently active requests and offers, served from the in-memory order book."""
+    if order_book.ready:
+        return {"items": order_book.active(category=category, product=product)}
+
+    # Cold start: the market_items listener has not delivered its first snapshot yet
     try:
         now = time.time()
         # Query for items that are valid_until > now
-        docs = get_db().collection("market_items")\
-            .where("valid_until", ">", now)\
-            .stream()
-            
-        items = [doc.to_dict() for doc in docs]
+        items = await get_repo().active_market_items(now)
+        if category is not None:
+            items = [i for i in items if (i.get("category") or DEFAULT_CATEGORY) == category]
+        if product is not None:
+            items = [i for i in items if (i.get("product") or i.get("item")) == product]
         return {"items": items}
     except Exception as e:
          logger.exception("❌ Failed to fetch active market items")
@@ -1099,6 +1140,7 @@ async def startup_event():
     # Initialize GCP/Vertex inside the loop process
     try:
         app.state.db = firestore.Client(project=PROJECT_ID)
+        app.state.repo = MarketRepository(firestore.AsyncClient(project=PROJECT_ID))
         
         # Initialize Pub/Sub
         TEST_MODE = os.getenv("AGENT_MKT_TEST_MODE", "false").lower() == "true"
@@ -1121,15 +1163,38 @@ async def startup_event():
     except Exception as e:
         logger.warning(f"⚠️ Warning: GCP/Vertex initialization failed: {e}")
 
-    # Run setup_listeners in background
+    # Run setup_listeners in background (the worker pool must exist before their first callback)
+    workers.start()
+    coach.start()
     loop.run_in_executor(None, setup_listeners, loop)
+    app.state.compactor = asyncio.create_task(compact_reputation_periodically())
+    app.state.presence_sweeper = asyncio.create_task(sweep_presence_periodically())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Land negotiation steps still waiting for their group commit
+    if getattr(app.state, "repo", None) is not None:
+        await app.state.repo.writes.close()
 
 @app.get("/debug/connections")
 def debug_connections():
     return {
         "active_count": len(manager.active_connections),
         "agent_mapped_count": len(manager.agent_map),
-        "clients": [f"{ws.client.host}:{ws.client.port}" for ws in manager.active_connections]
+        "order_book_items": len(order_book),
+        "negotiation_states": len(negotiation_states),
+        "candle_products": len(candles.products()),
+        "clients": [f"{ws.client.host}:{ws.client.port}" for ws in manager.active_connections],
+        "channels": manager.channel_stats(),
+        "event_log": manager.events.stats(),
+        "mailboxes": manager.mailboxes.stats(),
+        "presence": presence.stats(),
+        "viewer_feed": manager.viewer_feed.stats(),
+        "workers": workers.stats(),
+        "coach": coach.stats(),
+        "coach_cache": coach_cache.stats(),
+        "listeners": {name: cp.stats() for name, cp in listener_checkpoints.items()},
+        "writes": app.state.repo.writes.stats() if getattr(app.state, "repo", None) else None
     }
 
 if __name__ == "__main__":
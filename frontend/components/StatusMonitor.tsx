@@ -34,6 +34,19 @@ export default function StatusMonitor() {
                             total_transactions: agent.total_transactions || 0
                         };
                     });
+                    // Live status and online state come from the server's presence table
+                    const presenceRes = await fetch(getApiUrl('/agents/presence'));
+                    if (presenceRes.ok) {
+                        const presence = await presenceRes.json();
+                        const known: Record<string, any> = {};
+                        presence.agents.forEach((entry: any) => { known[entry.agent_id] = entry; });
+                        Object.keys(initialAgents).forEach((id) => {
+                            const entry = known[id];
+                            initialAgents[id] = entry
+                                ? { ...initialAgents[id], status: entry.status, activity: entry.activity || initialAgents[id].activity, timestamp: entry.last_seen || now }
+                                : { ...initialAgents[id], status: 'OFFLINE', activity: 'Offline' };
+                        });
+                    }
                     // Merge, don't overwrite if WS already populated something
                     setAgents(prev => ({ ...initialAgents, ...prev }));
                 }
@@ -68,7 +81,8 @@ export default function StatusMonitor() {
         return unsubscribe;
     }, [subscribe]);
 
-    // Update agent status based on heartbeat and cleanup ghosts
+    // Cleanup ghosts. The server announces OFFLINE itself (presence TTL), and agents
+    // no longer send periodic heartbeats, so silence alone doesn't mean offline.
     useEffect(() => {
         const interval = setInterval(() => {
             const now = Date.now() / 1000;
@@ -80,16 +94,10 @@ export default function StatusMonitor() {
                     if (!agent) return;
 
                     const lastSeen = agent.timestamp || 0;
-                    const timeSinceHeartbeat = now - lastSeen;
-
-                    // Mark OFFLINE if > 45s silence (was 15s)
-                    if (timeSinceHeartbeat > 45 && agent.status !== 'OFFLINE') {
-                        next[id] = { ...agent, status: 'OFFLINE', activity: 'Offline (Last seen > 45s ago)' };
-                        changed = true;
-                    }
+                    const timeSinceUpdate = now - lastSeen;
 
-                    // Remove completely if > 300s silence (was 30s)
-                    if (timeSinceHeartbeat > 300) {
+                    // Remove completely once OFFLINE for > 300s
+                    if (agent.status === 'OFFLINE' && timeSinceUpdate > 300) {
                         delete next[id];
                         changed = true;
                     }
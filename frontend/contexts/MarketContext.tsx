@@ -61,7 +61,8 @@ export function MarketProvider({ children }: { children: ReactNode }) {
 
         ws.onopen = () => {
             console.log('WS Connection Open. Sending identification...');
-            ws.send(JSON.stringify({ type: 'identify_view' }));
+            // Batched viewer tier: conflated updates at a fixed cadence instead of every event
+            ws.send(JSON.stringify({ type: 'identify_view', batch: true }));
             setWsStatus('CONNECTED');
         };
 
@@ -87,8 +88,10 @@ export function MarketProvider({ children }: { children: ReactNode }) {
         ws.onmessage = (event) => {
             try {
                 const msg = JSON.parse(event.data) as WSMessage;
+                // Unpack batches so listeners keep seeing individual events
+                const events: WSMessage[] = msg.type === 'batch' ? (msg.events || []) : [msg];
                 // Broadcast to listeners
-                listenersRef.current.forEach(listener => listener(msg));
+                events.forEach(e => listenersRef.current.forEach(listener => listener(e)));
             } catch (e) {
                 console.error('Failed to parse WS message:', e);
             }
@@ -9,6 +9,7 @@ export interface WSMessage {
     status?: string;
     activity?: string;
     timestamp?: number;
+    events?: WSMessage[];
 }
 
 export interface FeedbackReport {
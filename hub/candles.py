@@ -0,0 +1,155 @@
+import bisect
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+RESOLUTIONS = {"1m": 60, "5m": 300, "1h": 3600}
+
+
+class Candle:
+    """One OHLCV bucket. Open/close follow trade timestamps, not arrival order."""
+
+    __slots__ = ("start", "open", "high", "low", "close", "volume", "notional", "trades", "open_ts", "close_ts")
+
+    def __init__(self, start: int, price: float, quantity: float, ts: float):
+        self.start = start
+        self.open = self.high = self.low = self.close = price
+        self.volume = quantity
+        self.notional = price * quantity
+        self.trades = 1
+        self.open_ts = self.close_ts = ts
+
+    def add(self, price: float, quantity: float, ts: float):
+        if ts < self.open_ts:
+            self.open, self.open_ts = price, ts
+        if ts >= self.close_ts:
+            self.close, self.close_ts = price, ts
+        self.high = max(self.high, price)
+        self.low = min(self.low, price)
+        self.volume += quantity
+        self.notional += price * quantity
+        self.trades += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "t": self.start,
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "volume": self.volume,
+            "vwap": self.notional / self.volume if self.volume else self.close,
+            "trades": self.trades,
+        }
+
+
+class CandleSeries:
+    """Candles of one product at one resolution, kept sorted by bucket start."""
+
+    def __init__(self, width: int, max_buckets: int):
+        self.width = width
+        self.max_buckets = max_buckets
+        self.starts: List[int] = []
+        self.candles: Dict[int, Candle] = {}
+
+    def add(self, price: float, quantity: float, ts: float):
+        start = int(ts // self.width) * self.width
+        candle = self.candles.get(start)
+        if candle is not None:
+            candle.add(price, quantity, ts)
+            return
+        if len(self.starts) >= self.max_buckets and start < self.starts[0]:
+            return  # Older than the retained window
+        bisect.insort(self.starts, start)
+        self.candles[start] = Candle(start, price, quantity, ts)
+        while len(self.starts) > self.max_buckets:
+            del self.candles[self.starts.pop(0)]
+
+    def range(self, start: Optional[float], end: Optional[float], limit: int) -> List[dict]:
+        lo = 0 if start is None else bisect.bisect_left(self.starts, int(start // self.width) * self.width)
+        hi = len(self.starts) if end is None else bisect.bisect_right(self.starts, end)
+        lo = max(lo, hi - limit)
+        return [self.candles[s].to_dict() for s in self.starts[lo:hi]]
+
+
+class CandleStore:
+    """Per-product OHLCV + VWAP candles at 1m/5m/1h, maintained from the transaction listener.
+
+    Every completed transaction is folded into each resolution exactly once
+    (deduplicated by transaction id, since snapshot listeners redeliver
+    documents on MODIFIED and on reconnect). The most recent transactions of
+    any status are also kept verbatim, latest version per id, so
+    `/market/trends` can be answered without a query.
+    """
+
+    def __init__(self, max_buckets: int = 1440, recent_size: int = 500, seen_size: int = 50000):
+        self.max_buckets = max_buckets
+        self.ready = False
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], CandleSeries] = {}
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._seen_size = seen_size
+        self.recent_size = recent_size
+        self._recent_keys: List[float] = []  # Timestamps of the retained trades, ascending
+        self._recent: List[dict] = []
+
+    def ingest(self, tx: dict) -> bool:
+        """Folds one transaction document into the candles. Returns False for duplicates and non-trades."""
+        tx_id = tx.get("id") or tx.get("tx_id")
+        price, ts = tx.get("amount"), tx.get("timestamp")
+        if ts is None:
+            return False
+        product = tx.get("product") or "Unknown Service"
+        quantity = tx.get("quantity") or 1
+        with self._lock:
+            # The trend buffer mirrors the transactions query, which never filtered on status
+            self._remember(tx, tx_id, float(ts))
+            if tx.get("status") != "COMPLETED" or price is None:
+                return False
+            if tx_id:
+                if tx_id in self._seen:
+                    return False
+                self._seen[tx_id] = None
+                if len(self._seen) > self._seen_size:
+                    self._seen.popitem(last=False)
+            for name, width in RESOLUTIONS.items():
+                series = self._series.get((product, name))
+                if series is None:
+                    series = self._series[(product, name)] = CandleSeries(width, self.max_buckets)
+                series.add(float(price), float(quantity), float(ts))
+        return True
+
+    def _remember(self, tx: dict, tx_id: Optional[str], ts: float):
+        if tx_id:
+            # A redelivered or updated transaction replaces its earlier version
+            for i, kept in enumerate(self._recent):
+                if (kept.get("id") or kept.get("tx_id")) == tx_id:
+                    del self._recent_keys[i], self._recent[i]
+                    break
+        # Listener snapshots arrive in document order, so keep the newest trades by timestamp
+        if len(self._recent) >= self.recent_size and ts < self._recent_keys[0]:
+            return
+        i = bisect.bisect_right(self._recent_keys, ts)
+        self._recent_keys.insert(i, ts)
+        self._recent.insert(i, tx)
+        if len(self._recent) > self.recent_size:
+            del self._recent_keys[0], self._recent[0]
+
+    def candles(self, product: str, resolution: str = "1m", start: Optional[float] = None,
+                end: Optional[float] = None, limit: int = 500) -> List[dict]:
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution '{resolution}'. Use one of: {', '.join(RESOLUTIONS)}")
+        with self._lock:
+            series = self._series.get((product, resolution))
+            return series.range(start, end, limit) if series else []
+
+    def products(self) -> List[str]:
+        with self._lock:
+            return sorted({product for product, _ in self._series})
+
+    def latest_trades(self, limit: int) -> Optional[List[dict]]:
+        """Newest-first trades, or None if the buffer cannot answer `limit` on its own."""
+        if limit > self.recent_size:
+            return None
+        with self._lock:
+            return self._recent[::-1][:limit]
@@ -0,0 +1,60 @@
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+CHECKPOINT_INTERVAL = float(os.getenv("AGENT_MKT_CHECKPOINT_INTERVAL", "10"))
+
+
+class ListenerCheckpoint:
+    """Tracks how far a snapshot listener has processed, so a restart only replays what it missed.
+
+    A listener's first snapshot reports every existing document as ADDED.
+    That snapshot is a warm-up: caches are filled from all of it, but side
+    effects (broadcasts, reputation) run only for documents written after
+    the previous process's checkpoint. With no checkpoint at all, the whole
+    warm-up is silent. Checkpoints are saved at most every
+    `save_interval` seconds, so a crash replays at most that window, and the
+    reputation history keeps such replays idempotent.
+    """
+
+    def __init__(self, name: str, since: Optional[datetime] = None, save_interval: float = CHECKPOINT_INTERVAL):
+        self.name = name
+        self.since = since
+        self.save_interval = save_interval
+        self.warm = False
+        self.read_time: Optional[datetime] = None
+        self.replayed = 0
+        self.skipped = 0
+        self._saved_at = 0.0
+
+    def is_live(self, document) -> bool:
+        """Whether a change should trigger side effects (always true once warm)."""
+        if self.warm:
+            return True
+        updated = getattr(document, "update_time", None)
+        if self.since is not None and updated is not None and updated > self.since:
+            self.replayed += 1
+            return True
+        self.skipped += 1
+        return False
+
+    def advance(self, read_time: Optional[datetime]) -> bool:
+        """Ends the warm-up and records progress. Returns True when the checkpoint is due to be saved."""
+        self.warm = True
+        if read_time is not None:
+            self.read_time = read_time
+        now = time.monotonic()
+        if self.read_time is None or now - self._saved_at < self.save_interval:
+            return False
+        self._saved_at = now
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "warm": self.warm,
+            "since": self.since.isoformat() if self.since else None,
+            "read_time": self.read_time.isoformat() if self.read_time else None,
+            "replayed": self.replayed,
+            "skipped": self.skipped,
+        }
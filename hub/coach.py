@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger("api_server")
+
+COACH_CONCURRENCY = int(os.getenv("AGENT_MKT_COACH_CONCURRENCY", "4"))
+COACH_QUEUE_SIZE = int(os.getenv("AGENT_MKT_COACH_QUEUE_SIZE", "200"))
+COACH_RATE_PER_MIN = float(os.getenv("AGENT_MKT_COACH_RATE_PER_MIN", "60"))
+COACH_BURST = int(os.getenv("AGENT_MKT_COACH_BURST", "5"))
+# Queue fill ratio above which new analyses are sampled instead of always queued
+COACH_SAMPLE_THRESHOLD = float(os.getenv("AGENT_MKT_COACH_SAMPLE_THRESHOLD", "0.5"))
+COACH_DELAY = float(os.getenv("AGENT_MKT_COACH_DELAY", "2"))
+# Batch mode: up to N finished negotiations per LLM request (1 = one prompt per negotiation)
+COACH_BATCH_SIZE = int(os.getenv("AGENT_MKT_COACH_BATCH_SIZE", "1"))
+COACH_BATCH_WINDOW_MS = float(os.getenv("AGENT_MKT_COACH_BATCH_WINDOW_MS", "500"))
+
+Analyzer = Callable[[str, List[str]], Awaitable[None]]
+BatchAnalyzer = Callable[[List[Tuple[str, List[str]]]], Awaitable[None]]
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CoachQueue:
+    """Work queue for post-negotiation coach analyses.
+
+    At most `concurrency` analyses run at once, LLM calls are paced by a
+    token bucket, and a negotiation is analyzed at most once no matter how
+    many terminal actions it receives. When the queue is more than
+    `sample_threshold` full, new work is admitted with a probability that
+    falls linearly to zero at capacity, so the coach degrades to a sample
+    instead of a backlog. Blocking SDK calls run on a dedicated executor via
+    `run_blocking`, never on the default pool used by the rest of the server.
+
+    With `batch_size` > 1 and an `analyze_batch` callable, each worker
+    collects up to `batch_size` negotiations (or whatever arrives within
+    `batch_window_ms` of the first) and hands them over together, spending
+    one rate-limit token per batch since a batch is one LLM request.
+    """
+
+    def __init__(self, analyze: Analyzer, concurrency: int = COACH_CONCURRENCY,
+                 max_queue: int = COACH_QUEUE_SIZE, rate_per_min: float = COACH_RATE_PER_MIN,
+                 burst: int = COACH_BURST, sample_threshold: float = COACH_SAMPLE_THRESHOLD,
+                 delay: float = COACH_DELAY, seen_size: int = 10000,
+                 analyze_batch: Optional[BatchAnalyzer] = None, batch_size: int = COACH_BATCH_SIZE,
+                 batch_window_ms: float = COACH_BATCH_WINDOW_MS):
+        self.analyze = analyze
+        self.analyze_batch = analyze_batch
+        self.batch_size = max(1, batch_size) if analyze_batch else 1
+        self.batch_window = batch_window_ms / 1000.0
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.sample_threshold = sample_threshold
+        self.delay = delay
+        self.bucket = TokenBucket(rate_per_min / 60.0, burst)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.tasks: List[asyncio.Task] = []
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._seen_size = seen_size
+        self.in_flight = 0
+        self.counts = {"queued": 0, "duplicate": 0, "sampled_out": 0, "dropped": 0, "completed": 0, "failed": 0,
+                       "batches": 0}
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+        self.latency_avg = 0.0  # Exponentially weighted, seconds (queue wait + analysis)
+
+    def start(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="coach")
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.executor:
+            self.executor.shutdown(wait=False)
+
+    def submit(self, negotiation_id: str, involved_agents: List[str]) -> str:
+        """Admits one analysis. Returns "queued", "duplicate", "sampled_out" or "dropped"."""
+        if negotiation_id in self._seen:
+            outcome = "duplicate"
+        else:
+            fill = self.queue.qsize() / self.max_queue if self.max_queue else 0.0
+            if fill > self.sample_threshold and \
+                    random.random() > (1 - fill) / max(1e-9, 1 - self.sample_threshold):
+                outcome = "sampled_out"
+            else:
+                try:
+                    self.queue.put_nowait((time.monotonic(), negotiation_id, involved_agents))
+                    outcome = "queued"
+                except asyncio.QueueFull:
+                    outcome = "dropped"
+            if outcome == "queued":
+                self._seen[negotiation_id] = None
+                if len(self._seen) > self._seen_size:
+                    self._seen.popitem(last=False)
+        self.counts[outcome] += 1
+        if outcome != "queued":
+            logger.info(f"🎬 [Coach] Analysis for {negotiation_id} not queued ({outcome})")
+        return outcome
+
+    async def run_blocking(self, fn, *args):
+        """Runs a blocking call (e.g. the LLM SDK) on the coach's own executor."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            try:
+                # Give the closing step a moment to reach every reader before analysing
+                wait = batch[0][0] + self.delay - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if self.batch_size > 1:
+                    await self._fill_batch(batch)
+                    wait = batch[-1][0] + self.delay - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                await self.bucket.acquire()
+                await self._analyze(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _fill_batch(self, batch: list):
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                return
+
+    async def _analyze(self, batch: list):
+        ids = [negotiation_id for _, negotiation_id, _ in batch]
+        self.in_flight += len(batch)
+        try:
+            if self.batch_size > 1:
+                await self.analyze_batch([(negotiation_id, involved) for _, negotiation_id, involved in batch])
+                self.counts["batches"] += 1
+            else:
+                await self.analyze(ids[0], batch[0][2])
+            self.counts["completed"] += len(batch)
+        except Exception as e:
+            self.counts["failed"] += len(batch)
+            logger.warning(f"⚠️ [Coach] Analysis task failed for {', '.join(ids)}: {e}")
+        finally:
+            self.in_flight -= len(batch)
+            now = time.monotonic()
+            for enqueued_at, _, _ in batch:
+                self._record_latency(now - enqueued_at)
+
+    def _record_latency(self, latency: float):
+        first = self.counts["completed"] + self.counts["failed"] <= 1
+        self.latency_last = latency
+        self.latency_max = max(self.latency_max, latency)
+        self.latency_avg = latency if first else 0.9 * self.latency_avg + 0.1 * latency
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.queue.qsize(),
+            "in_flight": self.in_flight,
+            **self.counts,
+            "avg_batch_size": round(self.counts["completed"] / self.counts["batches"], 2) if self.counts["batches"] else None,
+            "latency_last_ms": round(self.latency_last * 1000, 1),
+            "latency_avg_ms": round(self.latency_avg * 1000, 1),
+            "latency_max_ms": round(self.latency_max * 1000, 1),
+        }
@@ -0,0 +1,474 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+from hub.event_log import EventLog
+from hub.mailboxes import Mailboxes
+from hub.viewers import ViewerFeed
+
+logger = logging.getLogger("api_server")
+
+WS_QUEUE_SIZE = int(os.getenv("AGENT_MKT_WS_QUEUE_SIZE", "256"))
+WS_OVERFLOW_POLICY = os.getenv("AGENT_MKT_WS_OVERFLOW_POLICY", "drop_oldest")
+WS_SEND_TIMEOUT = float(os.getenv("AGENT_MKT_WS_SEND_TIMEOUT", "10"))
+OVERFLOW_POLICIES = ("drop_oldest", "conflate", "disconnect")
+
+# Subscription message field -> topic dimension
+SUBSCRIPTION_FIELDS = {
+    "categories": "category",
+    "products": "product",
+    "event_types": "event_type",
+    "negotiation_ids": "negotiation",
+    "agents": "agent",
+}
+AGENT_FIELDS = ("sender_id", "receiver_id", "buyer_id", "seller_id", "agent_id")
+
+Topic = Tuple[str, str]
+
+
+def encode_frame(message: dict) -> str:
+    """Serializes an event once into the text frame written to every socket.
+
+    Matches Starlette's `send_json` encoding so clients see identical payloads.
+    """
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def conflation_key(message: dict) -> Optional[str]:
+    """Key under which a newer event supersedes an older queued one (None = never conflated)."""
+    msg_type = message.get("type")
+    if msg_type == "agent_status":
+        return f"status:{message.get('agent_id')}"
+    if msg_type == "market_event":
+        data = message.get("data") or {}
+        if data.get("type") == "Proposal" and data.get("negotiation_id"):
+            return f"proposal:{data['negotiation_id']}"
+        if data.get("offer_id"):
+            return f"offer:{data['offer_id']}"
+    return None
+
+
+def event_topics(message: dict) -> Set[Topic]:
+    """Topics an outbound event is published under; a subscriber matching any of them receives it."""
+    msg_type = message.get("type")
+    topics = {("event_type", msg_type)}
+    data = message.get("data") if msg_type == "market_event" else message
+    if not isinstance(data, dict):
+        return topics
+    if msg_type == "market_event" and data.get("type"):
+        topics.add(("event_type", data["type"]))
+    if data.get("category"):
+        topics.add(("category", data["category"]))
+    product = data.get("product") or data.get("item")
+    if product:
+        topics.add(("product", product))
+    if data.get("negotiation_id"):
+        topics.add(("negotiation", data["negotiation_id"]))
+    for field in AGENT_FIELDS:
+        if data.get(field):
+            topics.add(("agent", data[field]))
+    for agent_id in data.get("involved_agents") or ():
+        topics.add(("agent", agent_id))
+    return topics
+
+
+def subscription_topics(msg: dict) -> Set[Topic]:
+    """Parses the topic lists of a subscribe/unsubscribe message."""
+    topics = set()
+    for field, dimension in SUBSCRIPTION_FIELDS.items():
+        values = msg.get(field) or []
+        if isinstance(values, str):
+            values = [values]
+        topics.update((dimension, str(v)) for v in values)
+    return topics
+
+
+def describe_topics(topics: Iterable[Topic]) -> Dict[str, List[str]]:
+    """Renders topics back into the subscribe message shape."""
+    fields = {dimension: field for field, dimension in SUBSCRIPTION_FIELDS.items()}
+    described: Dict[str, List[str]] = {}
+    for dimension, value in sorted(topics):
+        described.setdefault(fields[dimension], []).append(value)
+    return described
+
+
+class ClientChannel:
+    """Outbound side of one WebSocket: a bounded frame queue drained by its own writer task.
+
+    Producers never await the socket; a slow or dead consumer only fills its own
+    queue, where the overflow policy decides what gives (a consumer whose current
+    send has been stuck for longer than AGENT_MKT_WS_SEND_TIMEOUT is always evicted):
+    - drop_oldest: discard the oldest queued frame
+    - conflate: replace a queued frame with the same key, else drop the oldest
+    - disconnect: evict the consumer
+    """
+
+    def __init__(self, websocket: WebSocket, on_evict: Callable[[WebSocket], None],
+                 max_queue: int = WS_QUEUE_SIZE, policy: str = WS_OVERFLOW_POLICY):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {OVERFLOW_POLICIES}")
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self._on_evict = on_evict
+        self._queue = deque()  # of [key, frame] slots
+        self._keyed: Dict[str, list] = {}  # conflation key -> queued slot
+        self._wakeup = asyncio.Event()
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.max_depth = 0
+        self.topics: Set[Topic] = set()  # Empty means unfiltered (receives every broadcast)
+        self.first_seq: Optional[int] = None  # Seq of the first live logged event; replays stop short of it
+        self.flushed_seqs: Set[int] = set()  # Mailbox events handed over on identify; resume skips them
+        self._inflight_since: Optional[float] = None  # Start of the send currently in progress
+        self._writer = asyncio.create_task(self._drain())
+        self._evictor: Optional[asyncio.Task] = None  # Scheduled by offer(), which can't await the close
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def offer(self, frame: str, key: Optional[str] = None, seq: Optional[int] = None):
+        """Queues a frame without blocking, applying the overflow policy."""
+        if self.closed:
+            return
+        if seq is not None and self.first_seq is None:
+            self.first_seq = seq
+        if self.policy == "conflate" and key is not None:
+            slot = self._keyed.get(key)
+            if slot is not None:
+                slot[1] = frame
+                self.conflated += 1
+                return
+        if len(self._queue) >= self.max_queue:
+            stalled = self._inflight_since is not None and time.monotonic() - self._inflight_since > WS_SEND_TIMEOUT
+            if self.policy == "disconnect" or stalled:
+                self.dropped += 1
+                reason = "send stalled" if stalled else "queue full"
+                if self._evictor is None:
+                    logger.warning(f"🐢 [WS] Evicting slow consumer {self.websocket.client.host} ({reason})")
+                    self._evictor = asyncio.create_task(self._evict(code=1013))
+                    self._evictor.add_done_callback(self._evicted)
+                return
+            oldest = self._queue.popleft()
+            if oldest[0] is not None and self._keyed.get(oldest[0]) is oldest:
+                del self._keyed[oldest[0]]
+            self.dropped += 1
+        slot = [key, frame]
+        self._queue.append(slot)
+        if self.policy == "conflate" and key is not None:
+            self._keyed[key] = slot
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._wakeup.set()
+
+    async def _drain(self):
+        while not self.closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue and not self.closed:
+                slot = self._queue.popleft()
+                if slot[0] is not None and self._keyed.get(slot[0]) is slot:
+                    del self._keyed[slot[0]]
+                # No per-frame timeout wrapper (it costs a task per send); a stalled send is
+                # detected by offer() once the queue fills up behind it.
+                self._inflight_since = time.monotonic()
+                try:
+                    await self.websocket.send_text(slot[1])
+                    self.sent += 1
+                except Exception as e:
+                    logger.warning(f"⚠️ [WS] Send to {self.websocket.client.host} failed: {e!r}. Evicting.")
+                    await self._evict(code=1011)
+                    return
+                finally:
+                    self._inflight_since = None
+
+    async def _evict(self, code: int):
+        if self.closed:
+            return
+        self.close()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+        self._on_evict(self.websocket)
+
+    def _evicted(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"⚠️ [WS] Evicting {self.websocket.client.host} failed: {task.exception()!r}")
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._keyed.clear()
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "conflated": self.conflated,
+            "policy": self.policy,
+            "topics": len(self.topics),
+        }
+
+
+class ConnectionManager:
+    def __init__(self):
+        self.active_connections: List[WebSocket] = []
+        self.agent_map: Dict[str, WebSocket] = {}
+        self.viewers: List[WebSocket] = []
+        self.pending_timeouts: Dict[WebSocket, asyncio.Task] = {}
+        self.channels: Dict[WebSocket, ClientChannel] = {}
+        # Routing index: topic -> subscribed channels. Channels without any
+        # subscription stay in `unfiltered` and receive every broadcast.
+        self.topic_index: Dict[Topic, Set[ClientChannel]] = {}
+        self.unfiltered: Set[ClientChannel] = set()
+        self.events = EventLog(encode=encode_frame)
+        self.mailboxes = Mailboxes()
+        # Batched viewer tier: dashboards that get conflated batches at a fixed cadence
+        self.viewer_feed = ViewerFeed(encode=encode_frame)
+        self.batched_viewers: Set[ClientChannel] = set()
+        self._viewer_flusher: Optional[asyncio.Task] = None
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        self.active_connections.append(websocket)
+        channel = ClientChannel(websocket, on_evict=self.disconnect)
+        self.channels[websocket] = channel
+        self.unfiltered.add(channel)
+
+        # Identification Timeout: Use a task to kick unidentified clients
+        timeout_task = asyncio.create_task(self._ghost_cleanup_timeout(websocket))
+        self.pending_timeouts[websocket] = timeout_task
+
+        client = f"{websocket.client.host}:{websocket.client.port}"
+        logger.info(f"🔌 [+] WS Connected: {client}. Total: {len(self.active_connections)}")
+
+    async def _ghost_cleanup_timeout(self, websocket: WebSocket):
+        """Closes connection if not identified within timeout (30s)."""
+        await asyncio.sleep(30)
+        # Check if it's an agent OR a viewer
+        is_identified = websocket in self.agent_map.values() or websocket in self.viewers
+        if not is_identified:
+             logger.warning(f"👻 [WS] Kicking unidentified client {websocket.client.host}")
+             try:
+                 await websocket.close(code=1008) # Policy Violation
+             except Exception as e:
+                 logger.warning(f"⚠️ [WS] Error closing connection for unidentified client: {e}")
+             self.disconnect(websocket)
+
+    def identify(self, agent_id: str, websocket: WebSocket):
+        self.agent_map[agent_id] = websocket
+        # Cancel timeout if identified
+        if websocket in self.pending_timeouts:
+            self.pending_timeouts[websocket].cancel()
+            del self.pending_timeouts[websocket]
+
+        client = f"{websocket.client.host}:{websocket.client.port}"
+        logger.info(f"🆔 WS Identified: {agent_id} at {client}")
+
+        # Hand over targeted messages that arrived while the agent was away
+        channel = self.channels.get(websocket)
+        if channel is not None:
+            mail = self.mailboxes.drain(agent_id)
+            for seq, frame in mail:
+                channel.offer(frame)
+                if seq is not None:
+                    channel.flushed_seqs.add(seq)
+            if mail:
+                logger.info(f"📬 Delivered {len(mail)} held messages to {agent_id}")
+
+    def identify_viewer(self, websocket: WebSocket, batched: bool = False):
+        """Registers a read-only viewer interface (like the frontend).
+
+        A batched viewer leaves the per-event fan-out and its topic filters and
+        instead receives the conflated `batch` frames of the viewer feed.
+        """
+        if websocket not in self.viewers:
+            self.viewers.append(websocket)
+
+        channel = self.channels.get(websocket)
+        if batched and channel is not None and channel not in self.batched_viewers:
+            self._unindex(channel, set(channel.topics))
+            self.unfiltered.discard(channel)
+            self.batched_viewers.add(channel)
+            if self._viewer_flusher is None or self._viewer_flusher.done():
+                self._viewer_flusher = asyncio.create_task(self._flush_viewers())
+
+        # Cancel timeout
+        if websocket in self.pending_timeouts:
+            self.pending_timeouts[websocket].cancel()
+            del self.pending_timeouts[websocket]
+
+        client = f"{websocket.client.host}:{websocket.client.port}"
+        logger.info(f"👀 WS Viewer Registered: {client}")
+
+    def disconnect(self, websocket: WebSocket):
+        channel = self.channels.pop(websocket, None)
+        if channel is None:
+            return  # Already cleaned up (e.g. evicted before the receive loop noticed)
+        channel.close()
+        self._unindex(channel, set(channel.topics))
+        self.unfiltered.discard(channel)
+        if channel in self.batched_viewers:
+            self.batched_viewers.discard(channel)
+            if not self.batched_viewers:
+                # Nobody left to flush to: stop the cadence and don't hand stale events to the next viewer
+                if self._viewer_flusher is not None:
+                    self._viewer_flusher.cancel()
+                    self._viewer_flusher = None
+                self.viewer_feed.clear()
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+        if websocket in self.viewers:
+            self.viewers.remove(websocket)
+
+        if websocket in self.pending_timeouts:
+            self.pending_timeouts[websocket].cancel()
+            del self.pending_timeouts[websocket]
+
+        client = f"{websocket.client.host}:{websocket.client.port}"
+        logger.info(f"🔌 [-] WS Disconnected: {client}. Remaining: {len(self.active_connections)}")
+        # Remove from map if exists
+        for agent_id, ws in list(self.agent_map.items()):
+            if ws == websocket:
+                del self.agent_map[agent_id]
+                break
+
+    def _unindex(self, channel: ClientChannel, topics: Iterable[Topic]):
+        for topic in topics:
+            channel.topics.discard(topic)
+            subscribers = self.topic_index.get(topic)
+            if subscribers is not None:
+                subscribers.discard(channel)
+                if not subscribers:
+                    del self.topic_index[topic]
+
+    def subscribe(self, websocket: WebSocket, topics: Set[Topic]) -> Set[Topic]:
+        """Adds topics to a connection's filter. Once subscribed, it only receives matching events."""
+        channel = self.channels.get(websocket)
+        if channel is None or not topics or channel in self.batched_viewers:
+            return set()
+        self.unfiltered.discard(channel)
+        channel.topics.update(topics)
+        for topic in topics:
+            self.topic_index.setdefault(topic, set()).add(channel)
+        return channel.topics
+
+    def unsubscribe(self, websocket: WebSocket, topics: Optional[Set[Topic]] = None) -> Set[Topic]:
+        """Removes topics (all of them when None); a connection left with none is unfiltered again."""
+        channel = self.channels.get(websocket)
+        if channel is None or channel in self.batched_viewers:
+            return set()
+        self._unindex(channel, set(channel.topics) if topics is None else topics)
+        if not channel.topics:
+            self.unfiltered.add(channel)
+        return channel.topics
+
+    async def broadcast(self, message: dict):
+        # Encode once (into the replay log), then hand the same frame to the queue of every
+        # matching connection. Enqueueing never waits on a socket, so slow consumers cannot
+        # stall the fan-out. Logged even with nobody connected, for clients that resume later.
+        topics = frozenset(event_topics(message))
+        seq, frame = self.events.append(message, topics=topics)
+        if self.batched_viewers:
+            self.viewer_feed.add(message)
+        if not self.channels:
+            return
+        key = conflation_key(message)
+        for channel in self.unfiltered:
+            channel.offer(frame, key, seq)
+
+        # Route to subscribers through the topic index instead of scanning every connection
+        matched = [self.topic_index[t] for t in topics if t in self.topic_index]
+        targets = matched[0] if len(matched) == 1 else set().union(*matched)
+        for channel in targets:
+            channel.offer(frame, key, seq)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"📡 Broadcast of {message.get('type')} to {len(self.unfiltered) + len(targets)} listeners.")
+
+    async def _flush_viewers(self):
+        """Sends the pending viewer batch at the feed's cadence while batched viewers exist."""
+        while self.batched_viewers:
+            await asyncio.sleep(self.viewer_feed.interval)
+            frame = self.viewer_feed.take()
+            if frame is None:
+                continue
+            for channel in list(self.batched_viewers):
+                channel.offer(frame)
+
+    async def send_to_agent(self, agent_id: str, message: dict):
+        # Logged even when the agent is offline, so it can pick the event up on resume
+        seq, frame = self.events.append(message, agent_id=agent_id)
+        websocket = self.agent_map.get(agent_id)
+        channel = self.channels.get(websocket) if websocket is not None else None
+        if channel is not None and not channel.closed:
+            channel.offer(frame, seq=seq)
+            logger.info(f"📤 Targeted message queued for {agent_id}")
+        else:
+            self.mailboxes.put(agent_id, seq, frame)
+            logger.info(f"📪 {agent_id} offline, message held in its mailbox")
+
+    def resume(self, websocket: WebSocket, agent_id: Optional[str], epoch: Optional[str], last_seq) -> dict:
+        """Replays the events a reconnecting client missed after `last_seq`.
+
+        Only events this connection would have received live are replayed:
+        broadcasts matching its subscription and messages targeted at
+        `agent_id`. Anything already queued live is skipped. Returns the reply
+        frame; `resync_required` means the gap is gone from the log (or too big
+        for the send queue) and the client should fetch a full snapshot.
+        """
+        head = {"epoch": self.events.epoch, "seq": self.events.seq}
+        channel = self.channels.get(websocket)
+        missed = self.events.since(epoch, last_seq) if channel is not None else None
+        if missed is None:
+            self.events.resyncs += 1
+            return {"type": "resync_required", **head}
+        frames = []
+        for seq, frame, topics, target in missed:
+            if channel.first_seq is not None and seq >= channel.first_seq:
+                break
+            if target is not None:
+                wanted = target == agent_id and seq not in channel.flushed_seqs
+            else:
+                wanted = not channel.topics or not channel.topics.isdisjoint(topics)
+            if wanted:
+                frames.append(frame)
+        if len(frames) > channel.max_queue:
+            self.events.resyncs += 1
+            return {"type": "resync_required", **head}
+        for frame in frames:
+            channel.offer(frame)
+        self.events.replays += 1
+        return {"type": "resumed", "replayed": len(frames), **head}
+
+    async def send_to_socket(self, websocket: WebSocket, message: dict):
+        channel = self.channels.get(websocket)
+        if channel is not None:
+            channel.offer(encode_frame(message))
+
+    def channel_stats(self) -> List[dict]:
+        """Per-connection queue depth and drop counters."""
+        agents = {ws: agent_id for agent_id, ws in self.agent_map.items()}
+        stats = []
+        for websocket, channel in self.channels.items():
+            entry = channel.stats()
+            entry["client"] = f"{websocket.client.host}:{websocket.client.port}"
+            entry["agent_id"] = agents.get(websocket)
+            entry["viewer"] = websocket in self.viewers
+            stats.append(entry)
+        return stats
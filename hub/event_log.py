@@ -0,0 +1,59 @@
+import json
+import os
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Callable, FrozenSet, List, Optional, Tuple
+
+WS_REPLAY_SIZE = int(os.getenv("AGENT_MKT_WS_REPLAY_SIZE", "4096"))
+
+# (seq, encoded frame, broadcast topics or None, target agent_id or None)
+LoggedEvent = Tuple[int, str, Optional[FrozenSet[Tuple[str, str]]], Optional[str]]
+
+
+class EventLog:
+    """Sequence numbers plus a bounded replay buffer for outbound WebSocket events.
+
+    Every broadcast and targeted event is stamped with the next `seq` and kept
+    (already encoded) in a ring of the last `max_events`. A reconnecting
+    client hands back the last seq it saw and gets just the events after it.
+    `epoch` changes on every server start, so a seq from an earlier process is
+    never mistaken for one of ours.
+    """
+
+    def __init__(self, max_events: int = WS_REPLAY_SIZE,
+                 encode: Callable[[dict], str] = lambda m: json.dumps(m, separators=(",", ":"))):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self._encode = encode
+        self._events: deque = deque(maxlen=max_events)
+        self.replays = 0
+        self.resyncs = 0
+
+    def append(self, message: dict, topics: Optional[FrozenSet[Tuple[str, str]]] = None,
+               agent_id: Optional[str] = None) -> Tuple[int, str]:
+        """Stamps and records an event; returns its seq and the frame to send."""
+        self.seq += 1
+        frame = self._encode({**message, "seq": self.seq})
+        self._events.append((self.seq, frame, topics, agent_id))
+        return self.seq, frame
+
+    def since(self, epoch: Optional[str], seq) -> Optional[List[LoggedEvent]]:
+        """Events after `seq`, or None when they can't be replayed and a full snapshot is needed."""
+        if epoch != self.epoch or not isinstance(seq, int) or seq > self.seq or seq < 0:
+            return None
+        oldest = self._events[0][0] if self._events else self.seq + 1
+        if seq < oldest - 1:
+            return None  # Part of the gap already fell out of the ring
+        # Seqs are contiguous, so the position of seq + 1 is a plain offset
+        return list(islice(self._events, seq + 1 - oldest, None))
+
+    def stats(self) -> dict:
+        return {
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "retained": len(self._events),
+            "oldest_seq": self._events[0][0] if self._events else None,
+            "replays": self.replays,
+            "resyncs": self.resyncs,
+        }
@@ -0,0 +1,80 @@
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+MAILBOX_SIZE = int(os.getenv("AGENT_MKT_MAILBOX_SIZE", "64"))
+MAILBOX_TTL = float(os.getenv("AGENT_MKT_MAILBOX_TTL", "600"))
+MAILBOX_MAX_AGENTS = int(os.getenv("AGENT_MKT_MAILBOX_MAX_AGENTS", "10000"))
+
+
+class Mailboxes:
+    """Store-and-forward for targeted messages to agents that aren't connected.
+
+    Each agent gets a bounded mailbox (oldest message dropped past `max_size`)
+    whose entries expire after `ttl` seconds; it is flushed when the agent
+    identifies. Frames are kept encoded with their event seq, so a flush and
+    a later resume can tell which events were already handed over.
+    """
+
+    def __init__(self, max_size: int = MAILBOX_SIZE, ttl: float = MAILBOX_TTL,
+                 max_agents: int = MAILBOX_MAX_AGENTS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_agents = max_agents
+        self._boxes: Dict[str, deque] = {}  # agent_id -> deque of (stored_at, seq, frame), insertion-ordered
+        self.stored = 0
+        self.delivered = 0
+        self.expired = 0
+        self.dropped = 0
+
+    def put(self, agent_id: str, seq: Optional[int], frame: str):
+        box = self._boxes.get(agent_id)
+        if box is None:
+            if len(self._boxes) >= self.max_agents:
+                self.prune()
+            if len(self._boxes) >= self.max_agents:
+                # Still full of live mail: give up the oldest mailbox
+                self.dropped += len(self._boxes.pop(next(iter(self._boxes))))
+            box = self._boxes[agent_id] = deque()
+        if len(box) >= self.max_size:
+            box.popleft()
+            self.dropped += 1
+        box.append((time.time(), seq, frame))
+        self.stored += 1
+
+    def drain(self, agent_id: str) -> List[Tuple[Optional[int], str]]:
+        """Removes and returns the agent's unexpired messages, oldest first, as (seq, frame)."""
+        box = self._boxes.pop(agent_id, None)
+        if not box:
+            return []
+        cutoff = time.time() - self.ttl
+        messages = [(seq, frame) for stored_at, seq, frame in box if stored_at >= cutoff]
+        self.expired += len(box) - len(messages)
+        self.delivered += len(messages)
+        return messages
+
+    def prune(self):
+        """Drops expired messages and the mailboxes they leave empty."""
+        cutoff = time.time() - self.ttl
+        for agent_id in list(self._boxes):
+            box = self._boxes[agent_id]
+            while box and box[0][0] < cutoff:
+                box.popleft()
+                self.expired += 1
+            if not box:
+                del self._boxes[agent_id]
+
+    def pending(self, agent_id: str) -> int:
+        return len(self._boxes.get(agent_id) or ())
+
+    def stats(self) -> dict:
+        self.prune()
+        return {
+            "mailboxes": len(self._boxes),
+            "pending": sum(len(box) for box in self._boxes.values()),
+            "stored": self.stored,
+            "delivered": self.delivered,
+            "expired": self.expired,
+            "dropped": self.dropped,
+        }
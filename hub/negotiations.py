@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+TERMINAL_ACTIONS = {"ACCEPT": "COMPLETED", "REJECT": "FAILED"}
+
+
+class NegotiationState:
+    """Hot state of one negotiation: enough to enforce step limits and verify an ACCEPT."""
+
+    __slots__ = ("negotiation_id", "steps", "last_proposals", "participants", "status", "updated_at")
+
+    def __init__(self, negotiation_id: str):
+        self.negotiation_id = negotiation_id
+        self.steps = 0
+        self.last_proposals: Dict[str, Optional[float]] = {}  # sender_id -> last proposed price
+        self.participants: List[str] = []
+        self.status = "ACTIVE"
+        self.updated_at = 0.0
+
+    def apply(self, step: dict):
+        """Folds one negotiation step (a `negotiations` document) into the state."""
+        self.steps += 1
+        sender = step.get("sender_id")
+        for agent_id in (sender, step.get("receiver_id")):
+            if agent_id and agent_id not in self.participants:
+                self.participants.append(agent_id)
+        if sender:
+            self.last_proposals[sender] = step.get("price")
+        self.status = TERMINAL_ACTIONS.get(step.get("action"), self.status)
+        self.updated_at = max(self.updated_at, step.get("timestamp") or time.time())
+
+    def to_dict(self) -> dict:
+        return {
+            "negotiation_id": self.negotiation_id,
+            "steps": self.steps,
+            "last_proposals": dict(self.last_proposals),
+            "participants": list(self.participants),
+            "status": self.status,
+            "updated_at": self.updated_at,
+        }
+
+
+class NegotiationStateTable:
+    """Bounded LRU table of negotiation states.
+
+    States are updated on every action and rebuilt from the `negotiations`
+    history on a miss (after a restart or an eviction), so the table never
+    has to be persisted itself.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._states: "OrderedDict[str, NegotiationState]" = OrderedDict()
+
+    def get(self, negotiation_id: str) -> Optional[NegotiationState]:
+        with self._lock:
+            state = self._states.get(negotiation_id)
+            if state is not None:
+                self._states.move_to_end(negotiation_id)
+            return state
+
+    def _install(self, state: NegotiationState) -> NegotiationState:
+        self._states[state.negotiation_id] = state
+        self._states.move_to_end(state.negotiation_id)
+        while len(self._states) > self.max_entries:
+            self._states.popitem(last=False)
+        return state
+
+    def load(self, negotiation_id: str, history: Iterable[dict]) -> NegotiationState:
+        """Rebuilds a state from stored steps, unless a live one appeared meanwhile."""
+        rebuilt = NegotiationState(negotiation_id)
+        for step in sorted(history, key=lambda h: h.get("timestamp", 0)):
+            rebuilt.apply(step)
+        with self._lock:
+            existing = self._states.get(negotiation_id)
+            return existing if existing is not None else self._install(rebuilt)
+
+    def record(self, step: dict) -> Optional[NegotiationState]:
+        """Applies a freshly persisted step to a cached state.
+
+        Unknown negotiations are left alone: the next lookup rebuilds them from
+        Firestore, which already contains this step.
+        """
+        with self._lock:
+            state = self._states.get(step["negotiation_id"])
+            if state is not None:
+                self._states.move_to_end(step["negotiation_id"])
+                state.apply(step)
+            return state
+
+    def __len__(self):
+        with self._lock:
+            return len(self._states)
@@ -0,0 +1,114 @@
+import bisect
+import heapq
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class OrderBook:
+    """In-process order book of active market items, keyed by (category, product).
+
+    Offers rest on the ask side (lowest price first), requests on the bid side
+    (highest budget first); ties are broken by arrival time. The book is written
+    from request handlers and from Firestore listener threads, so every access
+    goes through a single lock.
+    """
+
+    def __init__(self, default_category: str = "general"):
+        self.default_category = default_category
+        self.ready = False  # Set once the initial Firestore snapshot has been loaded
+        self._lock = threading.Lock()
+        # item_id -> (book_key, side, sort_key, item)
+        self._items: Dict[str, Tuple[Tuple[str, str], str, tuple, dict]] = {}
+        # (category, product) -> {"asks": [(sort_key, item_id)], "bids": [...]}
+        self._books: Dict[Tuple[str, str], Dict[str, list]] = {}
+        # Min-heap of (valid_until, item_id) for lazy expiry
+        self._expiry: List[Tuple[float, str]] = []
+
+    def _describe(self, item_id: str, item: dict):
+        category = item.get("category") or self.default_category
+        product = item.get("product") or item.get("item") or ""
+        is_offer = item.get("type") == "Offer" or (item.get("type") != "Request" and "offer_id" in item)
+        if is_offer:
+            side = "asks"
+            sort_key = (float(item.get("price") or 0.0), item.get("created_at") or item.get("timestamp") or 0.0, item_id)
+        else:
+            side = "bids"
+            sort_key = (-float(item.get("max_budget") or 0.0), item.get("timestamp") or item.get("created_at") or 0.0, item_id)
+        return (category, product), side, sort_key
+
+    def _unlink(self, item_id: str):
+        entry = self._items.pop(item_id, None)
+        if not entry:
+            return
+        book_key, side, sort_key, _ = entry
+        book = self._books.get(book_key)
+        if not book:
+            return
+        levels = book[side]
+        idx = bisect.bisect_left(levels, (sort_key, item_id))
+        if idx < len(levels) and levels[idx] == (sort_key, item_id):
+            levels.pop(idx)
+        if not book["asks"] and not book["bids"]:
+            del self._books[book_key]
+
+    def _purge_expired(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            valid_until, item_id = heapq.heappop(self._expiry)
+            entry = self._items.get(item_id)
+            # Skip heap entries left behind by an update that extended validity
+            if entry and entry[3].get("valid_until") == valid_until:
+                self._unlink(item_id)
+
+    def upsert(self, item_id: str, item: dict):
+        """Adds or replaces an item. Expired items are ignored."""
+        valid_until = item.get("valid_until")
+        now = time.time()
+        with self._lock:
+            self._unlink(item_id)
+            if valid_until is not None and valid_until <= now:
+                return
+            book_key, side, sort_key = self._describe(item_id, item)
+            self._items[item_id] = (book_key, side, sort_key, item)
+            book = self._books.setdefault(book_key, {"asks": [], "bids": []})
+            bisect.insort(book[side], (sort_key, item_id))
+            if valid_until is not None:
+                heapq.heappush(self._expiry, (valid_until, item_id))
+
+    def remove(self, item_id: str):
+        with self._lock:
+            self._unlink(item_id)
+
+    def active(self, category: Optional[str] = None, product: Optional[str] = None) -> List[dict]:
+        """Returns active items in price-time priority, optionally filtered to a slice."""
+        with self._lock:
+            self._purge_expired(time.time())
+            if category is not None and product is not None:
+                keys = [(category, product)] if (category, product) in self._books else []
+            else:
+                keys = sorted(
+                    k for k in self._books
+                    if (category is None or k[0] == category) and (product is None or k[1] == product)
+                )
+            result = []
+            for key in keys:
+                book = self._books[key]
+                for side in ("asks", "bids"):
+                    result.extend(self._items[item_id][3] for _, item_id in book[side])
+            return result
+
+    def top(self, category: str, product: str) -> Dict[str, Optional[dict]]:
+        """Returns the best ask and best bid for a product."""
+        with self._lock:
+            self._purge_expired(time.time())
+            book = self._books.get((category, product))
+            if not book:
+                return {"best_ask": None, "best_bid": None}
+            return {
+                "best_ask": self._items[book["asks"][0][1]][3] if book["asks"] else None,
+                "best_bid": self._items[book["bids"][0][1]][3] if book["bids"] else None,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
@@ -0,0 +1,114 @@
+import os
+import time
+from typing import Dict, List, Optional
+
+PRESENCE_TTL = float(os.getenv("AGENT_MKT_PRESENCE_TTL", "60"))
+
+
+class AgentPresence:
+    """Last known status of one agent and whether it currently holds a socket."""
+
+    __slots__ = ("agent_id", "name", "status", "activity", "connected", "online", "last_seen")
+
+    def __init__(self, agent_id: str, name: Optional[str]):
+        self.agent_id = agent_id
+        self.name = name
+        self.status = "ACTIVE"
+        self.activity: Optional[str] = None
+        self.connected = False
+        self.online = False
+        self.last_seen = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "agent_id": self.agent_id,
+            "name": self.name,
+            "status": self.status if self.online else "OFFLINE",
+            "activity": self.activity,
+            "online": self.online,
+            "connected": self.connected,
+            "last_seen": self.last_seen,
+        }
+
+
+class PresenceTracker:
+    """In-memory presence built from WebSocket lifecycle instead of periodic status POSTs.
+
+    An identified socket marks its agent online; the server's WebSocket
+    ping/pong keeps that socket honest, so a connected agent needs no
+    heartbeat traffic. Once the socket is gone (or for HTTP-only agents, once
+    their last status update is older than `ttl`), `sweep` marks the agent
+    offline. Every method returns the `agent_status` event to broadcast, or
+    None when nothing a viewer could see has changed.
+    """
+
+    def __init__(self, ttl: float = PRESENCE_TTL):
+        self.ttl = ttl
+        self._agents: Dict[str, AgentPresence] = {}
+        self.transitions = 0
+
+    def _entry(self, agent: dict) -> AgentPresence:
+        entry = self._agents.get(agent["id"])
+        if entry is None:
+            entry = self._agents[agent["id"]] = AgentPresence(agent["id"], agent.get("name"))
+        return entry
+
+    def _event(self, entry: AgentPresence) -> dict:
+        self.transitions += 1
+        return {
+            "type": "agent_status",
+            "agent_id": entry.agent_id,
+            "name": entry.name,
+            "status": entry.status if entry.online else "OFFLINE",
+            "activity": entry.activity if entry.online else "Offline",
+            "online": entry.online,
+            "timestamp": time.time(),
+        }
+
+    def connected(self, agent: dict) -> Optional[dict]:
+        entry = self._entry(agent)
+        entry.connected = True
+        entry.last_seen = time.time()
+        if entry.online:
+            return None  # Reconnect within the grace period: nothing to announce
+        entry.online = True
+        entry.status, entry.activity = "ACTIVE", "Monitoring Market"
+        return self._event(entry)
+
+    def disconnected(self, agent_id: str):
+        # Not announced yet: a quick reconnect shouldn't flap the dashboards
+        entry = self._agents.get(agent_id)
+        if entry is not None:
+            entry.connected = False
+            entry.last_seen = time.time()
+
+    def update(self, agent: dict, status: str, activity: Optional[str]) -> Optional[dict]:
+        """Records an explicit status; only a change (or coming online) is broadcast."""
+        entry = self._entry(agent)
+        entry.last_seen = time.time()
+        if entry.online and entry.status == status and entry.activity == activity:
+            return None
+        entry.online = True
+        entry.status = status
+        entry.activity = activity
+        return self._event(entry)
+
+    def sweep(self) -> List[dict]:
+        """Marks agents offline whose socket is gone and who haven't been seen for `ttl`."""
+        cutoff = time.time() - self.ttl
+        events = []
+        for entry in self._agents.values():
+            if entry.online and not entry.connected and entry.last_seen < cutoff:
+                entry.online = False
+                events.append(self._event(entry))
+        return events
+
+    def snapshot(self) -> List[dict]:
+        return [entry.to_dict() for entry in self._agents.values()]
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def stats(self) -> dict:
+        online = sum(1 for entry in self._agents.values() if entry.online)
+        return {"agents": len(self._agents), "online": online, "transitions": self.transitions}
@@ -0,0 +1,312 @@
+import logging
+import os
+import random
+import time
+from typing import Dict, Iterable, List, Optional
+
+from google.cloud import firestore
+
+from hub.write_coalescer import WriteCoalescer
+
+logger = logging.getLogger("api_server")
+
+REPUTATION_SHARDS = int(os.getenv("AGENT_MKT_REPUTATION_SHARDS", "8"))
+# History records stamped per compaction transaction (Firestore caps a transaction at 500 writes)
+REPUTATION_COMPACT_CHUNK = int(os.getenv("AGENT_MKT_REPUTATION_COMPACT_CHUNK", "400"))
+MAX_TRANSACTION_WRITES = 500
+
+
+def sum_reputation_shards(shards: Iterable[dict]) -> Dict[str, dict]:
+    """Totals pending shard deltas per agent: {agent_id: {"reputation": x, "transactions": n}}."""
+    totals: Dict[str, dict] = {}
+    for shard in shards:
+        total = totals.setdefault(shard["agent_id"], {"reputation": 0.0, "transactions": 0})
+        total["reputation"] += shard.get("reputation_delta", 0.0)
+        total["transactions"] += shard.get("transactions", 0)
+    return totals
+
+
+def with_reputation(agent: dict, total: Optional[dict]) -> dict:
+    """Folds uncompacted shard totals into an agent document."""
+    if total:
+        agent["global_reputation"] = agent.get("global_reputation", 0.0) + total["reputation"]
+        agent["total_transactions"] = agent.get("total_transactions", 0) + total["transactions"]
+    return agent
+
+
+class MarketRepository:
+    """Async data layer over `firestore.AsyncClient`.
+
+    Every route, the coach and the reputation updater read and write through
+    this class, so no Firestore round trip ever blocks the event loop or
+    borrows a worker from the default thread pool. Snapshot listeners are the
+    one exception: the async client has no `on_snapshot`, so they keep using
+    the sync client on their own watch threads.
+
+    Writes that belong to one logical action share a `WriteBatch`, so they
+    cost one round trip and land atomically. Independent high-rate writes
+    (negotiation steps) go through the group-commit `WriteCoalescer`.
+    """
+
+    def __init__(self, client, coalescer: Optional[WriteCoalescer] = None):
+        self.db = client
+        self.writes = coalescer or WriteCoalescer(client)
+
+    @staticmethod
+    async def _collect(query, transaction=None) -> List[dict]:
+        return [doc.to_dict() async for doc in query.stream(transaction=transaction)]
+
+    @staticmethod
+    async def _first(query) -> Optional[dict]:
+        async for doc in query.limit(1).stream():
+            return doc.to_dict()
+        return None
+
+    # --- Agents ---
+
+    async def find_agent_by_key(self, api_key: str) -> Optional[dict]:
+        return await self._first(self.db.collection("agents").where("api_key", "==", api_key))
+
+    async def verify_agent(self, agent_id: str, api_key: str) -> Optional[dict]:
+        return await self._first(
+            self.db.collection("agents").where("id", "==", agent_id).where("api_key", "==", api_key)
+        )
+
+    async def find_agent(self, name: str, agent_type: str) -> Optional[dict]:
+        return await self._first(
+            self.db.collection("agents").where("name", "==", name).where("type", "==", agent_type)
+        )
+
+    async def create_agent(self, agent_id: str, agent_data: dict):
+        await self.db.collection("agents").document(agent_id).set(agent_data)
+
+    async def list_agents(self) -> List[dict]:
+        """All agents with their live reputation.
+
+        Agents and shards are read in one read-only transaction: a compaction
+        moving deltas from the shards into the agent docs in between the two
+        reads would otherwise count them twice or not at all.
+        """
+        @firestore.async_transactional
+        async def read_in_transaction(transaction):
+            agents = await self._collect(self.db.collection("agents"), transaction)
+            shards = await self._collect(self.db.collection_group("reputation_shards"), transaction)
+            return agents, shards
+
+        agents, shards = await read_in_transaction(self.db.transaction(read_only=True))
+        totals = sum_reputation_shards(shards)
+        return [with_reputation(agent, totals.get(agent.get("id"))) for agent in agents]
+
+    # --- Market items & offers ---
+
+    async def add_market_item(self, payload: dict) -> str:
+        """Stores a market item under a new doc id, which is also written into the item as `id`."""
+        item_ref = self.db.collection("market_items").document()
+        await item_ref.set({**payload, "id": item_ref.id})
+        return item_ref.id
+
+    async def create_offer(self, offer_id: str, offer_data: dict):
+        """Writes the offer and its market_items mirror in one atomic batch."""
+        batch = self.db.batch()
+        batch.set(self.db.collection("market_items").document(offer_id), offer_data)
+        batch.set(self.db.collection("offers").document(offer_id), offer_data)
+        await batch.commit()
+
+    async def get_offer(self, offer_id: str) -> Optional[dict]:
+        snap = await self.db.collection("offers").document(offer_id).get()
+        return snap.to_dict() if snap.exists else None
+
+    async def recent_offers(self, limit: int) -> List[dict]:
+        return await self._collect(
+            self.db.collection("offers").order_by("created_at", direction=firestore.Query.DESCENDING).limit(limit)
+        )
+
+    async def active_market_items(self, now: float) -> List[dict]:
+        return await self._collect(self.db.collection("market_items").where("valid_until", ">", now))
+
+    # --- Negotiations & transactions ---
+
+    async def negotiation_history(self, negotiation_id: str) -> List[dict]:
+        """All steps of a negotiation, oldest first (sorted in memory to avoid a composite index)."""
+        history = await self._collect(
+            self.db.collection("negotiations").where("negotiation_id", "==", negotiation_id)
+        )
+        history.sort(key=lambda h: h.get("timestamp", 0))
+        return history
+
+    async def recent_negotiations(self, limit: int) -> List[dict]:
+        return await self._collect(
+            self.db.collection("negotiations").order_by("timestamp", direction=firestore.Query.DESCENDING).limit(limit)
+        )
+
+    async def add_negotiation_step(self, payload: dict):
+        """Group-committed with concurrent steps; returns once the step is durable."""
+        await self.writes.set(self.db.collection("negotiations").document(), payload)
+
+    async def record_acceptance(self, payload: dict, tx_id: str, tx_data: dict):
+        """Writes the ACCEPT step and its transaction in one atomic batch."""
+        batch = self.db.batch()
+        batch.set(self.db.collection("negotiations").document(), payload)
+        batch.set(self.db.collection("transactions").document(tx_id), tx_data)
+        await batch.commit()
+
+    async def transaction_for_negotiation(self, negotiation_id: str) -> Optional[dict]:
+        return await self._first(
+            self.db.collection("transactions").where("negotiation_id", "==", negotiation_id)
+        )
+
+    async def recent_transactions(self, limit: int) -> List[dict]:
+        return await self._collect(
+            self.db.collection("transactions").order_by("timestamp", direction=firestore.Query.DESCENDING).limit(limit)
+        )
+
+    # --- Feedback ---
+
+    async def add_user_feedback(self, feedback_data: dict):
+        await self.db.collection("user_feedback").document().set(feedback_data)
+
+    async def add_coach_feedback(self, report: dict):
+        await self.db.collection("agent_feedback").document().set(report)
+
+    async def recent_feedback(self, collection: str, limit: int) -> List[dict]:
+        return await self._collect(
+            self.db.collection(collection).order_by("timestamp", direction=firestore.Query.DESCENDING).limit(limit)
+        )
+
+    # --- Listener checkpoints ---
+
+    async def save_checkpoint(self, name: str, read_time):
+        await self.db.collection("system").document("listener_checkpoints").set({name: read_time}, merge=True)
+
+    # --- Reputation ---
+
+    async def reputation_history(self, agent_id: str) -> List[dict]:
+        """Reputation changes oldest first, each with the running `reputation` after it.
+
+        Records written since the last compaction carry only their `change`;
+        their running value continues from the agent's compacted base.
+        """
+        history = await self._collect(self.db.collection("reputation_history").where("agent_id", "==", agent_id))
+        history.sort(key=lambda x: x["timestamp"])
+        pending = [record for record in history if "reputation" not in record]
+        if pending:
+            snap = await self.db.collection("agents").document(agent_id).get()
+            running = snap.to_dict().get("global_reputation", 0.0) if snap.exists else 0.0
+            for record in pending:
+                running += record.get("change", 0.0)
+                record["reputation"] = running
+        return history
+
+    def _reputation_shards(self, agent_id: str):
+        return self.db.collection("agents").document(agent_id).collection("reputation_shards")
+
+    async def apply_reputation(self, agent_id: str, change: float, transaction_id: Optional[str] = None) -> bool:
+        """Adjusts an agent's reputation once per transaction. Returns False if already applied.
+
+        The change lands on a random shard with a server-side increment, so
+        concurrent deals for one busy agent no longer contend on its document
+        and nothing is read besides the idempotency key. The history record
+        holds only the `change`; `compact_reputation` stamps its running
+        `reputation` when it folds the shard into the agent.
+        """
+        shard_ref = self._reputation_shards(agent_id).document(str(random.randrange(REPUTATION_SHARDS)))
+        # Use a deterministic ID for the history record to prevent double-counting
+        hist_ref = self.db.collection("reputation_history").document(
+            f"{agent_id}_{transaction_id}" if transaction_id else None
+        )
+        record = {
+            "agent_id": agent_id,
+            "change": change,
+            "compacted": False,
+            "timestamp": time.time()
+        }
+        if transaction_id:
+            record["transaction_id"] = transaction_id
+
+        @firestore.async_transactional
+        async def update_in_transaction(transaction):
+            # 1. Idempotency Check (P0 Fix)
+            if transaction_id:
+                hist_snap = await hist_ref.get(transaction=transaction)
+                if hist_snap.exists:
+                    return False
+
+            # 2. Increment one shard (never read inside the transaction, so no hot lock)
+            transaction.set(shard_ref, {
+                "agent_id": agent_id,
+                "reputation_delta": firestore.Increment(change),
+                "transactions": firestore.Increment(1)
+            }, merge=True)
+
+            # 3. Create History Record (act as the idempotency key)
+            transaction.set(hist_ref, record)
+            return True
+
+        return await update_in_transaction(self.db.transaction())
+
+    async def compact_reputation(self) -> int:
+        """Folds pending shards into each agent document and deletes them. Returns agents compacted.
+
+        The history records written with those deltas get their running
+        `reputation`, continuing from the agent's compacted base. A busy
+        agent can have more records than fit in one transaction, so they
+        are folded oldest first in chunks: each earlier chunk moves exactly
+        its own changes from the shards into the agent, and the last one
+        folds what remains and deletes the shards.
+        """
+        pending = sum_reputation_shards(await self._collect(self.db.collection_group("reputation_shards")))
+
+        for agent_id in pending:
+            agent_ref = self.db.collection("agents").document(agent_id)
+            shards = self._reputation_shards(agent_id)
+            uncompacted = (self.db.collection("reputation_history")
+                           .where("agent_id", "==", agent_id).where("compacted", "==", False))
+
+            @firestore.async_transactional
+            async def compact_in_transaction(transaction) -> bool:
+                """Folds one chunk; returns True while uncompacted records remain."""
+                snapshot = await agent_ref.get(transaction=transaction)
+                shard_snaps = [s async for s in shards.stream(transaction=transaction)]
+                history_snaps = [h async for h in uncompacted.stream(transaction=transaction)]
+                total = sum_reputation_shards(s.to_dict() for s in shard_snaps).get(agent_id)
+                if not total or not snapshot.exists:
+                    for shard in shard_snaps:
+                        transaction.delete(shard.reference)
+                    return False
+
+                history_snaps.sort(key=lambda h: h.get("timestamp"))
+                # Leave room for the agent update and the shard writes
+                room = MAX_TRANSACTION_WRITES - 1 - max(len(shard_snaps), 1)
+                chunk = history_snaps[:max(1, min(REPUTATION_COMPACT_CHUNK, room))]
+                last = len(chunk) == len(history_snaps)
+
+                base = running = snapshot.get("global_reputation")
+                for record in chunk:
+                    running += record.get("change")
+                    transaction.update(record.reference, {"reputation": running, "compacted": True})
+
+                if last:
+                    transaction.update(agent_ref, {
+                        "global_reputation": base + total["reputation"],
+                        "total_transactions": snapshot.to_dict().get("total_transactions", 0) + total["transactions"]
+                    })
+                    for shard in shard_snaps:
+                        transaction.delete(shard.reference)
+                    return False
+
+                folded = running - base
+                transaction.update(agent_ref, {
+                    "global_reputation": running,
+                    "total_transactions": snapshot.to_dict().get("total_transactions", 0) + len(chunk)
+                })
+                # Take the folded changes back out of the shards (any shard will do: readers sum them all)
+                transaction.set(shard_snaps[0].reference, {
+                    "agent_id": agent_id,
+                    "reputation_delta": firestore.Increment(-folded),
+                    "transactions": firestore.Increment(-len(chunk))
+                }, merge=True)
+                return True
+
+            while await compact_in_transaction(self.db.transaction()):
+                pass
+        return len(pending)
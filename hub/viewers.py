@@ -0,0 +1,86 @@
+import os
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+VIEWER_HZ = float(os.getenv("AGENT_MKT_VIEWER_HZ", "5"))
+VIEWER_MAX_PENDING = int(os.getenv("AGENT_MKT_VIEWER_MAX_PENDING", "500"))
+
+
+def viewer_key(message: dict) -> Optional[str]:
+    """Key under which a newer event replaces an unsent one for dashboards (None = always sent).
+
+    Mirrors how the dashboard reduces events: one status per agent, one row
+    per order (by request/offer id) and the latest step per negotiation.
+    Transactions, coach reports and other one-off events are never merged.
+    """
+    msg_type = message.get("type")
+    if msg_type == "agent_status":
+        return f"status:{message.get('agent_id')}"
+    if msg_type == "market_event":
+        data = message.get("data") or {}
+        kind = data.get("type")
+        if kind == "Proposal" and data.get("negotiation_id"):
+            return f"proposal:{data['negotiation_id']}"
+        if kind == "Request" and data.get("id"):
+            return f"request:{data['id']}"
+        if kind == "Offer" and data.get("offer_id"):
+            return f"offer:{data['offer_id']}"
+    return None
+
+
+class ViewerFeed:
+    """Conflating buffer behind the batched viewer tier.
+
+    Broadcasts are merged by `viewer_key` between flushes and sent as one
+    `{"type": "batch", "events": [...]}` frame, encoded once for all viewers,
+    every `1 / hz` seconds. What a dashboard receives is bounded by the
+    cadence and `max_pending`, not by the market's event rate.
+    """
+
+    def __init__(self, encode: Callable[[dict], str], hz: float = VIEWER_HZ,
+                 max_pending: int = VIEWER_MAX_PENDING):
+        self.interval = 1.0 / hz
+        self.max_pending = max_pending
+        self._encode = encode
+        self._pending: "OrderedDict[Hashable, dict]" = OrderedDict()
+        self._unkeyed = 0
+        self.received = 0
+        self.conflated = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def add(self, message: dict):
+        self.received += 1
+        key = viewer_key(message)
+        if key is None:
+            self._unkeyed += 1
+            key = self._unkeyed  # ints never collide with the string keys
+        elif key in self._pending:
+            self.conflated += 1
+            del self._pending[key]  # Re-queue at the end so the batch keeps arrival order
+        self._pending[key] = message
+        if len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+            self.dropped += 1
+
+    def take(self) -> Optional[str]:
+        """Returns the batch frame for everything pending since the last flush, or None."""
+        if not self._pending:
+            return None
+        frame = self._encode({"type": "batch", "events": list(self._pending.values())})
+        self._pending.clear()
+        self.batches += 1
+        return frame
+
+    def clear(self):
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "hz": round(1.0 / self.interval, 2),
+            "pending": len(self._pending),
+            "received": self.received,
+            "conflated": self.conflated,
+            "dropped": self.dropped,
+            "batches": self.batches,
+        }
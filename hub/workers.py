@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import zlib
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger("api_server")
+
+WORKER_COUNT = int(os.getenv("AGENT_MKT_WORKERS", "4"))
+WORKER_QUEUE_SIZE = int(os.getenv("AGENT_MKT_WORKER_QUEUE_SIZE", "1000"))
+WORKER_MAX_RETRIES = int(os.getenv("AGENT_MKT_WORKER_MAX_RETRIES", "3"))
+WORKER_RETRY_BASE = float(os.getenv("AGENT_MKT_WORKER_RETRY_BASE", "0.2"))
+
+Job = Callable[[], Awaitable[None]]
+
+
+class KeyedWorkerPool:
+    """Bounded async worker pool for side effects of snapshot listeners.
+
+    Jobs are routed to a worker by a stable hash of their key, so jobs for
+    the same key (e.g. one agent) run strictly in submission order while
+    different keys proceed in parallel. A failing job is retried in place
+    with jittered exponential backoff before the worker moves on, which keeps
+    that ordering intact. Listener threads call `submit_threadsafe`; when a
+    worker's queue is full, the calling thread waits for room instead of
+    dropping work.
+    """
+
+    def __init__(self, workers: int = WORKER_COUNT, max_queue: int = WORKER_QUEUE_SIZE,
+                 max_retries: int = WORKER_MAX_RETRIES, retry_base: float = WORKER_RETRY_BASE):
+        self.size = max(1, workers)
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queues: List[asyncio.Queue] = []
+        self.tasks: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self.lag_avg = 0.0  # Exponentially weighted, seconds
+
+    def start(self):
+        """Creates the worker tasks on the running loop."""
+        self.loop = asyncio.get_running_loop()
+        self.queues = [asyncio.Queue(maxsize=self.max_queue) for _ in range(self.size)]
+        self.tasks = [self.loop.create_task(self._run(q)) for q in self.queues]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def _queue_for(self, key: str) -> asyncio.Queue:
+        return self.queues[zlib.crc32(key.encode("utf-8")) % self.size]
+
+    async def submit(self, key: str, job: Job, name: str = "job"):
+        await self._queue_for(key).put((time.monotonic(), key, name, job))
+        self.enqueued += 1
+
+    def submit_threadsafe(self, key: str, job: Job, name: str = "job"):
+        """Enqueues from a non-loop thread, blocking only while the target queue is full."""
+        asyncio.run_coroutine_threadsafe(self.submit(key, job, name), self.loop).result()
+
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            enqueued_at, key, name, job = await queue.get()
+            lag = time.monotonic() - enqueued_at
+            self.lag_last = lag
+            self.lag_max = max(self.lag_max, lag)
+            self.lag_avg = lag if not self.completed + self.failed else 0.9 * self.lag_avg + 0.1 * lag
+            try:
+                await self._attempt(key, name, job)
+            finally:
+                queue.task_done()
+
+    async def _attempt(self, key: str, name: str, job: Job):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await job()
+                self.completed += 1
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    logger.error(f"⚠️ [Workers] {name} for {key} failed after {attempt + 1} attempts: {e}")
+                    return
+                self.retried += 1
+                delay = self.retry_base * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"🔁 [Workers] {name} for {key} failed ({e}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def join(self):
+        """Waits until every queued job has been processed (used by tests and shutdown)."""
+        await asyncio.gather(*[q.join() for q in self.queues])
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.size,
+            "depth": [q.qsize() for q in self.queues],
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "lag_last_ms": round(self.lag_last * 1000, 1),
+            "lag_avg_ms": round(self.lag_avg * 1000, 1),
+            "lag_max_ms": round(self.lag_max * 1000, 1),
+        }
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional, Set, Tuple
+
+logger = logging.getLogger("api_server")
+
+WRITE_FLUSH_MS = float(os.getenv("AGENT_MKT_WRITE_FLUSH_MS", "5"))
+# Firestore rejects batches with more than 500 writes
+WRITE_MAX_BATCH = min(int(os.getenv("AGENT_MKT_WRITE_MAX_BATCH", "500")), 500)
+
+
+class WriteCoalescer:
+    """Group commit for high-rate, independent document writes.
+
+    Writes queued within one flush window are committed together in a single
+    `WriteBatch`. Each caller awaits the future returned by `set`, which
+    resolves only once its batch is durable, so the route still answers after
+    the write lands; it just shares the round trip with its neighbours. If a
+    batch fails, every write in it fails with the same exception.
+    """
+
+    def __init__(self, client, window_ms: float = WRITE_FLUSH_MS, max_batch: int = WRITE_MAX_BATCH):
+        self.db = client
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending: List[Tuple[object, dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()  # Flushes started by a full batch (strong refs until done)
+        self.batches = 0
+        self.writes = 0
+        self.failures = 0
+
+    def set(self, ref, data: dict) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((ref, data, future))
+        # A flush already running keeps draining the queue; the timer backs it up if it just finished
+        if len(self._pending) >= self.max_batch and not self._flushes:
+            task = loop.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        elif self._timer is None:
+            self._timer = loop.create_task(self._flush_later())
+        return future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        while self._pending:
+            chunk = self._pending[:self.max_batch]
+            self._pending = self._pending[self.max_batch:]
+            batch = self.db.batch()
+            for ref, data, _ in chunk:
+                batch.set(ref, data)
+            try:
+                await batch.commit()
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"⚠️ [Writes] Batch of {len(chunk)} failed: {e}")
+                for _, _, future in chunk:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.writes += len(chunk)
+            for _, _, future in chunk:
+                if not future.done():
+                    future.set_result(None)
+
+    async def close(self):
+        """Commits whatever is still queued and waits for in-flight flushes (on shutdown)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "writes": self.writes,
+            "failures": self.failures,
+        }
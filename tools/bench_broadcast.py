@@ -0,0 +1,97 @@
+"""Microbenchmark: WebSocket fan-out cost per event at 100, 1k and 10k connections.
+
+Compares the legacy path (one `send_json` per socket, i.e. one JSON encode per
+socket, awaited with gather) with ConnectionManager's encode-once broadcast
+through the per-connection writer queues, timed until every queue has drained.
+Sockets are in-memory fakes, so the numbers isolate the CPU spent inside the
+event loop.
+
+Usage: PYTHONPATH=. python tools/bench_broadcast.py [rounds]
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.connections import ConnectionManager
+
+SAMPLE_EVENT = {
+    "type": "market_event",
+    "data": {
+        "type": "Proposal",
+        "negotiation_id": "neg-1a2b3c4d",
+        "offer_id": "off-9f8e7d6c",
+        "product": "High-Performance Compute Node",
+        "sender_id": "ext-buyer-1a2b3c4d",
+        "receiver_id": "ext-seller-5e6f7a8b",
+        "action": "COUNTER",
+        "price": 113.84,
+        "quantity": 3,
+        "reasoning": "It seems like uptime matters a lot to you. How am I supposed to justify that price to my team?",
+        "timestamp": 1760000000.123,
+        "source": "external_api"
+    }
+}
+
+class FakeClient:
+    host = "127.0.0.1"
+    port = 0
+
+class FakeWebSocket:
+    """Mimics Starlette's WebSocket send path without any I/O."""
+    client = FakeClient()
+
+    def __init__(self):
+        self.sent = 0
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send(self, message):
+        self.sent += 1
+
+    async def send_text(self, data):
+        await self.send({"type": "websocket.send", "text": data})
+
+    async def send_json(self, data, mode="text"):
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        await self.send({"type": "websocket.send", "text": text})
+
+async def legacy_broadcast(connections, message):
+    await asyncio.gather(*[c.send_json(message) for c in connections], return_exceptions=True)
+
+async def run(rounds):
+    print(f"{'connections':>12} | {'legacy µs/event':>16} | {'encode-once µs/event':>21} | {'speedup':>7}")
+    for n in (100, 1_000, 10_000):
+        manager = ConnectionManager()
+        for _ in range(n):
+            websocket = FakeWebSocket()
+            await manager.connect(websocket)
+            manager.identify_viewer(websocket)
+        reps = max(3, rounds * 100 // n)
+
+        start = time.perf_counter()
+        for _ in range(reps):
+            await legacy_broadcast(manager.active_connections, SAMPLE_EVENT)
+        legacy = (time.perf_counter() - start) / reps
+
+        start = time.perf_counter()
+        for _ in range(reps):
+            await manager.broadcast(SAMPLE_EVENT)
+        while any(channel.depth for channel in manager.channels.values()):
+            await asyncio.sleep(0)
+        encode_once = (time.perf_counter() - start) / reps
+
+        for websocket in list(manager.active_connections):
+            manager.disconnect(websocket)
+
+        print(f"{n:>12} | {legacy * 1e6:>16.0f} | {encode_once * 1e6:>21.0f} | {legacy / encode_once:>6.2f}x")
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
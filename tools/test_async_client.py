@@ -0,0 +1,159 @@
+import sys
+import os
+import json
+import asyncio
+import unittest
+
+from aiohttp import web
+
+os.environ["AGENT_MKT_HTTP_RETRIES"] = "2"
+os.environ["AGENT_MKT_HTTP_RETRY_BASE"] = "0.01"
+
+# Add parent directory to path to import agents.lib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.lib.async_client import AsyncMarketClient
+
+class StubMarket:
+    """Just enough of the hub for one agent: status, active items, a failing route and the WebSocket."""
+
+    def __init__(self):
+        self.hits = {}
+        self.statuses = []
+        self.identified = []
+        self.slow_sync = asyncio.Event()  # While clear, /market/active hangs
+        self.slow_sync.set()
+        self.sockets = []
+        self.disconnects = 0
+        app = web.Application()
+        app.router.add_post("/agents/status", self.status)
+        app.router.add_get("/market/active", self.active)
+        app.router.add_route("*", "/unavailable", self.unavailable)
+        app.router.add_get("/ws/market", self.ws)
+        self.runner = web.AppRunner(app)
+
+    async def start(self):
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def hit(self, request):
+        key = f"{request.method} {request.path}"
+        self.hits[key] = self.hits.get(key, 0) + 1
+
+    async def status(self, request):
+        self.hit(request)
+        self.statuses.append(await request.json())
+        return web.json_response({"status": "ok"})
+
+    async def active(self, request):
+        self.hit(request)
+        await self.slow_sync.wait()
+        category = request.query.get("category")
+        return web.json_response({"items": [{"type": "Request", "id": f"item-{category}", "category": category}]})
+
+    async def unavailable(self, request):
+        self.hit(request)
+        return web.json_response({"detail": "busy"}, status=503)
+
+    async def ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.append(ws)
+        async for message in ws:
+            data = json.loads(message.data)
+            if data.get("type") == "identify":
+                self.identified.append(data["agent_id"])
+                await ws.send_str(json.dumps({"type": "identified", "agent_id": data["agent_id"], "epoch": "e1", "seq": 5}))
+                await ws.send_str(json.dumps({"type": "market_event", "seq": 6, "data": {"type": "Offer", "offer_id": "off-1"}}))
+        self.disconnects += 1
+        return ws
+
+async def until(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+class TestAsyncMarketClient(unittest.TestCase):
+    def run_with_market(self, scenario):
+        async def main():
+            market = StubMarket()
+            url = await market.start()
+            client = AsyncMarketClient("buyer", "Async Test Buyer", "cloud", api_url=url)
+            client.agent_id, client.api_key = "buyer-1", "sk-test"
+            try:
+                await scenario(market, client)
+            finally:
+                await client.close()
+                await market.stop()
+        asyncio.run(main())
+
+    def test_stream_handshake_and_resync(self):
+        print("\n⚡ Testing the async client's identify, seq tracking and resync...")
+
+        async def scenario(market, client):
+            await client.register()  # Identity already known: just starts heartbeat and listener
+            events = [await client.get_event(timeout=2) for _ in range(3)]
+            self.assertEqual(sorted(e["data"].get("id") or e["data"].get("offer_id") for e in events),
+                             ["item-cloud", "item-general", "off-1"])
+            self.assertEqual(market.identified, ["buyer-1"])
+            self.assertTrue(client.ws_identified)
+            self.assertEqual((client.stream_epoch, client.last_seq), ("e1", 6))
+            # Identified restates the status so the server's presence entry is current
+            await until(lambda: client._sent_status == ("ACTIVE", "Monitoring Market"))
+
+            await market.sockets[0].send_str(json.dumps({"type": "resync_required", "epoch": "e2", "seq": 3}))
+            resynced = [await client.get_event(timeout=2) for _ in range(2)]
+            self.assertEqual(sorted(e["data"]["id"] for e in resynced), ["item-cloud", "item-general"])
+            self.assertEqual((client.stream_epoch, client.last_seq), ("e2", 6))
+            self.assertEqual(market.hits["GET /market/active"], 4)
+            await until(lambda: not client._side_tasks)
+
+        self.run_with_market(scenario)
+        print("✅ SUCCESS: Stream position and snapshot resync follow the server.")
+
+    def test_only_idempotent_requests_retry(self):
+        print("\n⚡ Testing async client retries...")
+
+        async def scenario(market, client):
+            status, body = await client._request("GET", "/unavailable", idempotent=True)
+            self.assertEqual((status, body), (503, {"detail": "busy"}))
+            self.assertEqual(market.hits["GET /unavailable"], 3)
+
+            status, _ = await client._request("POST", "/unavailable", json={})
+            self.assertEqual(status, 503)
+            self.assertEqual(market.hits["POST /unavailable"], 1)  # Never replayed: could double-apply
+            self.assertEqual(client.http_stats()["/unavailable"]["errors"], 4)
+
+        self.run_with_market(scenario)
+        print("✅ SUCCESS: Idempotent calls retried, others sent once.")
+
+    def test_close_stops_everything(self):
+        print("\n⚡ Testing async client shutdown...")
+
+        async def scenario(market, client):
+            market.slow_sync.clear()  # The first-connect sync is still in flight at close()
+            await client.register()
+            await until(lambda: market.identified and client._side_tasks)
+            tasks = client._tasks + list(client._side_tasks)
+
+            await client.close()
+            self.assertTrue(all(task.done() for task in tasks))
+            self.assertEqual((client._tasks, client._side_tasks), ([], set()))
+            self.assertTrue(client.session.closed)
+            self.assertIsNone(client.ws)
+            await until(lambda: market.disconnects == 1)
+            market.slow_sync.set()
+
+        self.run_with_market(scenario)
+        print("✅ SUCCESS: Heartbeat, listener and in-flight syncs were all stopped.")
+
+if __name__ == "__main__":
+    unittest.main()
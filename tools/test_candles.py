@@ -0,0 +1,55 @@
+import sys
+import os
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.candles import CandleStore
+
+def tx(tx_id, price, ts, quantity=1, product="GPU Cluster Time"):
+    return {"id": tx_id, "amount": price, "timestamp": ts, "quantity": quantity, "product": product, "status": "COMPLETED"}
+
+class TestCandles(unittest.TestCase):
+    def test_ohlcv_and_vwap(self):
+        print("\n🕯️ Testing incremental OHLCV candles...")
+        store = CandleStore(max_buckets=3, recent_size=3)
+
+        # Arrivals are out of order; open/close must follow trade time
+        store.ingest(tx("tx-2", 120.0, 6010, quantity=3))
+        store.ingest(tx("tx-1", 100.0, 6000))
+        store.ingest(tx("tx-3", 90.0, 6050))
+        self.assertFalse(store.ingest(tx("tx-3", 90.0, 6050)))  # Redelivered by the listener
+        store.ingest(tx("tx-4", 110.0, 6070))
+
+        one_min = store.candles("GPU Cluster Time", "1m")
+        self.assertEqual([c["t"] for c in one_min], [6000, 6060])
+        first = one_min[0]
+        self.assertEqual((first["open"], first["high"], first["low"], first["close"]), (100.0, 120.0, 90.0, 90.0))
+        self.assertEqual(first["volume"], 5)
+        self.assertAlmostEqual(first["vwap"], (100 + 360 + 90) / 5)
+        self.assertEqual(store.candles("GPU Cluster Time", "5m")[0]["trades"], 4)
+
+        # Range queries and bucket retention
+        self.assertEqual([c["t"] for c in store.candles("GPU Cluster Time", "1m", start=6060)], [6060])
+        for i, ts in enumerate((6120, 6180, 6240)):
+            store.ingest(tx(f"tx-{5 + i}", 100.0, ts))
+        self.assertEqual([c["t"] for c in store.candles("GPU Cluster Time", "1m")], [6120, 6180, 6240])
+
+        # The trend buffer keeps the newest trades by timestamp
+        self.assertEqual([t["id"] for t in store.latest_trades(3)], ["tx-7", "tx-6", "tx-5"])
+        self.assertIsNone(store.latest_trades(10))
+
+        # Like the transactions query it replaces, the buffer lists every status, latest version per id
+        self.assertFalse(store.ingest({**tx("tx-8", 95.0, 6300), "status": "PENDING"}))
+        self.assertEqual([t["id"] for t in store.latest_trades(3)], ["tx-8", "tx-7", "tx-6"])
+        self.assertTrue(store.ingest(tx("tx-8", 95.0, 6300)))
+        self.assertEqual([(t["id"], t["status"]) for t in store.latest_trades(2)], [("tx-8", "COMPLETED"), ("tx-7", "COMPLETED")])
+        self.assertEqual(store.candles("GPU Cluster Time", "1m")[-1]["t"], 6300)
+
+        with self.assertRaises(ValueError):
+            store.candles("GPU Cluster Time", "15m")
+        print("✅ SUCCESS: Candles aggregate incrementally and deduplicate redeliveries.")
+
+if __name__ == "__main__":
+    unittest.main()
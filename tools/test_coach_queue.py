@@ -0,0 +1,101 @@
+import sys
+import os
+import asyncio
+import random
+import time
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.coach import CoachQueue
+
+class TestCoachQueue(unittest.TestCase):
+    def test_bounded_deduplicated_analysis(self):
+        print("\n🎬 Testing coach work queue...")
+
+        async def scenario():
+            running, peak, analyzed = [0], [0], []
+
+            async def analyze(negotiation_id, involved_agents):
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+                # Blocking SDK calls go to the coach's own executor
+                await coach.run_blocking(time.sleep, 0.01)
+                running[0] -= 1
+                analyzed.append(negotiation_id)
+
+            coach = CoachQueue(analyze, concurrency=2, max_queue=4, rate_per_min=6000, burst=10,
+                               sample_threshold=1.0, delay=0)
+            coach.start()
+            outcomes = [coach.submit(f"neg-{i}", ["buyer-1", "seller-1"]) for i in range(5)]
+            outcomes.append(coach.submit("neg-0", ["seller-1", "buyer-1"]))  # Both parties ended it
+            self.assertEqual(outcomes, ["queued"] * 4 + ["dropped", "duplicate"])
+
+            await coach.queue.join()
+            self.assertEqual(sorted(analyzed), ["neg-0", "neg-1", "neg-2", "neg-3"])
+            self.assertEqual(peak[0], 2)
+            stats = coach.stats()
+            self.assertEqual((stats["completed"], stats["dropped"], stats["duplicate"]), (4, 1, 1))
+            self.assertTrue(any(t.name.startswith("coach") for t in coach.executor._threads))
+            await coach.stop()
+
+            # Under load, admission turns into sampling before the queue is full
+            random.seed(7)
+            coach = CoachQueue(analyze, concurrency=1, max_queue=10, sample_threshold=0.0, delay=0)
+            results = [coach.submit(f"neg-s{i}", []) for i in range(10)]
+            self.assertEqual(results[0], "queued")
+            self.assertIn("sampled_out", results)
+
+        asyncio.run(scenario())
+        print("✅ SUCCESS: Analyses were capped, deduplicated and shed under load.")
+
+    def test_rate_limit(self):
+        print("\n🎬 Testing coach token bucket...")
+
+        async def scenario():
+            async def analyze(negotiation_id, involved_agents):
+                pass
+
+            coach = CoachQueue(analyze, concurrency=3, max_queue=10, rate_per_min=600, burst=1, delay=0)
+            coach.start()
+            start = time.monotonic()
+            for i in range(3):
+                coach.submit(f"neg-{i}", [])
+            await coach.queue.join()
+            # One token up front, then 10/s: the third call waits ~0.2s
+            self.assertGreaterEqual(time.monotonic() - start, 0.15)
+            await coach.stop()
+
+        asyncio.run(scenario())
+        print("✅ SUCCESS: LLM calls were paced by the token bucket.")
+
+    def test_batch_mode(self):
+        print("\n🎬 Testing batched coach requests...")
+
+        async def scenario():
+            batches = []
+
+            async def analyze(negotiation_id, involved_agents):
+                self.fail("Batch mode must not fall back to single analyses")
+
+            async def analyze_batch(batch):
+                batches.append([negotiation_id for negotiation_id, _ in batch])
+
+            coach = CoachQueue(analyze, concurrency=1, max_queue=10, rate_per_min=6000, delay=0,
+                               analyze_batch=analyze_batch, batch_size=3, batch_window_ms=20)
+            coach.start()
+            for i in range(4):
+                coach.submit(f"neg-{i}", ["buyer-1", "seller-1"])
+            await coach.queue.join()
+            # A full batch goes out at once; the straggler leaves when the window closes
+            self.assertEqual(batches, [["neg-0", "neg-1", "neg-2"], ["neg-3"]])
+            stats = coach.stats()
+            self.assertEqual((stats["batches"], stats["completed"], stats["avg_batch_size"]), (2, 4, 2.0))
+            await coach.stop()
+
+        asyncio.run(scenario())
+        print("✅ SUCCESS: Finished negotiations were grouped into batched requests.")
+
+if __name__ == "__main__":
+    unittest.main()
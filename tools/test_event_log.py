@@ -0,0 +1,87 @@
+import sys
+import os
+import json
+import asyncio
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.connections import ConnectionManager
+from hub.event_log import EventLog
+
+class FakeClient:
+    host = "127.0.0.1"
+    port = 0
+
+class FakeWebSocket:
+    client = FakeClient()
+
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+def proposal(neg_id, category="cloud"):
+    return {"type": "market_event", "data": {"type": "Proposal", "negotiation_id": neg_id, "category": category}}
+
+class TestEventLog(unittest.TestCase):
+    def test_since_and_gaps(self):
+        print("\n📜 Testing sequence numbers and the replay ring...")
+        log = EventLog(max_events=3)
+        for i in range(5):
+            seq, frame = log.append({"type": "agent_status", "n": i})
+            self.assertEqual(json.loads(frame)["seq"], seq)
+        self.assertEqual([e[0] for e in log.since(log.epoch, 3)], [4, 5])
+        self.assertEqual(log.since(log.epoch, 5), [])
+        self.assertIsNone(log.since(log.epoch, 1))  # Seq 2 already fell out of the ring
+        self.assertIsNone(log.since("old-epoch", 4))  # Seq from another server process
+        self.assertIsNone(log.since(log.epoch, 9))
+        print("✅ SUCCESS: Gaps inside the ring replay, older ones require a snapshot.")
+
+    def test_resume_replays_only_missed_events(self):
+        print("\n📜 Testing delta resync for a reconnecting agent...")
+
+        async def scenario():
+            manager = ConnectionManager()
+            first = FakeWebSocket()
+            await manager.connect(first)
+            manager.identify("buyer-1", first)
+            manager.subscribe(first, {("category", "cloud")})
+            await manager.broadcast(proposal("neg-1"))
+            await asyncio.sleep(0.01)
+            last_seq = first.frames[-1]["seq"]
+            manager.disconnect(first)
+
+            # While offline: one relevant broadcast, one for another category, one targeted message
+            await manager.broadcast(proposal("neg-2"))
+            await manager.broadcast(proposal("neg-3", category="furniture"))
+            await manager.send_to_agent("buyer-1", {"type": "negotiation_concluded", "negotiation_id": "neg-2"})
+            await manager.send_to_agent("seller-9", {"type": "negotiation_concluded", "negotiation_id": "neg-9"})
+
+            second = FakeWebSocket()
+            await manager.connect(second)
+            manager.identify("buyer-1", second)
+            manager.subscribe(second, {("category", "cloud")})
+            reply = manager.resume(second, "buyer-1", manager.events.epoch, last_seq)
+            stale = manager.resume(second, "buyer-1", "old-epoch", last_seq)
+            await asyncio.sleep(0.01)
+            return reply, stale, second.frames
+
+        reply, stale, frames = asyncio.run(scenario())
+        # The targeted message was already flushed from the mailbox on identify, so only the broadcast replays
+        self.assertEqual((reply["type"], reply["replayed"]), ("resumed", 1))
+        self.assertEqual(stale["type"], "resync_required")
+        self.assertEqual([f["type"] for f in frames], ["negotiation_concluded", "market_event"])
+        self.assertEqual(frames[1]["data"]["negotiation_id"], "neg-2")
+        print("✅ SUCCESS: Only the missed events for this agent were replayed.")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,7 @@
 
 import sys
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi.testclient import TestClient
 
 # Mock the firestore client BEFORE importing api_server to avoid init crashes
@@ -29,6 +29,10 @@ class TestIntegrity(unittest.TestCase):
         self.mock_db = MagicMock()
         app.state.db = self.mock_db
         
+        # Mock the async repository every route reads and writes through
+        self.mock_repo = AsyncMock()
+        app.state.repo = self.mock_repo
+        
         # Mock Publisher
         app.state.publisher = MagicMock()
 
@@ -53,30 +57,21 @@ class TestIntegrity(unittest.TestCase):
         # api_server uses datetime.utcnow() for 'now'
         auth_cache["sk-valid"] = ({"id": seller_id, "type": "seller", "name": "Seller"}, datetime.utcnow() + timedelta(seconds=300))
         
-        # We need to mock the history query in 'negotiate' endpoint
+        # We need to mock the history lookup in 'negotiate' endpoint
         # The code calls: 
-        # history_query = get_db().collection("negotiations").where(...).order_by(...).limit(2).get()
-        
-        # Mock the chain
-        col_mock = self.mock_db.collection.return_value
-        query_mock = col_mock.where.return_value.order_by.return_value.limit.return_value
+        # history = await get_repo().negotiation_history(negotiation_id)
         
         # SCENARIO: Malicious ACCEPT
         # History shows Buyer proposed 90. Seller accepts 1000.
-        
-        # Mock document snapshot for history
-        def create_doc(data):
-            doc = MagicMock()
-            doc.to_dict.return_value = data
-            return doc
             
         # Last message was Buyer proposing 90
-        last_msg = create_doc({"sender_id": buyer_id, "price": 90.0})
-        # Previous msg (irrelevant)
-        prev_msg = create_doc({"sender_id": seller_id, "price": 1000.0}) # old proposal
+        last_msg = {"negotiation_id": neg_id, "sender_id": buyer_id, "receiver_id": seller_id,
+                    "action": "COUNTER", "price": 90.0, "timestamp": 1000.0}
         
-        # The query returns these docs
-        query_mock.get.return_value = [last_msg] 
+        # The repository returns the stored history
+        self.mock_repo.negotiation_history.return_value = [last_msg]
+        # The original offer was listed at 95, so 1000 cannot match it either
+        self.mock_repo.get_offer.return_value = {"offer_id": offer_id, "product": "Widget", "price": 95.0}
         
         # Also need to mock Offer lookup if logic falls back to it? 
         # Logic: 
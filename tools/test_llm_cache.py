@@ -0,0 +1,56 @@
+import sys
+import os
+import tempfile
+import unittest
+
+# Add parent directory to path to import agents.lib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.lib.llm_cache import LLMCache, is_json_response
+
+class TestLLMCache(unittest.TestCase):
+    def test_hits_eviction_and_validation(self):
+        print("\n🗃️ Testing LLM response cache...")
+        calls = []
+
+        def generate(prompt):
+            calls.append(prompt)
+            return '{"action": "ACCEPT"}' if "ok" in prompt else "not json"
+
+        cache = LLMCache(max_entries=2, ttl=60, path=None, enabled=True)
+        cache.get_or_generate("gemini-x", "Offer ok\n   at $100", generate, is_json_response)
+        # Same prompt modulo whitespace hits; a different model misses
+        cache.get_or_generate("gemini-x", "Offer ok at $100", generate, is_json_response)
+        cache.get_or_generate("gemini-y", "Offer ok at $100", generate, is_json_response)
+        self.assertEqual(len(calls), 2)
+
+        # Invalid answers are never cached
+        cache.get_or_generate("gemini-x", "bad", generate, is_json_response)
+        cache.get_or_generate("gemini-x", "bad", generate, is_json_response)
+        self.assertEqual(len(calls), 4)
+
+        # LRU: the oldest entry was evicted by the third valid one
+        cache.get_or_generate("gemini-x", "ok 3", generate, is_json_response)
+        self.assertIsNone(cache.get("gemini-x", "Offer ok at $100"))
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["hits"]), (2, 1))
+
+        # TTL
+        cache.ttl = 0
+        self.assertIsNone(cache.get("gemini-x", "ok 3"))
+        print("✅ SUCCESS: Cache keys on model + normalized prompt with LRU/TTL eviction.")
+
+    def test_sqlite_store(self):
+        print("\n🗃️ Testing LLM cache persistence...")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "llm_cache.db")
+            LLMCache(path=path, enabled=True).put("gemini-x", "prompt", '{"a": 1}')
+            restarted = LLMCache(path=path, enabled=True)
+            self.assertEqual(restarted.get("gemini-x", "prompt"), '{"a": 1}')
+            self.assertEqual(restarted.stats()["disk_hits"], 1)
+            self.assertEqual(restarted.get("gemini-x", "prompt"), '{"a": 1}')
+            self.assertEqual(restarted.stats()["hits"], 1)  # Promoted to memory
+        print("✅ SUCCESS: Entries survive a restart through SQLite.")
+
+if __name__ == "__main__":
+    unittest.main()
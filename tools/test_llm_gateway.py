@@ -0,0 +1,85 @@
+import sys
+import os
+import time
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+# Add parent directory to path to import agents.lib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.lib.llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailable
+from agents.lib.llm_cache import LLMCache, is_json_response
+
+class FakeModel:
+    """Plays back a script of outcomes: a string answer, an exception, or ("slow", seconds)."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        outcome = self.script.pop(0) if self.script else '{"action": "ACCEPT"}'
+        if isinstance(outcome, Exception):
+            raise outcome
+        if isinstance(outcome, tuple):
+            time.sleep(outcome[1])
+            outcome = '{"action": "COUNTER"}'
+        return SimpleNamespace(text=outcome, usage_metadata=SimpleNamespace(total_token_count=420))
+
+class TestLLMGateway(unittest.TestCase):
+    def test_retries_deadline_and_breaker(self):
+        print("\n🛡️ Testing LLM gateway...")
+
+        # A transient error and an invalid answer are retried within the deadline
+        model = FakeModel(RuntimeError("503"), "not json")
+        llm = LLMGateway(model, "gemini-x", deadline=2, max_retries=2, retry_base=0.01)
+        self.assertEqual(llm.generate("p", validate=is_json_response), '{"action": "ACCEPT"}')
+        stats = llm.stats()
+        self.assertEqual((stats["retries"], stats["errors"], stats["invalid"]), (2, 1, 1))
+        self.assertEqual(stats["tokens"]["count"], 2)  # The failed attempt reported no usage
+
+        # A hung call is abandoned at the deadline instead of holding the worker
+        llm = LLMGateway(FakeModel(("slow", 1.0)), "gemini-x", deadline=0.1, max_retries=0)
+        start = time.monotonic()
+        with self.assertRaises(LLMUnavailable):
+            llm.generate("p")
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(llm.stats()["timeouts"], 1)
+
+        # Consecutive failures open the breaker; calls then short-circuit until a probe succeeds
+        breaker = CircuitBreaker(threshold=2, reset_timeout=0.05)
+        model = FakeModel(RuntimeError("down"), RuntimeError("down"))
+        llm = LLMGateway(model, "gemini-x", deadline=2, max_retries=3, retry_base=0.001, breaker=breaker)
+        with self.assertRaises(LLMUnavailable):
+            llm.generate("p")
+        self.assertEqual((model.calls, breaker.state), (2, "open"))
+        with self.assertRaises(LLMUnavailable):
+            llm.generate("p")
+        self.assertEqual((model.calls, llm.stats()["short_circuited"]), (2, 1))
+        time.sleep(0.06)
+        self.assertEqual(llm.generate("p"), '{"action": "ACCEPT"}')
+        self.assertEqual(breaker.state, "closed")
+        print("✅ SUCCESS: Retries, deadlines and the circuit breaker behave as configured.")
+
+    def test_async_and_cache(self):
+        print("\n🛡️ Testing async LLM gateway with cache...")
+
+        async def scenario():
+            model = FakeModel()
+            llm = LLMGateway(model, "gemini-x", cache=LLMCache(path=None, enabled=True))
+            first = await llm.agenerate("same prompt", validate=is_json_response)
+            second = await llm.agenerate("same  prompt", validate=is_json_response)
+            self.assertEqual(first, second)
+            self.assertEqual((model.calls, llm.stats()["cache_hits"]), (1, 1))
+
+            slow = LLMGateway(FakeModel(("slow", 1.0)), "gemini-x", deadline=0.1, max_retries=0)
+            with self.assertRaises(LLMUnavailable):
+                await slow.agenerate("p")
+
+        asyncio.run(scenario())
+        print("✅ SUCCESS: Async calls share the cache and honour deadlines.")
+
+if __name__ == "__main__":
+    unittest.main()
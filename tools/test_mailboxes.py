@@ -0,0 +1,75 @@
+import sys
+import os
+import json
+import asyncio
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.connections import ConnectionManager
+from hub.mailboxes import Mailboxes
+
+class FakeClient:
+    host = "127.0.0.1"
+    port = 0
+
+class FakeWebSocket:
+    client = FakeClient()
+
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+def concluded(neg_id):
+    return {"type": "negotiation_concluded", "negotiation_id": neg_id}
+
+class TestMailboxes(unittest.TestCase):
+    def test_bounds_and_ttl(self):
+        print("\n📪 Testing mailbox bounds and expiry...")
+        boxes = Mailboxes(max_size=2, ttl=60, max_agents=1)
+        for seq in (1, 2, 3):
+            boxes.put("buyer-1", seq, f"frame-{seq}")
+        self.assertEqual(boxes.drain("buyer-1"), [(2, "frame-2"), (3, "frame-3")])
+        self.assertEqual(boxes.drain("buyer-1"), [])
+
+        boxes.put("buyer-1", 4, "frame-4")
+        boxes.put("seller-1", 5, "frame-5")  # Over max_agents: the oldest mailbox goes
+        self.assertEqual(boxes.pending("buyer-1"), 0)
+
+        boxes.ttl = 0
+        self.assertEqual(boxes.drain("seller-1"), [])
+        stats = boxes.stats()
+        self.assertEqual((stats["delivered"], stats["dropped"], stats["expired"]), (2, 2, 1))
+        print("✅ SUCCESS: Mailboxes stay bounded and expire old messages.")
+
+    def test_flush_on_identify(self):
+        print("\n📪 Testing store-and-forward for an offline agent...")
+
+        async def scenario():
+            manager = ConnectionManager()
+            await manager.send_to_agent("buyer-1", concluded("neg-1"))
+            ws = FakeWebSocket()
+            await manager.connect(ws)
+            manager.identify("buyer-1", ws)
+            # A resume right after identify must not deliver the same message twice
+            reply = manager.resume(ws, "buyer-1", manager.events.epoch, 0)
+            await asyncio.sleep(0.01)
+            return reply, ws.frames, manager.mailboxes.stats()
+
+        reply, frames, stats = asyncio.run(scenario())
+        self.assertEqual([f["negotiation_id"] for f in frames], ["neg-1"])
+        self.assertEqual(reply["replayed"], 0)
+        self.assertEqual((stats["stored"], stats["delivered"], stats["pending"]), (1, 1, 0))
+        print("✅ SUCCESS: Held messages were delivered once on identify.")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 from fastapi.testclient import TestClient
 import sys
 import os
@@ -21,33 +21,26 @@ class TestMaxSteps(unittest.TestCase):
         self.client = TestClient(app)
         self.mock_db = MagicMock()
         app.state.db = self.mock_db
+        self.mock_repo = AsyncMock()
+        app.state.repo = self.mock_repo
         app.state.publisher = MagicMock()
 
     def test_max_steps_limit(self):
         print("\n🛑 Testing MAX_NEGOTIATION_STEPS Enforcement...")
         
         # Scenario: Negotiation has 20 steps already
-        # We mock the count query response
+        # The negotiation state table is cold, so the server rebuilds it from
+        # the stored history:
+        # await get_repo().negotiation_history(negotiation_id)
         
-        # Logic in api_server:
-        # count_query = get_db().collection("negotiations").where(...).count()
-        # aggregates = count_query.get()
-        # current_steps = aggregates[0][0].value
+        def create_step(i):
+            sender, receiver = ("buyer-1", "seller-1") if i % 2 else ("seller-1", "buyer-1")
+            return {
+                "negotiation_id": "neg-infinity", "sender_id": sender, "receiver_id": receiver,
+                "action": "COUNTER", "price": 100.0 - i, "timestamp": 1000.0 + i
+            }
         
-        # Mocking the chain
-        col_mock = self.mock_db.collection.return_value
-        # The chain is .where().count().get()
-        # The result of get() is a list of AggregationResult (mocked as list of list of obj with .value)
-        
-        mock_agg_result = MagicMock()
-        mock_agg_result.value = 20 # Hit the limit
-        
-        # We need to structure the return of get() to match `aggregates[0][0].value`
-        # So get() returns [[mock_agg_result]]
-        
-        query_mock = col_mock.where.return_value
-        count_query_mock = query_mock.count.return_value
-        count_query_mock.get.return_value = [[mock_agg_result]]
+        self.mock_repo.negotiation_history.return_value = [create_step(i) for i in range(20)] # Hit the limit
         
         # Payload: Trying to COUNTER (not ACCEPT/REJECT)
         payload = {
@@ -0,0 +1,47 @@
+import sys
+import os
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.negotiations import NegotiationStateTable
+
+class TestNegotiationState(unittest.TestCase):
+    def test_rebuild_and_record(self):
+        print("\n🧮 Testing negotiation state rebuild and updates...")
+        table = NegotiationStateTable(max_entries=10)
+        history = [
+            {"negotiation_id": "neg-1", "sender_id": "seller-1", "receiver_id": "buyer-1", "action": "COUNTER", "price": 140.0, "timestamp": 2},
+            {"negotiation_id": "neg-1", "sender_id": "buyer-1", "receiver_id": "seller-1", "action": "COUNTER", "price": 100.0, "timestamp": 1},
+            {"negotiation_id": "neg-1", "sender_id": "buyer-1", "receiver_id": "seller-1", "action": "COUNTER", "price": 110.0, "timestamp": 3},
+        ]
+        state = table.load("neg-1", history)
+        self.assertEqual(state.steps, 3)
+        self.assertEqual(state.last_proposals, {"seller-1": 140.0, "buyer-1": 110.0})
+        self.assertEqual(state.participants, ["buyer-1", "seller-1"])
+
+        # A second rebuild must not clobber the live state
+        table.record({"negotiation_id": "neg-1", "sender_id": "seller-1", "receiver_id": "buyer-1", "action": "ACCEPT", "price": 110.0, "timestamp": 4})
+        self.assertIs(table.load("neg-1", []), state)
+        self.assertEqual(state.steps, 4)
+        self.assertEqual(state.status, "COMPLETED")
+
+        # Steps for unknown negotiations are left to the next rebuild
+        self.assertIsNone(table.record({"negotiation_id": "neg-2", "sender_id": "x", "action": "COUNTER", "price": 1.0}))
+        print("✅ SUCCESS: State rebuilt from history and kept current.")
+
+    def test_lru_bound(self):
+        print("\n🧮 Testing negotiation state eviction...")
+        table = NegotiationStateTable(max_entries=2)
+        table.load("neg-1", [])
+        table.load("neg-2", [])
+        table.get("neg-1")
+        table.load("neg-3", [])
+        self.assertIsNone(table.get("neg-2"))
+        self.assertIsNotNone(table.get("neg-1"))
+        self.assertEqual(len(table), 2)
+        print("✅ SUCCESS: Least recently used state evicted.")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import sys
+import os
+import time
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.orderbook import OrderBook
+
+class TestOrderBook(unittest.TestCase):
+    def setUp(self):
+        self.book = OrderBook(default_category="general")
+        self.now = time.time()
+
+    def offer(self, offer_id, price, created_at, category="cloud", product="GPU Cluster Time", ttl=3600):
+        return {"type": "Offer", "offer_id": offer_id, "product": product, "price": price,
+                "category": category, "created_at": created_at, "valid_until": self.now + ttl}
+
+    def request(self, budget, timestamp, category="cloud", item="GPU Cluster Time", ttl=300):
+        return {"type": "Request", "item": item, "max_budget": budget, "category": category,
+                "timestamp": timestamp, "valid_until": self.now + ttl}
+
+    def test_price_time_priority(self):
+        print("\n📚 Testing price-time priority...")
+        self.book.upsert("off-b", self.offer("off-b", 120.0, self.now + 2))
+        self.book.upsert("off-a", self.offer("off-a", 120.0, self.now + 1))
+        self.book.upsert("off-c", self.offer("off-c", 99.0, self.now + 3))
+        self.book.upsert("req-1", self.request(130.0, self.now))
+        self.book.upsert("req-2", self.request(150.0, self.now + 1))
+
+        items = self.book.active(category="cloud", product="GPU Cluster Time")
+        asks = [i["offer_id"] for i in items if i["type"] == "Offer"]
+        bids = [i["max_budget"] for i in items if i["type"] == "Request"]
+        self.assertEqual(asks, ["off-c", "off-a", "off-b"])
+        self.assertEqual(bids, [150.0, 130.0])
+
+        top = self.book.top("cloud", "GPU Cluster Time")
+        self.assertEqual(top["best_ask"]["offer_id"], "off-c")
+        self.assertEqual(top["best_bid"]["max_budget"], 150.0)
+        print("✅ SUCCESS: Asks ascend by price, bids descend by budget, ties by arrival.")
+
+    def test_filters_and_expiry(self):
+        print("\n📚 Testing slice filters and expiry...")
+        self.book.upsert("off-1", self.offer("off-1", 100.0, self.now, category="cloud"))
+        self.book.upsert("off-2", self.offer("off-2", 300.0, self.now, category="furniture", product="Desk"))
+        self.book.upsert("off-3", self.offer("off-3", 50.0, self.now, ttl=-1))  # Already expired
+        self.book.upsert("off-4", self.offer("off-4", 80.0, self.now, ttl=0.05))
+
+        self.assertEqual(len(self.book.active(category="furniture")), 1)
+        self.assertEqual(len(self.book.active(product="GPU Cluster Time")), 2)
+        time.sleep(0.1)
+        self.assertEqual([i["offer_id"] for i in self.book.active()], ["off-1", "off-2"])
+
+        self.book.remove("off-1")
+        self.assertEqual(self.book.active(category="cloud"), [])
+        print("✅ SUCCESS: Filters select the slice and expired items drop out.")
+
+    def test_upsert_replaces(self):
+        print("\n📚 Testing re-pricing an existing item...")
+        self.book.upsert("off-1", self.offer("off-1", 100.0, self.now))
+        self.book.upsert("off-2", self.offer("off-2", 110.0, self.now))
+        self.book.upsert("off-1", self.offer("off-1", 120.0, self.now))
+        self.assertEqual([i["offer_id"] for i in self.book.active()], ["off-2", "off-1"])
+        self.assertEqual(len(self.book), 2)
+        print("✅ SUCCESS: Re-priced item moved to its new level.")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import sys
+import os
+import unittest
+
+# Add parent directory to path to import agents.lib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.lib.policy import DecisionPolicy, buyer_thresholds, seller_floor
+
+class TestPolicy(unittest.TestCase):
+    def test_buyer_fast_path(self):
+        print("\n⚡ Testing buyer fast-path policy...")
+        policy = DecisionPolicy([buyer_thresholds(accept_below=120.0, budget_cap=150.0, far_over_factor=1.25)])
+        self.assertEqual(policy.decide(price=110.0)["action"], "ACCEPT")
+        counter = policy.decide(price=400.0)
+        self.assertEqual((counter["action"], counter["price"]), ("COUNTER", 120.0))
+        self.assertIsNone(policy.decide(price=135.0))  # Ambiguous: ask the LLM
+        self.assertIsNone(policy.decide(price=None))
+        stats = policy.stats()
+        self.assertEqual((stats["avoided"], stats["deferred"]), (2, 2))
+        print("✅ SUCCESS: Bargains and out-of-range prices skipped the LLM.")
+
+    def test_seller_fast_path(self):
+        print("\n⚡ Testing seller fast-path policy...")
+        policy = DecisionPolicy([seller_floor(far_under_factor=0.6)])
+        self.assertEqual(policy.decide(price=105.0, floor=100.0, is_initial=False)["action"], "ACCEPT")
+        lowball = policy.decide(price=40.0, floor=100.0, is_initial=False)
+        self.assertEqual((lowball["action"], lowball["price"]), ("COUNTER", 110.0))
+        self.assertIsNone(policy.decide(price=90.0, floor=100.0, is_initial=False))
+        self.assertIsNone(policy.decide(price=None, floor=100.0, is_initial=True))  # Opening anchors stay with the LLM
+        self.assertEqual(policy.stats()["avoided_ratio"], 0.5)
+        print("✅ SUCCESS: Counters above the floor were settled locally.")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import sys
+import os
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.presence import PresenceTracker
+
+class TestPresence(unittest.TestCase):
+    def test_transitions_only(self):
+        print("\n🟢 Testing WebSocket-driven presence...")
+        presence = PresenceTracker(ttl=60)
+        agent = {"id": "buyer-1", "name": "Apex"}
+
+        came_online = presence.connected(agent)
+        self.assertEqual((came_online["status"], came_online["online"]), ("ACTIVE", True))
+        self.assertIsNotNone(presence.update(agent, "IDLE", "Ready"))
+        # Repeats (old-style keep-alives) are not broadcast again
+        self.assertIsNone(presence.update(agent, "IDLE", "Ready"))
+
+        # A quick reconnect is invisible to viewers
+        presence.disconnected("buyer-1")
+        self.assertEqual(presence.sweep(), [])
+        self.assertIsNone(presence.connected(agent))
+
+        # Gone for longer than the TTL: announced offline exactly once
+        presence.disconnected("buyer-1")
+        presence.ttl = 0
+        [offline] = presence.sweep()
+        self.assertEqual((offline["status"], offline["online"]), ("OFFLINE", False))
+        self.assertEqual(presence.sweep(), [])
+        self.assertEqual(presence.snapshot()[0]["status"], "OFFLINE")
+        self.assertEqual(presence.stats()["transitions"], 3)
+        print("✅ SUCCESS: Only real status changes reach the viewers.")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+import sys
+import os
+import uuid
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock modules
+sys.modules["google.cloud"] = MagicMock()
+sys.modules["google.cloud.firestore"] = MagicMock()
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub import repository
+from hub.repository import MarketRepository, sum_reputation_shards, with_reputation
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+class FakeFirestoreModule:
+    """Just the parts of `google.cloud.firestore` the reputation path touches."""
+    Increment = Increment
+    Query = MagicMock()
+
+    @staticmethod
+    def async_transactional(fn):
+        return fn
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data.get(field)
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path[-1]
+
+    async def get(self, transaction=None):
+        return FakeSnapshot(self, self.db.docs.get(self.path))
+
+    async def set(self, data, merge=False):
+        self.db.write(self.path, data, merge)
+
+    def collection(self, name):
+        return FakeQuery(self.db, self.path + (name,))
+
+class FakeQuery:
+    """A collection (or collection group) with equality filters."""
+
+    def __init__(self, db, path, group=False, filters=()):
+        self.db = db
+        self.path = path
+        self.group = group
+        self.filters = filters
+
+    def document(self, doc_id=None):
+        return FakeDocument(self.db, self.path + (doc_id or uuid.uuid4().hex,))
+
+    def where(self, field, op, value):
+        return FakeQuery(self.db, self.path, self.group, self.filters + ((field, value),))
+
+    async def stream(self, transaction=None):
+        for path, data in list(self.db.docs.items()):
+            parent = path[-2:-1] if self.group else path[:-1]
+            if parent == self.path and all(data.get(f) == v for f, v in self.filters):
+                yield FakeSnapshot(FakeDocument(self.db, path), data)
+
+class FakeTransaction:
+    def __init__(self, db):
+        self.db = db
+        self.writes = 0
+
+    def set(self, ref, data, merge=False):
+        self.writes += 1
+        self.db.write(ref.path, data, merge)
+
+    def update(self, ref, data):
+        self.writes += 1
+        self.db.write(ref.path, data, merge=True)
+
+    def delete(self, ref):
+        self.writes += 1
+        self.db.docs.pop(ref.path, None)
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}
+        self.transactions = []
+
+    def collection(self, name):
+        return FakeQuery(self, (name,))
+
+    def collection_group(self, name):
+        return FakeQuery(self, (name,), group=True)
+
+    def transaction(self, **kwargs):
+        self.transactions.append(FakeTransaction(self))
+        return self.transactions[-1]
+
+    def write(self, path, data, merge):
+        doc = dict(self.docs.get(path) or {}) if merge else {}
+        for field, value in data.items():
+            doc[field] = doc.get(field, 0) + value.value if isinstance(value, Increment) else value
+        self.docs[path] = doc
+
+class TestReputationShards(unittest.TestCase):
+    def test_shard_read_path(self):
+        print("\n🧮 Testing sharded reputation read path...")
+        shards = [
+            {"agent_id": "seller-1", "reputation_delta": 1.0, "transactions": 1},
+            {"agent_id": "seller-1", "reputation_delta": 2.0, "transactions": 2},
+            {"agent_id": "buyer-1", "reputation_delta": 1.0, "transactions": 1},
+        ]
+        totals = sum_reputation_shards(shards)
+        self.assertEqual(totals["seller-1"], {"reputation": 3.0, "transactions": 3})
+
+        seller = with_reputation({"id": "seller-1", "global_reputation": 50.0, "total_transactions": 4}, totals.get("seller-1"))
+        self.assertEqual((seller["global_reputation"], seller["total_transactions"]), (53.0, 7))
+
+        # Agents without pending shards are returned as stored (already compacted)
+        idle = with_reputation({"id": "idle-1", "global_reputation": 61.0, "total_transactions": 9}, totals.get("idle-1"))
+        self.assertEqual((idle["global_reputation"], idle["total_transactions"]), (61.0, 9))
+        print("✅ SUCCESS: Compacted base plus shard deltas gives the live reputation.")
+
+class TestShardedReputationRepository(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(repository, "firestore", FakeFirestoreModule)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = FakeFirestore()
+        self.db.docs[("agents", "seller-1")] = {"id": "seller-1", "global_reputation": 50.0, "total_transactions": 4}
+        self.repo = MarketRepository(self.db, coalescer=MagicMock())
+
+    def shards(self):
+        return {path: doc for path, doc in self.db.docs.items() if path[-2] == "reputation_shards"}
+
+    def test_apply_is_idempotent_and_lands_on_a_shard(self):
+        print("\n🧮 Testing a sharded reputation increment...")
+        self.assertTrue(asyncio.run(self.repo.apply_reputation("seller-1", 1.0, transaction_id="tx-1")))
+        self.assertFalse(asyncio.run(self.repo.apply_reputation("seller-1", 1.0, transaction_id="tx-1")))
+
+        shards = list(self.shards().values())
+        self.assertEqual(shards, [{"agent_id": "seller-1", "reputation_delta": 1.0, "transactions": 1}])
+        record = self.db.docs[("reputation_history", "seller-1_tx-1")]
+        self.assertEqual((record["change"], record["compacted"]), (1.0, False))
+        self.assertNotIn("reputation", record)  # Stamped at compaction, not read on the hot path
+        self.assertEqual(self.db.docs[("agents", "seller-1")]["global_reputation"], 50.0)
+        print("✅ SUCCESS: One shard increment per transaction, the agent doc untouched.")
+
+    def test_compaction_folds_and_deletes_shards(self):
+        print("\n🧮 Testing reputation compaction...")
+        with patch.object(repository.time, "time", side_effect=[1000.0, 1001.0]):
+            asyncio.run(self.repo.apply_reputation("seller-1", 1.0, transaction_id="tx-1"))
+            asyncio.run(self.repo.apply_reputation("seller-1", 2.0, transaction_id="tx-2"))
+
+        live = asyncio.run(self.repo.list_agents())[0]
+        self.assertEqual((live["global_reputation"], live["total_transactions"]), (53.0, 6))
+        history = asyncio.run(self.repo.reputation_history("seller-1"))
+        self.assertEqual([h["reputation"] for h in history], [51.0, 53.0])
+
+        self.assertEqual(asyncio.run(self.repo.compact_reputation()), 1)
+        self.assertEqual(self.shards(), {})
+        agent = self.db.docs[("agents", "seller-1")]
+        self.assertEqual((agent["global_reputation"], agent["total_transactions"]), (53.0, 6))
+        stored = sorted((h for p, h in self.db.docs.items() if p[0] == "reputation_history"), key=lambda h: h["timestamp"])
+        self.assertEqual([(h["reputation"], h["compacted"]) for h in stored], [(51.0, True), (53.0, True)])
+        self.assertEqual(asyncio.run(self.repo.list_agents())[0]["global_reputation"], 53.0)
+        print("✅ SUCCESS: Shards were folded into the agent and their history stamped.")
+
+    def test_compaction_chunks_busy_agents(self):
+        print("\n🧮 Testing chunked compaction for an agent with many deals...")
+        changes = [1.0, 2.0, -1.0, 3.0, 0.5]
+        with patch.object(repository.time, "time", side_effect=[1000.0 + i for i in range(len(changes))]):
+            for i, change in enumerate(changes):
+                asyncio.run(self.repo.apply_reputation("seller-1", change, transaction_id=f"tx-{i}"))
+
+        self.db.transactions.clear()
+        with patch.object(repository, "REPUTATION_COMPACT_CHUNK", 2):
+            self.assertEqual(asyncio.run(self.repo.compact_reputation()), 1)
+
+        # Three chunks of at most two records, each well under the per-transaction write cap
+        self.assertEqual(len(self.db.transactions), 3)
+        self.assertTrue(all(t.writes <= 2 + 1 + repository.REPUTATION_SHARDS for t in self.db.transactions))
+        self.assertEqual(self.shards(), {})
+        agent = self.db.docs[("agents", "seller-1")]
+        self.assertEqual((agent["global_reputation"], agent["total_transactions"]), (55.5, 9))
+        stored = sorted((h for p, h in self.db.docs.items() if p[0] == "reputation_history"), key=lambda h: h["timestamp"])
+        self.assertEqual([h["reputation"] for h in stored], [51.0, 53.0, 52.0, 55.0, 55.5])
+        self.assertTrue(all(h["compacted"] for h in stored))
+        print("✅ SUCCESS: History was stamped in order across transactions and the shards cleared.")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import sys
+import os
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path to import agents.lib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.lib.scheduler import KeyedScheduler
+
+class TestKeyedScheduler(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.scheduler = KeyedScheduler(self.executor)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+
+    def wait_idle(self, timeout=2.0):
+        deadline = time.time() + timeout
+        while self.scheduler.stats()["active_keys"] and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_latest_wins_per_key(self):
+        print("\n🗂️ Testing latest-wins scheduling for one negotiation...")
+        release = threading.Event()
+        ran = []
+
+        def evaluate(price):
+            if price == 100:
+                release.wait(2)
+            ran.append(price)
+
+        self.scheduler.submit("neg-1", evaluate, 100)
+        time.sleep(0.05)  # First proposal is now running
+        self.assertFalse(self.scheduler.submit("neg-1", evaluate, 110))
+        self.assertTrue(self.scheduler.submit("neg-1", evaluate, 120))  # Replaces the queued 110
+        release.set()
+        self.wait_idle()
+        self.assertEqual(ran, [100, 120])
+        stats = self.scheduler.stats()
+        self.assertEqual((stats["executed"], stats["superseded"], stats["active_keys"]), (2, 1, 0))
+        print("✅ SUCCESS: The stale counter was skipped and order was kept.")
+
+    def test_keys_serial_and_parallel(self):
+        print("\n🗂️ Testing serial execution per key, parallel across keys...")
+        lock = threading.Lock()
+        active = {}
+        overlap = []
+        peak = [0]
+
+        def evaluate(key):
+            with lock:
+                active[key] = active.get(key, 0) + 1
+                if active[key] > 1:
+                    overlap.append(key)
+                peak[0] = max(peak[0], sum(active.values()))
+            time.sleep(0.05)
+            with lock:
+                active[key] -= 1
+
+        for _ in range(3):
+            for key in ("neg-a", "neg-b", "neg-c"):
+                self.scheduler.submit(key, evaluate, key)
+        self.wait_idle()
+        self.assertEqual(overlap, [])
+        self.assertGreater(peak[0], 1)
+        print("✅ SUCCESS: No negotiation ran twice at once, different ones overlapped.")
+
+    def test_failure_does_not_stall_key(self):
+        print("\n🗂️ Testing that a failing job frees its key...")
+        ran = []
+
+        def boom():
+            raise RuntimeError("model error")
+
+        self.scheduler.submit("neg-x", boom)
+        self.wait_idle()
+        self.scheduler.submit("neg-x", ran.append, "next")
+        self.wait_idle()
+        self.assertEqual(ran, ["next"])
+        self.assertEqual(self.scheduler.stats()["failed"], 1)
+        print("✅ SUCCESS: The key accepted new work after a failure.")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import sys
+import os
+import json
+import time
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+# Mock modules
+sys.modules["vertexai"] = MagicMock()
+sys.modules["vertexai.generative_models"] = MagicMock()
+
+os.environ["AGENT_MKT_PROJECT_ID"] = "test-project"
+os.environ["AGENT_MKT_API_URL"] = "http://localhost:8000"
+os.environ["AGENT_MKT_REGISTRATION_TOKEN"] = "test-token"
+os.environ["AGENT_MKT_MODEL"] = "test-model"
+
+# Add agents directory to path to import the seller (it imports lib.* itself)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agents"))
+
+import cloud_seller
+
+OPENING = json.dumps({"action": "COUNTER", "price": 150.0, "reasoning": "Premium capacity.", "internal_thought": "Anchor high."})
+
+class TestSellerRequests(unittest.TestCase):
+    def setUp(self):
+        cloud_seller.MarketClient = MagicMock()
+        self.seller = cloud_seller.InternalSeller()
+        self.release = threading.Event()
+
+        def generate(prompt, validate=None):
+            self.release.wait(2)  # Hold opening offers while more requests arrive
+            return OPENING
+
+        cloud_seller.llm = MagicMock()
+        cloud_seller.llm.generate.side_effect = generate
+
+    def tearDown(self):
+        self.seller.executor.shutdown(wait=True)
+
+    def request(self, item_id, buyer_id):
+        request = {"type": "Request", "sender_id": buyer_id, "buyer_id": buyer_id,
+                   "item": "compute", "max_budget": 90.0, "quantity": 1, "timestamp": time.time()}
+        if item_id:
+            request["id"] = item_id
+        return request
+
+    def test_every_request_gets_an_offer(self):
+        print("\n📨 Testing that concurrent buyer requests each get an opening offer...")
+        self.seller.process_request(self.request("itemAAAAAAAA", "buyer-1"))
+        self.seller.process_request(self.request("itemBBBBBBBB", "buyer-2"))
+        # Payloads published before requests carried their doc id
+        self.seller.process_request(self.request(None, "buyer-3"))
+        self.seller.process_request(self.request(None, "buyer-4"))
+        self.seller.process_request(self.request(None, "buyer-5"))
+        self.release.set()
+        deadline = time.time() + 2
+        while self.seller.scheduler.stats()["active_keys"] and time.time() < deadline:
+            time.sleep(0.01)
+
+        buyers = sorted(call.args[0] for call in self.seller.client.post_offer.call_args_list)
+        self.assertEqual(buyers, ["buyer-1", "buyer-2", "buyer-3", "buyer-4", "buyer-5"])
+        self.assertEqual(self.seller.scheduler.stats()["superseded"], 0)
+        print("✅ SUCCESS: No request was dropped as superseded.")
+
+    def test_negotiation_id_fallback(self):
+        print("\n📨 Testing negotiation ids for requests without a doc id...")
+        first = {"buyer_id": "buyer-1", "item": "compute", "timestamp": 1.0}
+        second = {**first, "timestamp": 2.0}
+        self.assertNotEqual(cloud_seller.InternalSeller._negotiation_id(first),
+                            cloud_seller.InternalSeller._negotiation_id(second))
+        self.assertEqual(cloud_seller.InternalSeller._negotiation_id({"id": "abcdefgh12345678"}), "neg-12345678")
+        print("✅ SUCCESS: Distinct requests map to distinct negotiations.")
+
+if __name__ == "__main__":
+    unittest.main()
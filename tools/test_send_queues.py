@@ -0,0 +1,110 @@
+import sys
+import os
+import json
+import asyncio
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.connections import ClientChannel, ConnectionManager
+
+class FakeClient:
+    host = "127.0.0.1"
+    port = 0
+
+class FakeWebSocket:
+    client = FakeClient()
+
+    def __init__(self, stalled=False):
+        self.frames = []
+        self.closed_with = None
+        self.gate = asyncio.Event()
+        if not stalled:
+            self.gate.set()
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+    async def send_text(self, data):
+        await self.gate.wait()
+        self.frames.append(json.loads(data))
+
+def status(agent_id, value):
+    return {"type": "agent_status", "agent_id": agent_id, "status": value}
+
+class TestSendQueues(unittest.TestCase):
+    def test_slow_consumer_isolated(self):
+        print("\n🐢 Testing that a stalled socket does not delay others...")
+
+        async def scenario():
+            manager = ConnectionManager()
+            fast, slow = FakeWebSocket(), FakeWebSocket(stalled=True)
+            for ws in (fast, slow):
+                await manager.connect(ws)
+                manager.identify_viewer(ws)
+            for i in range(5):
+                await manager.broadcast(status("a", i))
+            await asyncio.sleep(0.01)
+            self.assertEqual(len(fast.frames), 5)
+            self.assertEqual(len(slow.frames), 0)
+            for ws in (fast, slow):
+                manager.disconnect(ws)
+
+        asyncio.run(scenario())
+        print("✅ SUCCESS: Fast consumer received every event while the slow one was stuck.")
+
+    def test_overflow_policies(self):
+        print("\n🐢 Testing overflow policies...")
+
+        async def scenario():
+            evicted = []
+
+            ws = FakeWebSocket(stalled=True)
+            channel = ClientChannel(ws, on_evict=evicted.append, max_queue=2, policy="drop_oldest")
+            await asyncio.sleep(0)
+            channel.offer(json.dumps(status("a", 0)))
+            await asyncio.sleep(0)  # Writer picks up frame 0 and blocks on the socket
+            for i in range(1, 4):
+                channel.offer(json.dumps(status("a", i)))
+            # One frame is stuck in flight, two are queued, the rest were dropped oldest-first
+            self.assertEqual(channel.depth, 2)
+            self.assertEqual(channel.dropped, 1)
+            ws.gate.set()
+            await asyncio.sleep(0.01)
+            self.assertEqual([f["status"] for f in ws.frames], [0, 2, 3])
+            channel.close()
+
+            ws = FakeWebSocket(stalled=True)
+            channel = ClientChannel(ws, on_evict=evicted.append, max_queue=2, policy="conflate")
+            await asyncio.sleep(0)
+            channel.offer(json.dumps(status("x", 0)), key="status:x")
+            await asyncio.sleep(0)
+            for i in range(1, 4):
+                channel.offer(json.dumps(status("a", i)), key="status:a")
+            channel.offer(json.dumps(status("b", 9)), key="status:b")
+            self.assertEqual(channel.conflated, 2)
+            ws.gate.set()
+            await asyncio.sleep(0.01)
+            self.assertEqual([(f["agent_id"], f["status"]) for f in ws.frames], [("x", 0), ("a", 3), ("b", 9)])
+            channel.close()
+
+            ws = FakeWebSocket(stalled=True)
+            channel = ClientChannel(ws, on_evict=evicted.append, max_queue=1, policy="disconnect")
+            await asyncio.sleep(0)
+            for i in range(3):
+                channel.offer(json.dumps(status("a", i)))
+            await asyncio.sleep(0.01)
+            self.assertTrue(channel.closed)
+            self.assertEqual(evicted, [ws])  # Evicted once, though two offers overflowed
+            self.assertEqual(ws.closed_with, 1013)
+            self.assertTrue(channel._evictor.done())
+
+        asyncio.run(scenario())
+        print("✅ SUCCESS: drop_oldest, conflate and disconnect behave as configured.")
+
+if __name__ == "__main__":
+    unittest.main()
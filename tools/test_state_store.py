@@ -0,0 +1,52 @@
+import sys
+import os
+import time
+import unittest
+
+# Add parent directory to path to import agents.lib
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.lib.state_store import BoundedStateStore, TerminalSet
+
+class TestStateStore(unittest.TestCase):
+    def test_lru_and_ttl(self):
+        print("\n🧹 Testing bounded negotiation state...")
+        store = BoundedStateStore(max_entries=2, ttl=60)
+        store["neg-1"] = "cloud"
+        store["neg-2"] = "gpu"
+        self.assertEqual(store.get("neg-1"), "cloud")  # Touch: neg-2 is now least recent
+        store["neg-3"] = "storage"
+        self.assertNotIn("neg-2", store)
+        self.assertEqual((len(store), store.stats()["evicted"]), (2, 1))
+        self.assertEqual(store.pop("neg-1"), "cloud")
+        self.assertIsNone(store.pop("neg-1"))
+
+        store.ttl = 0
+        self.assertIsNone(store.get("neg-3"))
+        stats = store.stats()
+        self.assertEqual((stats["entries"], stats["expired"]), (0, 1))
+        print("✅ SUCCESS: State is bounded by size and idle time.")
+
+    def test_terminal_buckets_rotate(self):
+        print("\n🧹 Testing time-bucketed terminal ids...")
+        done = TerminalSet(ttl=0.2, buckets=2, max_entries=100)
+        done.add("neg-old")
+        self.assertIn("neg-old", done)
+        time.sleep(0.12)
+        done.add("neg-new")
+        self.assertEqual(done.stats()["buckets"], 2)
+        time.sleep(0.2)
+        self.assertNotIn("neg-old", done)
+        self.assertIn("neg-new", done)
+
+        capped = TerminalSet(ttl=60, buckets=60, max_entries=1)
+        capped._buckets.append((time.time() - 5, {"neg-a", "neg-b"}))
+        capped._size = 2
+        capped.add("neg-c")
+        self.assertNotIn("neg-a", capped)
+        self.assertIn("neg-c", capped)
+        self.assertEqual(len(capped), 1)
+        print("✅ SUCCESS: Old terminal ids age out a bucket at a time.")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import sys
+import os
+import json
+import asyncio
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.connections import ConnectionManager, subscription_topics
+
+class FakeClient:
+    host = "127.0.0.1"
+    port = 0
+
+class FakeWebSocket:
+    client = FakeClient()
+
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+def market_event(**data):
+    return {"type": "market_event", "data": data}
+
+class TestSubscriptions(unittest.TestCase):
+    def test_topic_routing(self):
+        print("\n📮 Testing topic-based routing...")
+
+        async def scenario():
+            manager = ConnectionManager()
+            cloud, furniture, dashboard = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+            for ws in (cloud, furniture, dashboard):
+                await manager.connect(ws)
+            manager.subscribe(cloud, subscription_topics({"categories": ["cloud"], "agents": ["buyer-1"]}))
+            manager.subscribe(furniture, subscription_topics({"categories": "furniture"}))
+
+            await manager.broadcast(market_event(type="Request", category="cloud", item="GPU Cluster Time"))
+            await manager.broadcast(market_event(type="Request", category="furniture", item="Desk"))
+            # Targeted offer outside the cloud category still reaches buyer-1 through the agent topic
+            await manager.broadcast(market_event(type="Offer", category="general", offer_id="off-1", receiver_id="buyer-1"))
+            await manager.broadcast({"type": "agent_status", "agent_id": "seller-9", "status": "IDLE"})
+            await asyncio.sleep(0.01)
+
+            self.assertEqual([f["data"].get("item") or f["data"].get("offer_id") for f in cloud.frames], ["GPU Cluster Time", "off-1"])
+            self.assertEqual([f["data"]["item"] for f in furniture.frames], ["Desk"])
+            self.assertEqual(len(dashboard.frames), 4)  # Unsubscribed connections get everything
+
+            # Dropping every topic returns a connection to the unfiltered feed
+            manager.unsubscribe(furniture)
+            await manager.broadcast({"type": "agent_status", "agent_id": "seller-9", "status": "BUSY"})
+            await asyncio.sleep(0.01)
+            self.assertEqual(furniture.frames[-1]["type"], "agent_status")
+
+            manager.disconnect(cloud)
+            self.assertNotIn(("category", "cloud"), manager.topic_index)
+            for ws in (furniture, dashboard):
+                manager.disconnect(ws)
+
+        asyncio.run(scenario())
+        print("✅ SUCCESS: Events reached only matching subscribers.")
+
+if __name__ == "__main__":
+    unittest.main()
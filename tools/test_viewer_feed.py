@@ -0,0 +1,116 @@
+import sys
+import os
+import json
+import asyncio
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.connections import ConnectionManager, encode_frame
+from hub.viewers import ViewerFeed, viewer_key
+
+class FakeClient:
+    host = "127.0.0.1"
+    port = 0
+
+class FakeWebSocket:
+    client = FakeClient()
+
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+def status(agent_id, value):
+    return {"type": "agent_status", "agent_id": agent_id, "status": value}
+
+class TestViewerFeed(unittest.TestCase):
+    def test_conflation_and_bounds(self):
+        print("\n🖥️ Testing viewer conflation...")
+        feed = ViewerFeed(encode=encode_frame, hz=10, max_pending=3)
+        for i in range(100):
+            feed.add(status("a", i))
+        feed.add({"type": "feedback_report", "negotiation_id": "neg-1"})
+        batch = json.loads(feed.take())
+        self.assertEqual([e.get("status") for e in batch["events"]], [99, None])
+        self.assertIsNone(feed.take())
+
+        for i in range(5):
+            feed.add({"type": "feedback_report", "negotiation_id": f"neg-{i}"})
+        self.assertEqual(len(json.loads(feed.take())["events"]), 3)
+        stats = feed.stats()
+        self.assertEqual((stats["conflated"], stats["dropped"], stats["batches"]), (99, 2, 2))
+        print("✅ SUCCESS: Latest status per agent, bounded one-off events.")
+
+    def test_order_rows_keyed_by_id(self):
+        print("\n🖥️ Testing order book keys...")
+        request = {"type": "market_event", "data": {"type": "Request", "id": "item-1", "item": "compute"}}
+        offer = {"type": "market_event", "data": {"type": "Offer", "offer_id": "off-1"}}
+        self.assertEqual(viewer_key(request), "request:item-1")
+        self.assertEqual(viewer_key(offer), "offer:off-1")
+        print("✅ SUCCESS: Requests and offers conflate per order row.")
+
+    def test_batched_viewer_tier(self):
+        print("\n🖥️ Testing batched viewers against live agents...")
+
+        async def scenario():
+            manager = ConnectionManager()
+            manager.viewer_feed.interval = 0.02
+            dashboard, legacy, agent = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+            for ws in (dashboard, legacy, agent):
+                await manager.connect(ws)
+            manager.identify_viewer(dashboard, batched=True)
+            manager.identify_viewer(legacy)
+            manager.identify("buyer-1", agent)
+            for i in range(50):
+                await manager.broadcast(status("buyer-1", i))
+            await asyncio.sleep(0.1)
+            return dashboard.frames, legacy.frames, agent.frames
+
+        dashboard, legacy, agent = asyncio.run(scenario())
+        self.assertEqual(len(dashboard), 1)
+        self.assertEqual(dashboard[0]["type"], "batch")
+        self.assertEqual([e["status"] for e in dashboard[0]["events"]], [49])
+        self.assertEqual(len(legacy), 50)  # Viewers that don't opt in keep the full stream
+        self.assertEqual(len(agent), 50)
+        print("✅ SUCCESS: The dashboard got one conflated batch instead of 50 frames.")
+
+    def test_feed_idles_without_batched_viewers(self):
+        print("\n🖥️ Testing the viewer feed after the last dashboard leaves...")
+
+        async def scenario():
+            manager = ConnectionManager()
+            manager.viewer_feed.interval = 60  # Nothing is flushed while the first dashboard is open
+            first, second = FakeWebSocket(), FakeWebSocket()
+            await manager.connect(first)
+            manager.identify_viewer(first, batched=True)
+            flusher = manager._viewer_flusher
+            for i in range(3):
+                await manager.broadcast(status("buyer-1", i))
+            manager.disconnect(first)
+            await asyncio.sleep(0)
+            state = (flusher.cancelled(), manager._viewer_flusher, manager.viewer_feed.stats()["pending"])
+
+            await manager.broadcast(status("buyer-1", 3))  # No batched viewers: not buffered
+            manager.viewer_feed.interval = 0.02
+            await manager.connect(second)
+            manager.identify_viewer(second, batched=True)
+            await asyncio.sleep(0.1)
+            manager.disconnect(second)
+            return state, second.frames
+
+        (cancelled, flusher, pending), frames = asyncio.run(scenario())
+        self.assertEqual((cancelled, flusher, pending), (True, None, 0))
+        self.assertEqual(frames, [])
+        print("✅ SUCCESS: The flusher stopped and the next dashboard got no stale batch.")
+
+if __name__ == "__main__":
+    unittest.main()
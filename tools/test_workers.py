@@ -0,0 +1,59 @@
+import sys
+import os
+import asyncio
+import threading
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.workers import KeyedWorkerPool
+
+class TestWorkers(unittest.TestCase):
+    def test_ordering_retries_and_threads(self):
+        print("\n🧵 Testing keyed worker pool...")
+
+        async def scenario():
+            pool = KeyedWorkerPool(workers=3, max_queue=2, max_retries=2, retry_base=0.001)
+            pool.start()
+            applied = []
+            attempts = {"flaky": 0}
+
+            def job(key, value):
+                async def run():
+                    await asyncio.sleep(0.001 * (3 - value))  # Later jobs would finish first if run concurrently
+                    applied.append((key, value))
+                return run
+
+            async def flaky():
+                attempts["flaky"] += 1
+                if attempts["flaky"] < 3:
+                    raise RuntimeError("contention")
+                applied.append(("seller-9", "flaky"))
+
+            async def broken():
+                raise RuntimeError("permanent")
+
+            # Listener threads enqueue; queues are tiny so the thread must wait for room
+            def listener():
+                for value in range(3):
+                    pool.submit_threadsafe("seller-1", job("seller-1", value), name="reputation")
+                pool.submit_threadsafe("seller-9", flaky, name="reputation")
+                pool.submit_threadsafe("buyer-1", broken, name="reputation")
+            thread = threading.Thread(target=listener)
+            thread.start()
+            await asyncio.to_thread(thread.join)
+            await pool.join()
+
+            self.assertEqual([v for k, v in applied if k == "seller-1"], [0, 1, 2])
+            self.assertIn(("seller-9", "flaky"), applied)
+            stats = pool.stats()
+            self.assertEqual((stats["enqueued"], stats["completed"], stats["failed"]), (5, 4, 1))
+            self.assertEqual(stats["retried"], 4)  # Two for the flaky job, two for the broken one
+            await pool.stop()
+
+        asyncio.run(scenario())
+        print("✅ SUCCESS: Jobs ran in per-key order with retries and backpressure.")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import sys
+import os
+import asyncio
+import unittest
+
+# Add parent directory to path to import hub
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub.write_coalescer import WriteCoalescer
+
+class FakeBatch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def set(self, ref, data):
+        self.writes.append((ref, data))
+
+    async def commit(self):
+        await asyncio.sleep(0)
+        if self.client.fail:
+            raise RuntimeError("deadline exceeded")
+        self.client.commits.append(self.writes)
+
+class FakeClient:
+    def __init__(self):
+        self.commits = []
+        self.fail = False
+
+    def batch(self):
+        return FakeBatch(self)
+
+class TestWriteCoalescer(unittest.TestCase):
+    def test_group_commit(self):
+        print("\n🧺 Testing group commit of concurrent writes...")
+
+        async def scenario():
+            client = FakeClient()
+            writes = WriteCoalescer(client, window_ms=5, max_batch=3)
+
+            # Four concurrent steps: the first three fill a batch, the fourth waits for the window
+            await asyncio.gather(*[writes.set(f"neg/{i}", {"step": i}) for i in range(4)])
+            self.assertEqual([[ref for ref, _ in batch] for batch in client.commits], [["neg/0", "neg/1", "neg/2"], ["neg/3"]])
+            self.assertEqual(writes.stats()["writes"], 4)
+
+            # A failed commit fails every write that shared it
+            client.fail = True
+            results = await asyncio.gather(writes.set("neg/4", {}), writes.set("neg/5", {}), return_exceptions=True)
+            self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+            self.assertEqual(writes.stats()["failures"], 1)
+
+            # Shutdown lands a full batch's flush and the writes still inside the window
+            client.fail = False
+            queued = [writes.set(f"neg/{i}", {"step": i}) for i in range(6, 10)]
+            self.assertEqual(len(writes._flushes), 1)
+            await writes.close()
+            self.assertTrue(all(f.done() and f.exception() is None for f in queued))
+            self.assertEqual(writes.stats()["pending"], 0)
+            self.assertEqual(writes._flushes, set())
+
+        asyncio.run(scenario())
+        print("✅ SUCCESS: Writes were coalesced into batches and failures propagated.")
+
+if __name__ == "__main__":
+    unittest.main()
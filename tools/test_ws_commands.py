@@ -0,0 +1,83 @@
+import sys
+import os
+import json
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+# Mock modules
+sys.modules["google.cloud"] = MagicMock()
+sys.modules["google.cloud.firestore"] = MagicMock()
+sys.modules["google.cloud.pubsub_v1"] = MagicMock()
+sys.modules["vertexai"] = MagicMock()
+sys.modules["vertexai.generative_models"] = MagicMock()
+
+os.environ["AGENT_MKT_PROJECT_ID"] = "test-project"
+os.environ["AGENT_MKT_TEST_MODE"] = "true"
+os.environ.setdefault("AGENT_MKT_MODEL", "test-model")
+os.environ.setdefault("AGENT_MKT_MAX_STEPS", "20")
+
+# Add parent directory to path to import api_server
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_server import app, manager, handle_ws_command
+
+class FakeClient:
+    host = "127.0.0.1"
+    port = 0
+
+class FakeWebSocket:
+    client = FakeClient()
+
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+class TestWebSocketCommands(unittest.TestCase):
+    def setUp(self):
+        app.state.repo = AsyncMock()
+        app.state.publisher = MagicMock()
+
+    def run_command(self, agent, msg):
+        async def scenario():
+            ws = FakeWebSocket()
+            await manager.connect(ws)
+            await handle_ws_command(ws, agent, msg)
+            await asyncio.sleep(0.05)  # Let the writer task flush
+            manager.disconnect(ws)
+            return [f for f in ws.frames if f.get("type") == "command_result"]
+        return asyncio.run(scenario())
+
+    def test_command_replies(self):
+        print("\n📨 Testing WebSocket command channel...")
+        agent = {"id": "buyer-1", "type": "buyer", "name": "Buyer", "category": "cloud"}
+
+        [reply] = self.run_command(None, {"type": "command", "id": "c1", "command": "update_status", "payload": {"status": "IDLE"}})
+        self.assertEqual((reply["id"], reply["ok"], reply["status"]), ("c1", False, 401))
+
+        [reply] = self.run_command(agent, {"type": "command", "id": "c2", "command": "teleport", "payload": {}})
+        self.assertEqual(reply["status"], 400)
+
+        [reply] = self.run_command(agent, {"type": "command", "id": "c3", "command": "update_status",
+                                           "payload": {"status": "IDLE", "activity": "Waiting"}})
+        self.assertEqual((reply["ok"], reply["result"]), (True, {"status": "updated"}))
+
+        # Same role checks as the REST route
+        [reply] = self.run_command(agent, {"type": "command", "id": "c4", "command": "post_offer",
+                                           "payload": {"buyer_id": "market", "product": "GPU", "price": 10.0}})
+        self.assertEqual((reply["ok"], reply["status"]), (False, 403))
+
+        [reply] = self.run_command(agent, {"type": "command", "id": "c5", "command": "negotiate", "payload": {"action": "COUNTER"}})
+        self.assertEqual(reply["status"], 422)
+        print("✅ SUCCESS: Commands share the REST handlers and answer with their correlation id.")
+
+if __name__ == "__main__":
+    unittest.main()